@@ -1,150 +1,702 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory
+from flask import Flask, Request, render_template, request, jsonify, session, redirect, url_for, send_from_directory, Response, abort, got_request_exception
 from flask_cors import CORS
 import os
 import json
-from werkzeug.utils import secure_filename
-from datetime import datetime
+import gzip
+import zlib
+import threading
+import time
+import stat
+import mimetypes
+import hashlib
+import re
+import tempfile
+import atexit
+import sqlite3
+import struct
+import calendar
+import sys
+import cProfile
+import pstats
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+import random
+import heapq
+import csv
+import multiprocessing
+import click
+import queue
+import math
+import shutil
+import subprocess
+import wave
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict, Counter, deque
+from itertools import islice
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+from werkzeug.exceptions import RequestEntityTooLarge
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-here-change-in-production'
+try:
+    import fcntl
+except ImportError:  # Windows: tanpa flock, jalankan satu process saja
+    fcntl = None
 
-# CORS configuration
-CORS(app, supports_credentials=True, resources={
-    r"/*": {
-        "origins": ["http://localhost:5000", "http://127.0.0.1:5000"],
-        "methods": ["GET", "POST", "PUT", "DELETE"],
-        "allow_headers": ["Content-Type"]
-    }
-})
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow opsional; tanpa Pillow cover disajikan apa adanya
+    Image = None
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # NumPy/SciPy opsional; tanpa keduanya engine 'content' tidak tersedia
+    np = None
+
+try:
+    import mutagen
+except ImportError:  # mutagen opsional; tanpa mutagen dipakai parser MP3/FLAC/WAV bawaan
+    mutagen = None
+
+try:
+    import orjson
+except ImportError:  # orjson opsional; tanpa orjson dipakai encoder json bawaan
+    orjson = None
 
 # Upload configuration
 UPLOAD_FOLDER = 'uploads'
 AUDIO_FOLDER = os.path.join(UPLOAD_FOLDER, 'audio')
 COVER_FOLDER = os.path.join(UPLOAD_FOLDER, 'covers')
+WAVEFORM_FOLDER = os.path.join(UPLOAD_FOLDER, 'waveforms')
+UPLOAD_TMP_FOLDER = os.path.join(UPLOAD_FOLDER, 'tmp')
 ALLOWED_AUDIO_EXTENSIONS = {'mp3', 'wav', 'ogg', 'flac', 'm4a'}
 ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
 MAX_AUDIO_SIZE = 50 * 1024 * 1024  # 50MB
 MAX_IMAGE_SIZE = 5 * 1024 * 1024   # 5MB
+UPLOAD_CACHE_MAX_AGE = 365 * 24 * 3600
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+# Cover derivatives
+COVER_SIZES = (64, 256, 512)
+COVER_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+COVER_CACHE_MAX_AGE = 365 * 24 * 3600
 
 # Create upload folders
 os.makedirs(AUDIO_FOLDER, exist_ok=True)
 os.makedirs(COVER_FOLDER, exist_ok=True)
+os.makedirs(WAVEFORM_FOLDER, exist_ok=True)
+os.makedirs(UPLOAD_TMP_FOLDER, exist_ok=True)
+
+# Process pool impor (spawn/forkserver) mengimpor ulang modul ini; di sana
+# startup server (pembersihan tmp, journal, job queue, thread sync) dilewati
+IMPORT_WORKER_ENV = 'MUSICAPP_IMPORT_WORKER'
+IMPORT_WORKER = os.environ.get(IMPORT_WORKER_ENV) == '1'
+
+# Sisa upload yang terputus sebelum restart
+if not IMPORT_WORKER:
+    for name in os.listdir(UPLOAD_TMP_FOLDER):
+        try: os.remove(os.path.join(UPLOAD_TMP_FOLDER, name))
+        except OSError: pass
 
 # File validation
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
+def upload_limit(filename):
+    if filename and allowed_file(filename, ALLOWED_AUDIO_EXTENSIONS):
+        return MAX_AUDIO_SIZE
+    return MAX_IMAGE_SIZE
+
+# === STREAMING UPLOADS ===
+# Werkzeug menulis setiap file multipart langsung ke stream ini, jadi SHA-256
+# dihitung sambil menulis ke disk dan upload ditolak begitu melewati batas.
+class HashingUploadFile:
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.file = tempfile.NamedTemporaryFile(dir=UPLOAD_TMP_FOLDER, prefix='upload-', delete=False)
+        self.stored = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(f'File exceeds the {self.limit // (1024 * 1024)}MB limit')
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+    def store(self, target):
+        """Move the upload to target, or drop it if identical content is already there"""
+        self.file.close()
+        if os.path.exists(target):
+            os.remove(self.file.name)
+        else:
+            os.replace(self.file.name, target)
+        self.stored = True
+
+    def discard(self):
+        if not self.stored:
+            self.file.close()
+            try: os.remove(self.file.name)
+            except OSError: pass
+            self.stored = True
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = HashingUploadFile(upload_limit(filename))
+        self.__dict__.setdefault('upload_streams', []).append(stream)
+        return stream
+
+def store_upload(file_storage, folder, url_prefix):
+    """Store an uploaded file as <sha256>.<ext>; identical content shares one file"""
+    stream = file_storage.stream
+    ext = file_storage.filename.rsplit('.', 1)[1].lower()
+    filename = f'{stream.hexdigest()}.{ext}'
+    stream.store(os.path.join(folder, filename))
+    return f'{url_prefix}/{filename}'
+
+app = Flask(__name__)
+app.secret_key = 'your-secret-key-here-change-in-production'
+app.request_class = UploadRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_AUDIO_SIZE + MAX_IMAGE_SIZE + 1024 * 1024
+
+@app.teardown_request
+def discard_uploads(exc):
+    for stream in request.__dict__.get('upload_streams', ()):
+        stream.discard()
+
+# CORS configuration
+CORS(app, supports_credentials=True, resources={
+    r"/*": {
+        "origins": ["http://localhost:5000", "http://127.0.0.1:5000"],
+        "methods": ["GET", "POST", "PUT", "DELETE"],
+        "allow_headers": ["Content-Type"]
+    }
+})
+
+# === METRICS ===
+# Histogram latensi per endpoint dan operasi internal, diekspor dalam format
+# teks Prometheus di /metrics. Satu lock + bisect per observasi.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_HELP = {
+    'musicapp_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+    'musicapp_requests_total': ('counter', 'Requests by endpoint, method and status'),
+    'musicapp_response_bytes_total': ('counter', 'Response body bytes by endpoint'),
+    'musicapp_requests_in_flight': ('gauge', 'Requests currently being handled'),
+    'musicapp_exceptions_total': ('counter', 'Exceptions raised while handling requests'),
+    'musicapp_operation_duration_seconds': ('histogram', 'Latency of internal operations'),
+    'musicapp_play_next_total': ('counter', 'play_next results by source'),
+    'musicapp_catalog_songs': ('gauge', 'Songs in the catalog'),
+}
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in items) + '}'
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}   # (name, labels) -> Histogram
+        self.values = {}       # (name, labels) -> float (counter/gauge)
+        self.lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = value
+
+    @contextmanager
+    def time(self, op):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('musicapp_operation_duration_seconds', time.perf_counter() - start, op=op)
+
+    def render(self):
+        with self.lock:
+            histograms = [(k, list(h.counts), h.sum, h.count) for k, h in self.histograms.items()]
+            values = list(self.values.items())
+        lines = []
+        seen = set()
+        def header(name):
+            if name not in seen:
+                seen.add(name)
+                kind, text = METRIC_HELP.get(name, ('untyped', name))
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+        for (name, labels), value in sorted(values):
+            header(name)
+            lines.append(f'{name}{format_labels(labels)} {value}')
+        for (name, labels), counts, total, count in sorted(histograms, key=lambda h: h[0]):
+            header(name)
+            cumulative = 0
+            for le, n in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{format_labels(labels, ("le", le))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+@app.before_request
+def start_request_timer():
+    request.environ['musicapp.start'] = time.perf_counter()
+    metrics.inc('musicapp_requests_in_flight')
+
+@app.after_request
+def record_request_metrics(response):
+    start = request.environ.get('musicapp.start')
+    if start is not None:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.observe('musicapp_request_duration_seconds', time.perf_counter() - start, endpoint=endpoint)
+        metrics.inc('musicapp_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+        if response.content_length:
+            metrics.inc('musicapp_response_bytes_total', response.content_length, endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def finish_request_timer(exc):
+    if request.environ.pop('musicapp.start', None) is not None:
+        metrics.inc('musicapp_requests_in_flight', -1)
+
+def count_exception(e):
+    metrics.inc('musicapp_exceptions_total', endpoint=request.endpoint or 'unmatched', type=type(e).__name__)
+
+@got_request_exception.connect_via(app)
+def record_unhandled_exception(sender, exception, **extra):
+    count_exception(exception)
+
 # === DATA STRUCTURES ===
 
-# 1. Singly Linked List - Song Node
+# 1. Doubly Linked List - Song Node
+# Node hanya menyimpan id lagu; metadata dibaca dari katalog saat dibutuhkan
+# sehingga update_song langsung terlihat di semua playlist.
 class SongNode:
-    def __init__(self, song_id, title, artist, duration, genre, album, audio_path, cover_path):
+    __slots__ = ('id', 'prev', 'next')
+
+    def __init__(self, song_id):
         self.id = song_id
-        self.title = title
-        self.artist = artist
-        self.duration = duration
-        self.genre = genre
-        self.album = album
-        self.audio_path = audio_path
-        self.cover_path = cover_path
+        self.prev = None
         self.next = None
 
 
-# 2. Singly Linked List - Playlist
+# 2. Doubly Linked List - Playlist
+# head/tail pointer + map id -> node: append, cek isi, hapus, dan pindah O(1).
+# dirty mencatat lagu yang link-nya berubah agar store hanya menulis baris itu.
 class Playlist:
     def __init__(self):
         self.head = None
-        self.current = None
-    
-    def add_song(self, song):
-        new_node = SongNode(
-            song['id'], song['title'], song['artist'],
-            song['duration'], song['genre'],song.get('album'),
-            song['audio_path'], song['cover_path']
-        )
-
-        if not self.head:
-            self.head = new_node
-            self.current = new_node
+        self.tail = None
+        self.nodes = {}
+        self.dirty = set()   # id lagu yang ditambah, dihapus, atau prev/next-nya berubah
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, song_id):
+        return song_id in self.nodes
+
+    def _link_after(self, node, prev):
+        """Insert node after prev; prev None means at the head"""
+        node.prev = prev
+        node.next = prev.next if prev else self.head
+        if node.next:
+            node.next.prev = node
+            self.dirty.add(node.next.id)
         else:
-            temp = self.head
-            while temp.next:
-                temp = temp.next
-            temp.next = new_node
-    
-    def get_all_songs(self):
-        songs = []
-        temp = self.head
-        while temp:
-            songs.append({
-                'id': temp.id,
-                'title': temp.title,
-                'artist': temp.artist,
-                'duration': temp.duration,
-                'genre': temp.genre,
-                'album': temp.album,
-                'audio_path': temp.audio_path,
-                'cover_path': temp.cover_path
-            })
-            temp = temp.next
-        return songs
-    
+            self.tail = node
+        if prev:
+            prev.next = node
+            self.dirty.add(prev.id)
+        else:
+            self.head = node
+        self.dirty.add(node.id)
+
+    def _unlink(self, node):
+        if node.prev:
+            node.prev.next = node.next
+            self.dirty.add(node.prev.id)
+        else:
+            self.head = node.next
+        if node.next:
+            node.next.prev = node.prev
+            self.dirty.add(node.next.id)
+        else:
+            self.tail = node.prev
+        node.prev = node.next = None
+        self.dirty.add(node.id)
+
+    def add_song(self, song):
+        """Append a song (dict or id); returns False if it is already in the playlist"""
+        song_id = song['id'] if isinstance(song, dict) else song
+        if song_id in self.nodes:
+            return False
+        node = SongNode(song_id)
+        self.nodes[song_id] = node
+        self._link_after(node, self.tail)
+        return True
+
+    def add_songs(self, song_ids):
+        """Bulk append; returns the ids that were actually added"""
+        return [song_id for song_id in song_ids if self.add_song(song_id)]
+
     def remove_song(self, song_id):
-        if not self.head:
+        node = self.nodes.pop(song_id, None)
+        if node is None:
             return False
-        
-        if self.head.id == song_id:
-            self.head = self.head.next
+        self._unlink(node)
+        return True
+
+    def move_song(self, song_id, after_id=None):
+        """Move a song right after after_id (None = to the front)"""
+        node = self.nodes.get(song_id)
+        prev = self.nodes.get(after_id) if after_id is not None else None
+        if node is None or (after_id is not None and prev is None):
+            return False
+        if node is prev:
             return True
-        
+        self._unlink(node)
+        self._link_after(node, prev)
+        return True
+
+    def move_to(self, song_id, position):
+        """Move a song to an index; O(n), move_song with an anchor id is O(1)"""
+        if song_id not in self.nodes:
+            return False
+        position = max(0, min(position, len(self.nodes) - 1))
+        if position == 0:
+            return self.move_song(song_id)
+        ids = [i for i in self.song_ids() if i != song_id]
+        return self.move_song(song_id, ids[position - 1])
+
+    def reorder(self, song_ids):
+        """Replace the order; song_ids must contain exactly the current songs"""
+        song_ids = list(song_ids)
+        if len(song_ids) != len(self.nodes) or set(song_ids) != self.nodes.keys():
+            return False
+        self.clear()
+        self.add_songs(song_ids)
+        return True
+
+    def preceding(self, song_id, n):
+        """Up to n song ids right before song_id, nearest first"""
+        ids = []
+        node = self.nodes.get(song_id)
+        node = node.prev if node else None
+        while node and len(ids) < n:
+            ids.append(node.id)
+            node = node.prev
+        return ids
+
+    def next_song_id(self, song_id):
+        node = self.nodes.get(song_id)
+        if node and node.next:
+            return node.next.id
+        return None
+
+    def song_ids(self, offset=0, limit=None):
+        ids = []
         temp = self.head
-        while temp.next:
-            if temp.next.id == song_id:
-                temp.next = temp.next.next
-                return True
+        while temp and offset:
             temp = temp.next
-        return False
-    
+            offset -= 1
+        while temp and (limit is None or len(ids) < limit):
+            ids.append(temp.id)
+            temp = temp.next
+        return ids
+
+    def get_all_songs(self, offset=0, limit=None):
+        """Resolve ids against the catalog; songs deleted from it are skipped"""
+        songs = []
+        for song_id in self.song_ids(offset, limit):
+            song = song_catalog.get(song_id)
+            if song:
+                songs.append(song)
+        return songs
+
     def clear(self):
+        self.dirty.update(self.nodes)
         self.head = None
-        self.current = None
+        self.tail = None
+        self.nodes = {}
+
+    def links(self, song_id):
+        node = self.nodes[song_id]
+        return [node.prev.id if node.prev else None, node.next.id if node.next else None]
+
+    def take_changes(self):
+        """({song_id: [prev_id, next_id]} for changed songs, removed ids) since the last call"""
+        dirty, self.dirty = self.dirty, set()
+        links = {i: self.links(i) for i in dirty if i in self.nodes}
+        return links, [i for i in dirty if i not in self.nodes]
+
+    def copy(self):
+        """Independent copy with the same order and pending changes"""
+        playlist = Playlist()
+        playlist.add_songs(self.song_ids())
+        playlist.dirty = set(self.dirty)
+        return playlist
+
+    @classmethod
+    def from_state(cls, state):
+        """Playlist from the old whole-value format"""
+        playlist = cls()
+        # state lama menyimpan salinan dict lagu, state baru hanya id
+        playlist.add_songs(song['id'] if isinstance(song, dict) else song for song in state or [])
+        return playlist
+
+    @classmethod
+    def from_links(cls, links):
+        """Rebuild from {song_id: [prev_id, next_id]} rows by walking from the head"""
+        playlist = cls()
+        song_id = next((i for i, (prev, _) in links.items() if prev is None), None)
+        while song_id in links and song_id not in playlist.nodes:
+            playlist.add_song(song_id)
+            song_id = links[song_id][1]
+        if len(playlist.nodes) == len(links):
+            playlist.dirty.clear()
+        else:   # rantai rusak: sisanya disambung di akhir dan ditulis ulang saat edit berikutnya
+            playlist.add_songs(sorted(i for i in links if i not in playlist.nodes))
+        return playlist
 
 # 3. Queue - Song Queue
+# entry_id -> song_id plus posisi integer berjarak (GAP) dan list terurut
+# (posisi, entry_id): enqueue, dequeue, hapus, dan move hanya mengubah posisi
+# entry itu sendiri, sehingga store cukup menulis satu baris. Entry id
+# membedakan lagu yang sama yang diantrekan dua kali.
 class SongQueue:
+    GAP = 1 << 16   # jarak posisi baru; move ke tengah memakai titik tengah dua tetangga
+
     def __init__(self):
-        self.items = []
-    
-    def enqueue(self, song):
-        self.items.append(song)
-    
+        self.entries = {}      # entry_id -> song_id
+        self.positions = {}    # entry_id -> posisi (int, boleh negatif)
+        self.order = []        # (posisi, entry_id) terurut
+        self.next_entry_id = 1
+        self.current = None    # (entry_id, song_id) yang sedang diputar
+        self.dirty = set()     # entry yang ditambah, dihapus, atau posisinya berubah
+        self.meta_dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _place(self, entry_id, position):
+        self.positions[entry_id] = position
+        insort(self.order, (position, entry_id))
+        self.dirty.add(entry_id)
+
+    def _unplace(self, entry_id):
+        position = self.positions.pop(entry_id)
+        del self.order[bisect_left(self.order, (position, entry_id))]
+        self.dirty.add(entry_id)
+
+    def _renumber(self, entry_ids):
+        """Evenly spaced positions in the given order; every entry is rewritten"""
+        self.positions = {entry_id: (i + 1) * self.GAP for i, entry_id in enumerate(entry_ids)}
+        self.order = [(position, entry_id) for entry_id, position in self.positions.items()]
+        self.dirty.update(entry_ids)
+
+    def _add(self, song, position):
+        entry_id = self.next_entry_id
+        self.next_entry_id += 1
+        self.meta_dirty = True
+        self.entries[entry_id] = song['id'] if isinstance(song, dict) else song
+        self._place(entry_id, position)
+        return entry_id
+
+    def entry_ids(self):
+        return [entry_id for _, entry_id in self.order]
+
+    def enqueue(self, song, play_next=False):
+        """Add a song (dict or id) and return its entry id"""
+        return self.enqueue_many([song], play_next)[0]
+
+    def enqueue_many(self, songs, play_next=False):
+        songs = list(songs)
+        if play_next:
+            first = self.order[0][0] if self.order else 0
+            return [self._add(song, first - (len(songs) - i) * self.GAP) for i, song in enumerate(songs)]
+        last = self.order[-1][0] if self.order else 0
+        return [self._add(song, last + (i + 1) * self.GAP) for i, song in enumerate(songs)]
+
     def dequeue(self):
-        if not self.is_empty():
-            return self.items.pop(0)
+        """Pop the next entry and make it current; skips songs no longer in the catalog"""
+        while self.order:
+            entry_id = self.order[0][1]
+            self._unplace(entry_id)
+            song_id = self.entries.pop(entry_id)
+            song = song_catalog.get(song_id)
+            if song:
+                self.current = (entry_id, song_id)
+                self.meta_dirty = True
+                return dict(song, entry_id=entry_id)
         return None
-    
+
     def peek(self):
-        if not self.is_empty():
-            return self.items[0]
+        for _, entry_id in self.order:
+            song = song_catalog.get(self.entries.get(entry_id))
+            if song:
+                return dict(song, entry_id=entry_id)
         return None
-    
+
     def is_empty(self):
-        return len(self.items) == 0
-    
+        return len(self.entries) == 0
+
+    def remove_entry(self, entry_id):
+        if entry_id not in self.entries:
+            return False
+        self._unplace(entry_id)
+        del self.entries[entry_id]
+        return True
+
+    def remove_song(self, song_id):
+        """Remove every entry of a song; O(n)"""
+        entry_ids = [e for e, s in self.entries.items() if s == song_id]
+        for entry_id in entry_ids:
+            self.remove_entry(entry_id)
+        return len(entry_ids)
+
+    def move(self, entry_id, position):
+        """Move an entry to an index; only its own position changes unless the gap is used up"""
+        if entry_id not in self.entries:
+            return False
+        self._unplace(entry_id)
+        position = max(0, min(position, len(self.order)))
+        if not self.order:
+            new = self.GAP
+        elif position == 0:
+            new = self.order[0][0] - self.GAP
+        elif position == len(self.order):
+            new = self.order[-1][0] + self.GAP
+        else:
+            before, after = self.order[position - 1][0], self.order[position][0]
+            if after - before < 2:
+                entry_ids = self.entry_ids()
+                entry_ids.insert(position, entry_id)
+                self._renumber(entry_ids)
+                return True
+            new = (before + after) // 2
+        self._place(entry_id, new)
+        return True
+
+    def shuffle(self, rng=random):
+        """Shuffle the upcoming entries; the current item is untouched"""
+        entry_ids = self.entry_ids()
+        rng.shuffle(entry_ids)
+        self._renumber(entry_ids)
+
     def get_all(self):
-        return self.items.copy()
-    
+        songs = []
+        for _, entry_id in list(self.order):
+            song = song_catalog.get(self.entries.get(entry_id))
+            if song:
+                songs.append(dict(song, entry_id=entry_id))
+        return songs
+
+    def get_current(self):
+        if self.current:
+            song = song_catalog.get(self.current[1])
+            if song:
+                return dict(song, entry_id=self.current[0])
+        return None
+
     def clear(self):
-        self.items = []
+        self.dirty.update(self.entries)
+        self.entries = {}
+        self.positions = {}
+        self.order = []
+
+    def meta(self):
+        return {'next_entry_id': self.next_entry_id, 'current': self.current}
+
+    def copy(self):
+        """Independent copy with the same entries and pending changes"""
+        queue = SongQueue()
+        queue.entries = dict(self.entries)
+        queue.positions = dict(self.positions)
+        queue.order = list(self.order)
+        queue.next_entry_id = self.next_entry_id
+        queue.current = self.current
+        queue.dirty = set(self.dirty)
+        queue.meta_dirty = self.meta_dirty
+        return queue
+
+    def take_changes(self):
+        """({entry_id: [position, song_id]} for changed entries, removed entry ids) since the last call"""
+        dirty, self.dirty = self.dirty, set()
+        changed = {e: [self.positions[e], self.entries[e]] for e in dirty if e in self.entries}
+        return changed, [e for e in dirty if e not in self.entries]
+
+    @classmethod
+    def from_rows(cls, meta, entries):
+        """Rebuild from the meta row and {entry_id: [position, song_id]} rows"""
+        queue = cls()
+        queue.entries = {entry_id: song_id for entry_id, (_, song_id) in entries.items()}
+        queue.positions = {entry_id: position for entry_id, (position, _) in entries.items()}
+        queue.order = sorted((position, entry_id) for entry_id, position in queue.positions.items())
+        if meta:
+            queue.next_entry_id = max([meta['next_entry_id']] + [e + 1 for e in entries])
+            queue.current = tuple(meta['current']) if meta.get('current') else None
+        return queue
+
+    @classmethod
+    def from_state(cls, state):
+        """Queue from the old whole-value format"""
+        queue = cls()
+        if isinstance(state, list):
+            # state lama: list salinan dict lagu
+            queue.enqueue_many(song['id'] for song in state)
+        elif state:
+            queue.entries = {e: s for e, s in state['entries']}
+            queue._renumber(list(queue.entries))
+            queue.next_entry_id = state['next_entry_id']
+            queue.current = tuple(state['current']) if state.get('current') else None
+        return queue
 
 # 4. Stack - History
 class HistoryStack:
     def __init__(self):
-        self.items = []
+        self.items = deque(maxlen=50)  # Max 50 history
     
     def push(self, song):
         self.items.append(song)
-        if len(self.items) > 50:  # Max 50 history
-            self.items.pop(0)
     
     def pop(self):
         if not self.is_empty():
@@ -160,173 +712,3415 @@ class HistoryStack:
         return len(self.items) == 0
     
     def get_all(self):
-        return self.items.copy()
+        return list(self.items)
     
     def clear(self):
-        self.items = []
+        self.items.clear()
+
+    def to_state(self):
+        return list(self.items)
+
+    @classmethod
+    def from_state(cls, state):
+        history = cls()
+        history.items.extend(state or [])
+        return history
+
+# 5. Sorted Index - Judul lagu
+# Sorted array yang dipecah menjadi beberapa chunk (mirip leaf B-tree),
+# tetap seimbang berapapun urutan inputnya dan tanpa rekursi.
+TITLE_CHUNK_SIZE = 512
+TITLE_MAX = '\U0010ffff'
+
+class TitleIndex:
+    def __init__(self):
+        self.chunks = []   # list of sorted list of (title_lower, song_id)
+        self.maxes = []    # key terbesar di setiap chunk
+        self.keys = {}     # song_id -> key
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add_song(self, song):
+        self.remove_song(song['id'])
+        key = ((song.get('title') or '').lower(), song['id'])
+        self.keys[song['id']] = key
+        if not self.chunks:
+            self.chunks.append([key])
+            self.maxes.append(key)
+            return
+        i = bisect_left(self.maxes, key)
+        if i == len(self.chunks):
+            i -= 1
+        chunk = self.chunks[i]
+        insort(chunk, key)
+        self.maxes[i] = chunk[-1]
+        if len(chunk) > TITLE_CHUNK_SIZE * 2:
+            half = len(chunk) // 2
+            self.chunks[i:i + 1] = [chunk[:half], chunk[half:]]
+            self.maxes[i:i + 1] = [chunk[half - 1], chunk[-1]]
+
+    def remove_song(self, song_id):
+        key = self.keys.pop(song_id, None)
+        if key is None:
+            return
+        i = bisect_left(self.maxes, key)
+        chunk = self.chunks[i]
+        del chunk[bisect_left(chunk, key)]
+        if chunk:
+            self.maxes[i] = chunk[-1]
+        else:
+            del self.chunks[i]
+            del self.maxes[i]
+
+    def _rank(self, key):
+        """Jumlah key yang lebih kecil dari key"""
+        i = bisect_left(self.maxes, key)
+        if i == len(self.chunks):
+            return len(self.keys)
+        return sum(len(c) for c in self.chunks[:i]) + bisect_left(self.chunks[i], key)
+
+    def _slice(self, start, stop):
+        ids = []
+        for chunk in self.chunks:
+            if start >= stop:
+                break
+            if start >= len(chunk):
+                start -= len(chunk)
+                stop -= len(chunk)
+                continue
+            part = chunk[start:stop]
+            ids.extend(song_id for _, song_id in part)
+            stop -= start + len(part)
+            start = 0
+        return ids
+
+    def range(self, start=None, end=None, offset=0, limit=50):
+        """Song id dengan start <= judul < end (lowercase), urut A-Z; return (ids, total)"""
+        lo = self._rank(((start or '').lower(),))
+        hi = len(self.keys) if end is None else self._rank((end.lower(),))
+        first = lo + offset
+        return self._slice(first, min(hi, first + limit)), max(hi - lo, 0)
+
+    def prefix(self, title_prefix, offset=0, limit=50):
+        title_prefix = title_prefix.lower()
+        return self.range(title_prefix, title_prefix + TITLE_MAX, offset, limit)
+
+    def page(self, offset=0, limit=50):
+        return self.range(offset=offset, limit=limit)
+
+    def clear(self):
+        self.chunks = []
+        self.maxes = []
+        self.keys = {}
+
+# 6. Graph - Recommendations
+# Lagu dengan genre yang sama saling bertetangga. Tetangga diturunkan dari
+# bucket genre (genre -> list id) sehingga tidak perlu menyimpan edge
+# berpasangan. Bucket berupa list + posisi agar bisa diambil acak O(1).
+MAX_RECOMMENDATIONS = 50
+
+def genre_key(genre):
+    return (genre or '').strip().lower()
+
+class RecommendationGraph:
+    def __init__(self):
+        self.buckets = {}      # genre -> [song_id, ...]
+        self.positions = {}    # song_id -> index di bucket-nya
+        self.song_genre = {}   # song_id -> genre
+
+    def add_song(self, song):
+        key = genre_key(song.get('genre'))
+        if self.song_genre.get(song['id']) == key:
+            return
+        self.remove_song(song['id'])
+        if key:
+            bucket = self.buckets.setdefault(key, [])
+            self.positions[song['id']] = len(bucket)
+            bucket.append(song['id'])
+            self.song_genre[song['id']] = key
+
+    def remove_song(self, song_id):
+        key = self.song_genre.pop(song_id, None)
+        if key is None:
+            return
+        bucket = self.buckets[key]
+        index = self.positions.pop(song_id)
+        last = bucket.pop()
+        if last != song_id:   # tukar dengan elemen terakhir, O(1)
+            bucket[index] = last
+            self.positions[last] = index
+        if not bucket:
+            del self.buckets[key]
+
+    def neighbor_count(self, song_id):
+        key = self.song_genre.get(song_id)
+        if key is None:
+            return 0
+        return len(self.buckets[key]) - 1
+
+    def get_recommendations(self, song_id, limit=MAX_RECOMMENDATIONS, rng=None):
+        """Up to limit genre neighbors; with rng, a random sample in O(limit)"""
+        key = self.song_genre.get(song_id)
+        if key is None:
+            return []
+        bucket = self.buckets[key]
+        if rng is None or len(bucket) <= limit + 1:
+            picks = islice(bucket, limit + 1)
+        else:
+            picks = (bucket[i] for i in rng.sample(range(len(bucket)), limit + 1))
+        return [i for i in picks if i != song_id][:limit]
+
+    def clear(self):
+        self.buckets = {}
+        self.positions = {}
+        self.song_genre = {}
+
+# 6b. Graph - Co-listen (item-to-item)
+# Bobot antar lagu dari pemutaran berurutan oleh user yang sama dan dari
+# lagu yang berdekatan di playlist. Setiap lagu menyimpan top-K tetangga
+# yang diperbarui setiap kali bobot naik, jadi rekomendasi cukup O(K).
+# Dipakai dari play log, route playlist, dan penghapusan lagu, jadi semua
+# akses lewat satu lock milik graph; version naik setiap kali graph berubah.
+COLISTEN_TOP_K = 20
+COLISTEN_PLAY_WEIGHT = 2
+COLISTEN_PLAYLIST_WEIGHT = 1
+COLISTEN_PLAYLIST_WINDOW = 5     # jumlah lagu sebelumnya di playlist yang dipasangkan
+COLISTEN_SESSION_GAP = 1800      # detik; jeda lebih lama dianggap sesi baru
+
+class CoListenGraph:
+    def __init__(self, top_k=COLISTEN_TOP_K):
+        self.top_k = top_k
+        self.weights = {}            # song_id -> {neighbor: bobot}
+        self.top = {}                # song_id -> [neighbor], urut (-bobot, id)
+        self.play_pairs = Counter()  # (a, b), a < b -> jumlah pemutaran berurutan
+        self.last_play = {}          # username -> (timestamp, song_id)
+        self.version = 0
+        self.lock = threading.RLock()
+
+    def add_pair(self, a, b, weight):
+        if a == b:
+            return
+        with self.lock:
+            for x, y in ((a, b), (b, a)):
+                row = self.weights.setdefault(x, {})
+                row[y] = row.get(y, 0) + weight
+                self._promote(x, y)
+            self.version += 1
+
+    def _promote(self, song_id, neighbor):
+        """Bobot hanya naik, jadi cukup cek apakah neighbor masuk top-K"""
+        row = self.weights[song_id]
+        top = self.top.setdefault(song_id, [])
+        if neighbor not in top:
+            if len(top) >= self.top_k:
+                last = top[-1]
+                if (-row[neighbor], neighbor) >= (-row[last], last):
+                    return
+                top.pop()
+            top.append(neighbor)
+        top.sort(key=lambda n: (-row[n], n))
+
+    def observe_play(self, ts, song_id, username):
+        with self.lock:
+            previous = self.last_play.get(username)
+            self.last_play[username] = (ts, song_id)
+            if previous and previous[1] != song_id and 0 <= ts - previous[0] <= COLISTEN_SESSION_GAP:
+                self.play_pairs[tuple(sorted((previous[1], song_id)))] += 1
+                self.add_pair(previous[1], song_id, COLISTEN_PLAY_WEIGHT)
+
+    def observe_playlist(self, playlist, song_ids):
+        """Pair newly added playlist songs with the songs just before them"""
+        for song_id in song_ids:
+            for other in playlist.preceding(song_id, COLISTEN_PLAYLIST_WINDOW):
+                self.add_pair(song_id, other, COLISTEN_PLAYLIST_WEIGHT)
+
+    def neighbors(self, song_id):
+        """Copy of the top-K neighbor ids, heaviest first"""
+        with self.lock:
+            return list(self.top.get(song_id, ()))
+
+    def remove_song(self, song_id):
+        with self.lock:
+            row = self.weights.pop(song_id, {})
+            self.top.pop(song_id, None)
+            for neighbor in row:
+                other = self.weights.get(neighbor)
+                if other is None:
+                    continue
+                other.pop(song_id, None)
+                if song_id in self.top.get(neighbor, ()):
+                    self.top[neighbor] = heapq.nsmallest(self.top_k, other, key=lambda n: (-other[n], n))
+            if row:
+                self.version += 1
+
+    def to_state(self):
+        with self.lock:
+            return {
+                'pairs': [[a, b, n] for (a, b), n in self.play_pairs.items()],
+                'last_play': dict(self.last_play),
+            }
+
+    def load_state(self, state, exists):
+        """Add play pairs from a checkpoint; pairs with deleted songs are dropped"""
+        with self.lock:
+            for a, b, n in (state or {}).get('pairs', []):
+                if exists(a) and exists(b):
+                    self.play_pairs[(a, b)] += n
+                    self.add_pair(a, b, COLISTEN_PLAY_WEIGHT * n)
+            for username, (ts, song_id) in (state or {}).get('last_play', {}).items():
+                self.last_play.setdefault(username, (ts, song_id))
+
+# 6c. Content similarity (opsional, NumPy + SciPy)
+# Setiap lagu jadi satu baris sparse: one-hot genre/artist/album, bucket
+# durasi, dan hash token judul. Baris dinormalisasi L2 sehingga cosine
+# similarity cukup satu perkalian sparse. Matriks dibangun ulang per batch
+# oleh job 'content_build' saat versi katalog berubah; selama matriks pertama
+# belum ada, rekomendasi diambil dari bucket genre. Hasil per lagu disimpan
+# di LRU cache bersama k yang dipakai untuk menghitungnya.
+CONTENT_TITLE_DIM = 1 << 12     # kolom hash untuk token judul
+CONTENT_DURATION_STEP = 30      # detik per bucket durasi
+CONTENT_DURATION_BUCKETS = 16
+CONTENT_VOCAB_OFFSET = CONTENT_TITLE_DIM + CONTENT_DURATION_BUCKETS   # kolom one-hot mulai di sini
+CONTENT_BUILD_BATCH = 50000
+CONTENT_CACHE_SIZE = 10000
+CONTENT_WEIGHTS = {'genre': 1.0, 'artist': 1.0, 'album': 0.8, 'duration': 0.4, 'title': 0.6}
+
+def title_tokens(title):
+    return set(re.findall(r'\w+', (title or '').lower()))
+
+class ContentSimilarity:
+    def __init__(self, cache_size=CONTENT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()   # song_id -> (k, [song_id, ...] urut similarity)
+        self.version = None          # versi katalog yang sudah masuk matriks
+        self.scheduled = None        # versi katalog yang job build-nya sudah dikirim
+        self.matrix = None           # CSR, lagu x fitur
+        self.columns = None          # CSR transpose, fitur x lagu
+        self.ids = None              # posisi baris -> song_id
+        self.rows = {}               # song_id -> posisi baris
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return np is not None
+
+    def song_features(self, song, vocab):
+        """(column, weight) pairs; vocab assigns one-hot columns on first sight"""
+        features = []
+        for field in ('genre', 'artist', 'album'):
+            value = (song.get(field) or '').strip().lower()
+            if value:
+                column = vocab.setdefault((field, value), CONTENT_VOCAB_OFFSET + len(vocab))
+                features.append((column, CONTENT_WEIGHTS[field]))
+        bucket = min(int(song.get('duration') or 0) // CONTENT_DURATION_STEP, CONTENT_DURATION_BUCKETS - 1)
+        features.append((CONTENT_TITLE_DIM + bucket, CONTENT_WEIGHTS['duration']))
+        # bucket tetangga ikut diberi bobot kecil agar durasi mirip tetap dekat
+        for near in (bucket - 1, bucket + 1):
+            if 0 <= near < CONTENT_DURATION_BUCKETS:
+                features.append((CONTENT_TITLE_DIM + near, CONTENT_WEIGHTS['duration'] / 2))
+        tokens = title_tokens(song.get('title'))
+        for token in tokens:
+            column = zlib.crc32(token.encode('utf-8')) % CONTENT_TITLE_DIM
+            features.append((column, CONTENT_WEIGHTS['title'] / len(tokens) ** 0.5))
+        return features
+
+    def build(self, songs, version=None, batch_size=CONTENT_BUILD_BATCH):
+        """Build the normalized feature matrix from a list of songs"""
+        vocab = {}
+        blocks = []
+        for start in range(0, len(songs), batch_size):
+            batch = songs[start:start + batch_size]
+            indptr = [0]
+            columns = []
+            values = []
+            for song in batch:
+                for column, weight in self.song_features(song, vocab):
+                    columns.append(column)
+                    values.append(weight)
+                indptr.append(len(columns))
+            blocks.append((np.array(indptr, dtype=np.int64), columns, values))
+        # lebar matriks baru diketahui setelah semua batch selesai
+        width = CONTENT_VOCAB_OFFSET + len(vocab)
+        parts = [sparse.csr_matrix((np.array(values, dtype=np.float32), np.array(columns, dtype=np.int64), indptr),
+                                   shape=(len(indptr) - 1, width))
+                 for indptr, columns, values in blocks]
+        matrix = sparse.vstack(parts, format='csr') if parts else sparse.csr_matrix((0, width), dtype=np.float32)
+        matrix.sum_duplicates()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        matrix = sparse.diags(1 / norms).dot(matrix).tocsr().astype(np.float32)
+        ids = np.fromiter((song['id'] for song in songs), dtype=np.int64, count=len(songs))
+        with self.lock:
+            self.matrix = matrix
+            self.columns = matrix.T.tocsr()
+            self.ids = ids
+            self.rows = {int(song_id): i for i, song_id in enumerate(ids)}
+            self.version = version
+            self.cache.clear()
+
+    def similar(self, song_id, k):
+        """Top-k song ids by cosine similarity, most similar first"""
+        with self.lock:
+            cached = self.cache.get(song_id)
+            # hasil untuk k yang lebih besar juga berlaku, walau lebih pendek dari k
+            if cached is not None and cached[0] >= k:
+                self.cache.move_to_end(song_id)
+                return cached[1][:k]
+            row = self.rows.get(song_id)
+            if row is None:
+                return []
+            matrix, columns, ids = self.matrix, self.columns, self.ids
+        # hanya lagu yang berbagi minimal satu fitur yang ikut dihitung
+        scores = matrix[row].dot(columns)
+        candidates, values = scores.indices, scores.data
+        keep = candidates != row
+        candidates, values = candidates[keep], values[keep]
+        if len(values) > k:
+            top = np.argpartition(-values, k)[:k]
+            candidates, values = candidates[top], values[top]
+        order = np.lexsort((ids[candidates], -values))
+        result = ids[candidates[order]].tolist()
+        with self.lock:
+            if self.rows.get(song_id) != row or self.ids is not ids:
+                return result   # matriks diganti selama menghitung
+            self.cache[song_id] = (k, result)
+            self.cache.move_to_end(song_id)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+# 7. Hash Map - Song Catalog
+def song_key(title, artist):
+    """Normalized (title, artist) key used for duplicate detection"""
+    return ((title or '').strip().lower(), (artist or '').strip().lower())
+
+class SongCatalog:
+    def __init__(self):
+        self.songs = []        # urutan library, dipakai sebagai songs_library
+        self.by_id = {}        # id -> song
+        self.by_key = {}       # (title, artist) -> song
+        # posisi lewat nomor urut yang tidak pernah berubah: self.seqs sejajar dengan
+        # self.songs dan selalu naik, jadi index = bisect. Hapus tidak perlu reindex.
+        self.seqs = []
+        self.seq_of = {}       # id -> nomor urut
+        self.next_seq = 0
+        self.next_id = 1
+        self.version = 0       # naik setiap kali katalog berubah di process ini
+        self.encoded = {}      # id -> bytes JSON lagu, dibuang saat lagu berubah
+
+    def load(self, songs):
+        self.songs.clear()
+        self.by_id.clear()
+        self.by_key.clear()
+        self.seqs.clear()
+        self.seq_of.clear()
+        self.encoded.clear()
+        self.next_id = 1
+        for song in songs:
+            self.add(song)
+        self.version += 1
+
+    def allocate_id(self):
+        new_id = self.next_id
+        self.next_id += 1
+        return new_id
+
+    def get(self, song_id):
+        return self.by_id.get(song_id)
+
+    def find_duplicate(self, title, artist, exclude_id=None):
+        song = self.by_key.get(song_key(title, artist))
+        if song and song['id'] != exclude_id:
+            return song
+        return None
+
+    def position(self, song_id):
+        seq = self.seq_of.get(song_id)
+        return -1 if seq is None else bisect_left(self.seqs, seq)
+
+    def encode(self, song):
+        """JSON bytes of a song, cached while it stays unchanged in the catalog"""
+        data = self.encoded.get(song['id'])
+        if data is not None and self.by_id.get(song['id']) is song:
+            return data
+        version = self.version
+        data = encode_json(song)
+        # salinan lama (mis. dari history) tidak di-cache; begitu juga jika katalog berubah saat encode
+        if version == self.version and self.by_id.get(song['id']) is song:
+            # salin ke bytes yang pas: hasil orjson menyisakan buffer ~1KB per lagu
+            data = bytes(memoryview(data))
+            self.encoded[song['id']] = data
+        return data
+
+    def add(self, song):
+        self.seq_of[song['id']] = self.next_seq
+        self.seqs.append(self.next_seq)
+        self.next_seq += 1
+        self.songs.append(song)
+        self.by_id[song['id']] = song
+        self.by_key.setdefault(song_key(song.get('title'), song.get('artist')), song)
+        if song['id'] >= self.next_id:
+            self.next_id = song['id'] + 1
+        self.version += 1
+        self.encoded.pop(song['id'], None)
+
+    def update(self, song_id, fields):
+        song = self.by_id[song_id]
+        old_key = song_key(song.get('title'), song.get('artist'))
+        song.update(fields)
+        new_key = song_key(song.get('title'), song.get('artist'))
+        if new_key != old_key:
+            if self.by_key.get(old_key) is song:
+                del self.by_key[old_key]
+            self.by_key.setdefault(new_key, song)
+        self.version += 1
+        self.encoded.pop(song_id, None)
+        return song
+
+    def remove(self, song_id):
+        song = self.by_id.pop(song_id, None)
+        if song is None:
+            return None
+        key = song_key(song.get('title'), song.get('artist'))
+        if self.by_key.get(key) is song:
+            del self.by_key[key]
+        pos = bisect_left(self.seqs, self.seq_of.pop(song_id))
+        del self.songs[pos]
+        del self.seqs[pos]
+        self.version += 1
+        self.encoded.pop(song_id, None)
+        return song
+
+    def update_many(self, changes):
+        """Apply [(song_id, fields)] together; keys are registered after every
+        update so songs can swap titles within one batch"""
+        songs = []
+        for song_id, fields in changes:
+            song = self.by_id[song_id]
+            old_key = song_key(song.get('title'), song.get('artist'))
+            if self.by_key.get(old_key) is song:
+                del self.by_key[old_key]
+            song.update(fields)
+            songs.append(song)
+        for song in songs:
+            self.by_key[song_key(song.get('title'), song.get('artist'))] = song
+        self.version += 1
+        for song in songs:
+            self.encoded.pop(song['id'], None)
+        return songs
+
+    def remove_many(self, song_ids):
+        """Remove several songs with a single pass over the library; returns the removed songs"""
+        removed = []
+        for song_id in song_ids:
+            song = self.by_id.pop(song_id, None)
+            if song is None:
+                continue
+            key = song_key(song.get('title'), song.get('artist'))
+            if self.by_key.get(key) is song:
+                del self.by_key[key]
+            removed.append(song)
+        if removed:
+            first = bisect_left(self.seqs, min(self.seq_of.pop(song['id']) for song in removed))
+            # slice assignment: songs_library tetap objek list yang sama
+            self.songs[first:] = [s for s in self.songs[first:] if s['id'] in self.by_id]
+            self.seqs[first:] = [self.seq_of[s['id']] for s in self.songs[first:]]
+            self.version += 1
+            for song in removed:
+                self.encoded.pop(song['id'], None)
+        return removed
+
+    def __len__(self):
+        return len(self.songs)
+
+    def __iter__(self):
+        return iter(self.songs)
+
+# 7b. Pre-encoded JSON - Fragment per lagu
+# Response daftar lagu dirakit dengan menyambung bytes JSON per lagu yang
+# sudah di-cache di SongCatalog.encoded, jadi setiap lagu hanya di-encode
+# sekali sampai lagu itu diubah. Pakai orjson jika terpasang.
+json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+def encode_json(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json_encoder.encode(obj).encode('utf-8')
+
+class Fragment:
+    """JSON yang sudah di-encode (list potongan bytes); disisipkan apa adanya oleh encode_fragments"""
+    __slots__ = ('parts',)
+
+    def __init__(self, data):
+        self.parts = [data] if isinstance(data, bytes) else data
+
+def song_list(songs):
+    """Fragment for a JSON array of songs built from the per-song cache"""
+    encoded = [song_catalog.encode(s) if s is not None else b'null' for s in songs]
+    if not encoded:
+        return Fragment(b'[]')
+    # potongan disambung sekali saja di encode_fragments, bukan per daftar
+    parts = [b','] * (2 * len(encoded) + 1)
+    parts[1::2] = encoded
+    parts[0], parts[-1] = b'[', b']'
+    return Fragment(parts)
+
+def _collect_fragments(value, parts):
+    if isinstance(value, Fragment):
+        parts.extend(value.parts)
+    elif isinstance(value, dict):
+        sep = b'{'
+        for k, v in value.items():
+            parts.append(sep + encode_json(str(k)) + b':')
+            _collect_fragments(v, parts)
+            sep = b','
+        parts.append(b'}' if sep == b',' else b'{}')
+    elif isinstance(value, list):
+        sep = b'['
+        for v in value:
+            parts.append(sep)
+            _collect_fragments(v, parts)
+            sep = b','
+        parts.append(b']' if sep == b',' else b'[]')
+    else:
+        parts.append(encode_json(value))
+
+def encode_fragments(value):
+    """Encode dicts and lists around Fragments into one bytes body"""
+    parts = []
+    _collect_fragments(value, parts)
+    return b''.join(parts)
+
+def json_response(payload, status=200):
+    """Pengganti jsonify untuk payload yang berisi Fragment"""
+    return Response(encode_fragments(payload), status=status, mimetype='application/json')
+
+# 8. Inverted Index - Full-text Search
+# Posting list per field (title, artist, album, genre) untuk teks utuh, token,
+# prefix kata dan n-gram (1-3 karakter). Posting list berupa array id yang
+# terurut; posting berisi satu lagu disimpan sebagai int biasa supaya katalog
+# besar tetap muat di memori.
+#
+# Skor satu kata per field: teks sama persis (4), token (3), awal kata (2),
+# substring (1), dikali bobot field. Posting list dibaca per tingkat skor dari
+# yang tertinggi (exact/prefix dulu, substring hanya kalau halaman belum
+# penuh) dan berhenti begitu offset+limit hasil teratas sudah pasti.
+# Skor yang sama diurutkan menurut id (urutan katalog).
+SEARCH_FIELDS = (('title', 4), ('artist', 3), ('album', 2), ('genre', 1))
+SEARCH_WEIGHTS = tuple(weight for _, weight in SEARCH_FIELDS)
+SEARCH_TIERS = (('exact', 4), ('tokens', 3), ('prefixes', 2), ('grams', 1))
+SEARCH_GRAM_SIZE = 3
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 200
+
+def text_grams(text, sizes=(SEARCH_GRAM_SIZE,)):
+    return {text[i:i + n] for n in sizes for i in range(len(text) - n + 1)}
+
+def search_text(value):
+    """Lowercase field text with single spaces, padded so ' term' finds a word start"""
+    return ' ' + ' '.join((value or '').lower().split()) + ' '
+
+def search_keys(text):
+    """Posting keys of one padded field text, by tier"""
+    words = text.split()
+    grams = set()
+    for word in words:
+        for n in range(1, SEARCH_GRAM_SIZE + 1):
+            grams.update([word[i:i + n] for i in range(len(word) - n + 1)])
+    return {
+        'exact': set(words) if len(words) == 1 else set(),
+        'tokens': set(words),
+        'prefixes': {word[:n] for word in words for n in range(1, SEARCH_GRAM_SIZE + 1)},
+        'grams': grams,
+    }
+
+def posting_len(ids):
+    if ids is None:
+        return 0
+    return 1 if type(ids) is int else len(ids)
+
+def posting_add(index, keys, song_id):
+    for key in keys:
+        ids = index.get(key)
+        if ids is None:
+            index[key] = song_id
+        elif type(ids) is int:
+            if ids != song_id:
+                index[key] = array('i', sorted((ids, song_id)))
+        elif ids[-1] < song_id:
+            ids.append(song_id)   # kasus umum: id baru selalu paling besar
+        else:
+            i = bisect_left(ids, song_id)
+            if i == len(ids) or ids[i] != song_id:
+                ids.insert(i, song_id)
+
+def posting_remove(index, keys, song_id):
+    for key in keys:
+        ids = index.get(key)
+        if ids is None:
+            continue
+        if type(ids) is int:
+            if ids == song_id:
+                del index[key]
+            continue
+        i = bisect_left(ids, song_id)
+        if i < len(ids) and ids[i] == song_id:
+            del ids[i]
+            if len(ids) == 1:
+                index[key] = ids[0]
+
+def term_forms(term):
+    return term, ' ' + term, ' ' + term + ' '
+
+class SearchIndex:
+    def __init__(self):
+        self.docs = {}   # song_id -> tuple teks field (lihat search_text)
+        # tier -> satu dict per field: key -> int atau array('i') id terurut
+        self.postings = {tier: [{} for _ in SEARCH_FIELDS] for tier, _ in SEARCH_TIERS}
+
+    def add_song(self, song):
+        song_id = song['id']
+        texts = tuple(search_text(song.get(field)) for field, _ in SEARCH_FIELDS)
+        old = self.docs.get(song_id)
+        if old == texts:
+            return
+        self.docs[song_id] = texts
+        for f, text in enumerate(texts):
+            if old and old[f] == text:
+                continue
+            # hanya key yang berubah yang disentuh, jadi edit satu field murah
+            before = search_keys(old[f]) if old else None
+            after = search_keys(text)
+            for tier, _ in SEARCH_TIERS:
+                keys = after[tier]
+                if before is not None:
+                    posting_remove(self.postings[tier][f], before[tier] - keys, song_id)
+                    keys = keys - before[tier]
+                posting_add(self.postings[tier][f], keys, song_id)
+
+    def remove_song(self, song_id):
+        texts = self.docs.pop(song_id, None)
+        if texts is None:
+            return
+        for f, text in enumerate(texts):
+            keys = search_keys(text)
+            for tier, _ in SEARCH_TIERS:
+                posting_remove(self.postings[tier][f], keys[tier], song_id)
+
+    def _source(self, tier, f, term):
+        """Ascending ids of songs whose field f matches term at the given tier or better"""
+        index = self.postings[tier][f]
+        if tier in ('exact', 'tokens') or len(term) <= SEARCH_GRAM_SIZE:
+            ids = index.get(term)
+            return (ids,) if type(ids) is int else ids or ()
+        # kata panjang: posting terpendek dari prefix/3-gram lalu cek teksnya
+        grams = self.postings['grams'][f]
+        candidates = [grams.get(g) for g in text_grams(term)]
+        needle = term
+        if tier == 'prefixes':
+            candidates.append(index.get(term[:SEARCH_GRAM_SIZE]))
+            needle = ' ' + term
+        ids = min(candidates, key=posting_len)
+        if ids is None:
+            return ()
+        if type(ids) is int:
+            ids = (ids,)
+        docs = self.docs
+        return (sid for sid in ids if needle in docs[sid][f])
+
+    def _stream(self, term):
+        """(score, song_id) for every match of term, by score then id; a song repeats at lower tiers"""
+        levels = {}
+        for f, weight in enumerate(SEARCH_WEIGHTS):
+            for tier, score in SEARCH_TIERS:
+                levels.setdefault(score * weight, []).append((tier, f))
+        for score in sorted(levels, reverse=True):
+            sources = [self._source(tier, f, term) for tier, f in levels[score]]
+            for sid in heapq.merge(*sources) if len(sources) > 1 else sources[0]:
+                yield score, sid
+
+    def _estimate(self, term):
+        """Rough number of songs containing term: the largest per-field posting"""
+        keys = [term] if len(term) <= SEARCH_GRAM_SIZE else text_grams(term)
+        return max(min(posting_len(grams.get(k)) for k in keys) for grams in self.postings['grams'])
+
+    def _score(self, song_id, forms):
+        texts = self.docs[song_id]
+        total = 0
+        for term, start, word in forms:
+            best = 0
+            for text, weight in zip(texts, SEARCH_WEIGHTS):
+                if term not in text:
+                    continue
+                if start not in text:
+                    score = weight
+                elif word not in text:
+                    score = 2 * weight
+                elif len(text) == len(word):
+                    score = 4 * weight
+                else:
+                    score = 3 * weight
+                if score > best:
+                    best = score
+            if not best:
+                return 0
+            total += best
+        return total
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT, offset=0):
+        """Cari lagu yang memuat semua kata di query; return (ids, total, total_exact)
+
+        Posting tiap kata dibaca bergantian dari skor tertinggi (threshold
+        algorithm). Begitu skor hasil ke-(offset+limit) tidak bisa lagi
+        dikalahkan lagu yang belum terlihat, pencarian berhenti dan total
+        hanya diestimasi dari ukuran posting list."""
+        terms = list(dict.fromkeys(query.lower().split()))
+        if not terms or limit <= 0:
+            return [], 0, True
+        forms = [term_forms(term) for term in terms]
+        k = offset + limit
+        streams = [self._stream(term) for term in terms]
+        levels = [0] * len(terms)
+        cursors = [0] * len(terms)
+        top = []      # min-heap (score, -song_id) dari k hasil terbaik
+        seen = set()
+        matched = 0
+        complete = False
+        while not complete:
+            for i, stream in enumerate(streams):
+                item = next(stream, None)
+                if item is None:
+                    # semua lagu yang cocok dengan kata ini sudah terlihat
+                    complete = True
+                    break
+                levels[i], sid = item
+                cursors[i] = sid
+                if sid in seen:
+                    continue
+                seen.add(sid)
+                score = levels[i] if len(terms) == 1 else self._score(sid, forms)
+                if not score:
+                    continue
+                matched += 1
+                if len(top) < k:
+                    heapq.heappush(top, (score, -sid))
+                elif (score, -sid) > top[0]:
+                    heapq.heapreplace(top, (score, -sid))
+            else:
+                if len(top) == k:
+                    # lagu yang belum terlihat paling tinggi mendapat sum(levels),
+                    # dan kalau seri id-nya pasti lebih besar dari semua cursor
+                    worst, worst_id = top[0][0], -top[0][1]
+                    threshold = sum(levels)
+                    if worst > threshold or (worst == threshold and worst_id <= max(cursors)):
+                        break
+        ids = [-neg for _, neg in sorted(top, reverse=True)[offset:]]
+        if complete:
+            return ids, matched, True
+        return ids, max(min(self._estimate(term) for term in terms), matched), False
+
+    def clear(self):
+        self.docs = {}
+        self.postings = {tier: [{} for _ in SEARCH_FIELDS] for tier, _ in SEARCH_TIERS}
+
+# 9. LRU Cache - Serialized Catalog Responses
+# Body JSON (dan versi gzip-nya) untuk /api/songs disimpan per versi katalog,
+# jadi polling tidak perlu menjalankan jsonify ulang selama katalog tidak berubah.
+# ETag adalah hash isi body, jadi sama di semua worker dan setelah restart.
+SONG_FIELDS = ('id', 'title', 'artist', 'duration', 'genre', 'album', 'audio_path', 'cover_path', 'covers',
+               'audio_info', 'waveform')
+HOME_FEED_SEEDS = 5
+HOME_FEED_SIZE = 12
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+class CatalogResponseCache:
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.version = None
+        self.entries = OrderedDict()   # variant -> (body, gzip_body, etag)
+        self.lock = threading.Lock()
+
+    def get(self, version, variant, build):
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            entry = self.entries.get(variant)
+            if entry is not None:
+                self.entries.move_to_end(variant)
+                return entry
+        body = encode_fragments(build())
+        entry = (body, gzip.compress(body, 6), hashlib.blake2b(body, digest_size=12).hexdigest())
+        with self.lock:
+            if version == self.version:
+                self.entries[variant] = entry
+                if len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return entry
+
+# 10. Pub/Sub - Event Hub
+# Satu ring buffer event bersama; setiap subscriber hanya menyimpan cursor
+# (seq terakhir yang sudah dikirim), jadi publish tetap O(1) berapapun
+# jumlah subscriber dan tidak ada thread tambahan per client.
+# Event user juga diteruskan lewat relay (state backend) ke worker lain;
+# event katalog dibuat sendiri oleh tiap worker saat membaca journal.
+# Server WSGI tetap memegang satu thread (atau greenlet pada worker gevent)
+# per stream yang terbuka, jadi jumlah stream per process dibatasi
+# SSE_MAX_STREAMS; di atas itu /api/events menjawab 503 dan client kembali
+# ke polling sampai sambungan berikutnya berhasil.
+EVENT_BACKLOG = 1024
+EVENT_KEEPALIVE = 15  # detik
+SSE_MAX_STREAMS = 200  # stream terbuka per process; setiap stream memegang satu thread/worker
+METRIC_HELP['musicapp_sse_streams'] = ('gauge', 'Open Server-Sent Events streams in this process')
+
+class EventHub:
+    def __init__(self, backlog=EVENT_BACKLOG):
+        self.events = deque(maxlen=backlog)   # (seq, username or None, name, data)
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.epoch = os.urandom(4).hex()   # id process ini
+        self.relay = None                  # StateBackend untuk event antar worker
+        self.relay_cursor = None
+        self.relay_handlers = {}           # name -> fn(data), event internal antar worker
+        self.streams = 0
+
+    def publish(self, name, data=None, username=None):
+        with self.cond:
+            self.seq += 1
+            self.events.append((self.seq, username, name, data or {}))
+            self.cond.notify_all()
+
+    def publish_user(self, username, name, data=None):
+        self.publish(name, data, username=username)
+        if self.relay is not None:
+            try:
+                self.relay.add_event(self.epoch, username, name, data or {})
+            except Exception as e:
+                print("Error relaying event:", e)
+
+    def notify_workers(self, name, data=None):
+        """Relay an internal event to the other workers only; it is not sent to streams"""
+        if self.relay is not None:
+            try:
+                self.relay.add_event(self.epoch, None, name, data or {})
+            except Exception as e:
+                print("Error relaying event:", e)
+
+    def on_relay(self, name, handler):
+        """Call handler(data) for events named name from other workers instead of publishing them"""
+        self.relay_handlers[name] = handler
+
+    def poll_relay(self):
+        """Publish the user events other workers relayed since the last poll"""
+        self.relay_cursor, events = self.relay.events_after(self.relay_cursor)
+        for origin, username, name, data in events:
+            if origin == self.epoch:
+                continue
+            handler = self.relay_handlers.get(name)
+            if handler:
+                try:
+                    handler(data)
+                except Exception as e:
+                    print("Error handling relayed event:", e)
+            else:
+                self.publish(name, data, username=username)
+
+    def open_stream(self, limit=SSE_MAX_STREAMS):
+        """Count a new SSE stream; False when the process already serves limit streams"""
+        with self.cond:
+            if self.streams >= limit:
+                return False
+            self.streams += 1
+            metrics.set('musicapp_sse_streams', self.streams)
+            return True
+
+    def close_stream(self):
+        with self.cond:
+            self.streams -= 1
+            metrics.set('musicapp_sse_streams', self.streams)
+
+    def event_id(self, seq):
+        """SSE id with this process' epoch, so a reconnect to another worker or after a restart is detected"""
+        return f'{self.epoch}-{seq}'
+
+    def parse_event_id(self, event_id):
+        """seq from a Last-Event-ID of this process, else None"""
+        epoch, _, seq = (event_id or '').rpartition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def wait(self, after_seq, timeout=EVENT_KEEPALIVE):
+        """Events newer than after_seq; None if after_seq already fell out of the backlog"""
+        with self.cond:
+            if self.seq <= after_seq:
+                self.cond.wait(timeout)
+            if self.events and self.events[0][0] > after_seq + 1:
+                return self.seq, None
+            pending = []
+            for event in reversed(self.events):
+                if event[0] <= after_seq:
+                    break
+                pending.append(event)
+            pending.reverse()
+            return self.seq, pending
+
+# 11. Stat Cache - Audio Streaming
+# Hasil stat (path, size, mtime, etag) file audio di-cache sebentar agar
+# request Range beruntun untuk lagu yang sama tidak stat ulang setiap chunk.
+AUDIO_STAT_TTL = 5  # detik
+AUDIO_CACHE_MAX_AGE = 7 * 24 * 3600
+
+class FileStatCache:
+    def __init__(self, folder, ttl=AUDIO_STAT_TTL, max_entries=1024):
+        self.folder = folder
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()   # filename -> (checked_at, path, size, mtime, etag)
+        self.lock = threading.Lock()
+
+    def get(self, filename):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(filename)
+            if entry and now - entry[0] < self.ttl:
+                self.entries.move_to_end(filename)
+                return entry[1:]
+        path = safe_join(self.folder, filename)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.invalidate(filename)
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        etag = f'{st.st_mtime_ns:x}-{st.st_size:x}'
+        entry = (now, path, st.st_size, st.st_mtime, etag)
+        with self.lock:
+            self.entries[filename] = entry
+            self.entries.move_to_end(filename)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry[1:]
+
+    def invalidate(self, filename):
+        with self.lock:
+            self.entries.pop(filename, None)
+
+# 12. Reference Count - Uploaded Files
+# File upload dan derivatif cover diberi nama berdasarkan hash isinya, jadi
+# lagu dengan file identik memakai file yang sama. File baru dihapus saat
+# referensi terakhirnya hilang.
+class FileRefCount:
+    def __init__(self):
+        self.counts = Counter()   # path -> jumlah lagu yang memakai
+        self.by_song = {}         # song_id -> tuple(path)
+
+    def track(self, song_id, paths):
+        """Set the files referenced by a song; return paths that became unreferenced"""
+        paths = tuple(dict.fromkeys(p for p in paths if p))
+        old = self.by_song.pop(song_id, ())
+        if paths:
+            self.by_song[song_id] = paths
+        self.counts.update(paths)
+        return self._release(old)
+
+    def release(self, song_id):
+        return self._release(self.by_song.pop(song_id, ()))
+
+    def clear(self):
+        self.counts = Counter()
+        self.by_song = {}
+
+    def _release(self, paths):
+        orphaned = []
+        for path in paths:
+            self.counts[path] -= 1
+            if self.counts[path] <= 0:
+                del self.counts[path]
+                orphaned.append(path)
+        return orphaned
+
+def song_upload_paths(song):
+    paths = [song.get('audio_path'), song.get('cover_path'), song.get('waveform')]
+    paths.extend(path for formats in (song.get('covers') or {}).values() for path in formats.values())
+    return paths
+
+def nearest_cover(covers, size, fmt):
+    """Smallest derivative at least `size` px wide, else the largest one"""
+    sizes = sorted(int(s) for s in covers)
+    if not sizes:
+        return None
+    pick = next((s for s in sizes if s >= size), sizes[-1])
+    formats = covers[str(pick)]
+    return formats.get(fmt) or next(iter(formats.values()))
+
+# === GLOBAL DATA ===
+song_catalog = SongCatalog()
+songs_library = song_catalog.songs
+songs_response_cache = CatalogResponseCache()
+home_feed_cache = CatalogResponseCache(max_entries=1)
+event_hub = EventHub()
+audio_stat_cache = FileStatCache(AUDIO_FOLDER)
+upload_refs = FileRefCount()
+cover_variants = {}   # nama file cover asli -> map covers
+catalog_lock = threading.RLock()
+media_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='media')
+title_index = TitleIndex()
+recommendation_graph = RecommendationGraph()
+colisten_graph = CoListenGraph()
+content_engine = ContentSimilarity()
+search_index = SearchIndex()
+
+# Demo users
+users = {
+    'user': {'password': 'user123', 'role': 'user'},
+    'admin': {'password': 'admin123', 'role': 'admin'}
+}
+
+# === HELPER: REBUILD DATA STRUCTURES ===
+def index_song(song):
+    """Add or refresh a single song in the title, search and recommendation indexes"""
+    if song.get('title') and song.get('artist'):
+        title_index.add_song(song)
+    else:
+        title_index.remove_song(song['id'])
+    recommendation_graph.add_song(song)
+    search_index.add_song(song)
+    if song.get('cover_path') and song.get('covers'):
+        cover_variants[song['cover_path'].rsplit('/', 1)[-1]] = song['covers']
+
+def unindex_song(song_id):
+    """Drop a song from every index; one failing index does not leave the others stale"""
+    for index in (title_index, recommendation_graph, colisten_graph, search_index):
+        try:
+            index.remove_song(song_id)
+        except Exception as e:
+            print("Error unindexing song:", e)
+
+def remove_upload(path):
+    """Delete an /uploads/... file referenced by a song; missing files are ignored"""
+    if not path:
+        return
+    if path.startswith('/uploads/audio/'):
+        folder = AUDIO_FOLDER
+    elif path.startswith('/uploads/waveforms/'):
+        folder = WAVEFORM_FOLDER
+    else:
+        folder = COVER_FOLDER
+    filename = path.rsplit('/', 1)[-1]
+    try: os.remove(os.path.join(folder, filename))
+    except OSError: pass
+    if folder == AUDIO_FOLDER:
+        audio_stat_cache.invalidate(filename)
+    elif folder == COVER_FOLDER:
+        cover_variants.pop(filename, None)
+
+def rebuild_data_structures():
+    """Rebuild title index, search index and recommendation graph from songs_library"""
+    with metrics.time('rebuild_data_structures'):
+        title_index.clear()
+        recommendation_graph.clear()
+        search_index.clear()
+        upload_refs.clear()
+        for song in songs_library:
+            index_song(song)
+            upload_refs.track(song['id'], song_upload_paths(song))
+
+# === COVER DERIVATIVES ===
+def build_cover_derivatives(cover_path):
+    """Write resized WebP/JPEG copies of a cover; returns the covers map"""
+    source = os.path.join(COVER_FOLDER, cover_path.rsplit('/', 1)[-1])
+    with open(source, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    covers = {}
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original).convert('RGB')
+        for size in COVER_SIZES:
+            image = original.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            covers[str(size)] = {}
+            for ext, fmt in COVER_FORMATS:
+                filename = f'{digest}_{size}.{ext}'
+                target = os.path.join(COVER_FOLDER, filename)
+                if not os.path.exists(target):
+                    tmp = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+                    image.save(tmp, fmt, quality=82, optimize=True)
+                    os.replace(tmp, target)
+                covers[str(size)][ext] = f'/uploads/covers/{filename}'
+    return covers
+
+def process_cover(song_id, cover_path):
+    """Background task: attach cover derivatives to a song if its cover is unchanged"""
+    try:
+        covers = build_cover_derivatives(cover_path)
+    except FileNotFoundError:
+        return
+    with catalog_write():
+        song = song_catalog.get(song_id)
+        if not song or song.get('cover_path') != cover_path:
+            return
+        song_catalog.update(song_id, {'covers': covers})
+        index_song(song)
+        for path in upload_refs.track(song_id, song_upload_paths(song)):
+            remove_upload(path)
+        save_song('update', song)
+    event_hub.publish('catalog_changed', {'version': catalog_journal.seq})
+
+# === AUDIO ANALYSIS ===
+# Setelah audio di-upload, worker membaca durasi/bitrate/tag asli dari file
+# dan membuat waveform ringkas untuk seek bar. Tag hanya mengisi field yang
+# kosong; durasi asli menggantikan durasi yang diketik manual.
+WAVEFORM_POINTS = 400
+WAVEFORM_BLOCK_SAMPLES = 2048    # sampel maksimum yang dihitung per titik
+WAVEFORM_RATE = 8000             # sample rate hasil decode ffmpeg (mono)
+WAVEFORM_HEADER = struct.Struct('<4sHI')   # magic, jumlah titik, durasi ms
+WAVEFORM_MAGIC = b'MWF1'
+WAVEFORM_CACHE_MAX_AGE = 365 * 24 * 3600
+AUDIO_TAG_FIELDS = ('title', 'artist', 'album', 'genre')
+FFMPEG = shutil.which('ffmpeg')
+
+MPEG_BITRATES = {   # (MPEG-1?, layer) -> kbps per index
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MPEG_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+ID3_TEXT_FRAMES = {'TIT2': 'title', 'TPE1': 'artist', 'TALB': 'album', 'TCON': 'genre'}
+PICTURE_EXTENSIONS = {'image/jpeg': 'jpg', 'image/jpg': 'jpg', 'image/png': 'png',
+                      'image/gif': 'gif', 'image/webp': 'webp'}
+# wave.open pada file rusak: wave.Error (bukan RIFF/PCM), EOFError/RuntimeError (header terpotong)
+WAV_ERRORS = (wave.Error, EOFError, RuntimeError)
+
+def empty_audio_metadata(fmt):
+    return {'format': fmt, 'duration': 0, 'bitrate': 0, 'sample_rate': 0, 'channels': 0,
+            'tags': {}, 'picture': None}
+
+def syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def decode_id3_text(data):
+    encoding = ('latin-1', 'utf-16', 'utf-16-be', 'utf-8')[data[0]] if data and data[0] < 4 else 'latin-1'
+    return data[1:].decode(encoding, 'replace').strip('\x00').split('\x00')[0].strip()
+
+def parse_apic(data):
+    """(image bytes, mime type, picture type) from an ID3v2.3/2.4 APIC frame"""
+    encoding = data[0]
+    end = data.index(b'\x00', 1)
+    mime = data[1:end].decode('latin-1').lower() or 'image/jpeg'
+    pic_type = data[end + 1]
+    pos = end + 2
+    if encoding in (1, 2):   # deskripsi UTF-16 diakhiri dua byte nol yang sejajar
+        while data[pos:pos + 2] != b'\x00\x00':
+            if pos >= len(data):
+                raise ValueError('Unterminated APIC description')
+            pos += 2
+        pos += 2
+    else:
+        pos = data.index(b'\x00', pos) + 1
+    return data[pos:], mime, pic_type
+
+def read_id3v2(f, meta):
+    """Parse tags and APIC from an ID3v2.3/2.4 header; returns the tag size"""
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    version, flags = header[3], header[5]
+    size = syncsafe(header[6:10]) + 10 + (10 if flags & 0x10 else 0)
+    if version not in (3, 4):
+        return size
+    body = f.read(size - 10)
+    pos = 0
+    best_picture = None
+    while pos + 10 <= len(body):
+        frame_id = body[pos:pos + 4]
+        if not frame_id.strip(b'\x00'):
+            break   # padding
+        length = syncsafe(body[pos + 4:pos + 8]) if version == 4 else int.from_bytes(body[pos + 4:pos + 8], 'big')
+        data = body[pos + 10:pos + 10 + length]
+        pos += 10 + length
+        frame_id = frame_id.decode('latin-1')
+        if frame_id in ID3_TEXT_FRAMES and data:
+            meta['tags'].setdefault(ID3_TEXT_FRAMES[frame_id], decode_id3_text(data))
+        elif frame_id == 'APIC' and data:
+            try:
+                image, mime, pic_type = parse_apic(data)
+            except (ValueError, IndexError):
+                continue
+            if best_picture is None or pic_type == 3:   # 3 = front cover
+                best_picture = (image, mime)
+    meta['picture'] = best_picture
+    return size
+
+def read_mp3(path):
+    meta = empty_audio_metadata('mp3')
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        tag_size = read_id3v2(f, meta)
+        f.seek(tag_size)
+        head = f.read(64 * 1024)
+        f.seek(max(file_size - 128, 0))
+        tail = f.read(128)
+    if tail[:3] == b'TAG':   # ID3v1 di 128 byte terakhir
+        file_size -= 128
+        for field, start in (('title', 3), ('artist', 33), ('album', 63)):
+            value = tail[start:start + 30].split(b'\x00')[0].decode('latin-1').strip()
+            if value:
+                meta['tags'].setdefault(field, value)
+    for pos in range(len(head) - 4):
+        if head[pos] != 0xFF or head[pos + 1] & 0xE0 != 0xE0:
+            continue
+        bits = int.from_bytes(head[pos:pos + 4], 'big')
+        version, layer = (bits >> 19) & 3, 4 - ((bits >> 17) & 3)
+        bitrate_index, rate_index = (bits >> 12) & 0xF, (bits >> 10) & 3
+        if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+            continue   # bukan header frame yang valid
+        mpeg1 = version == 3
+        mono = (bits >> 6) & 3 == 3
+        meta['sample_rate'] = MPEG_SAMPLE_RATES[version][rate_index]
+        meta['channels'] = 1 if mono else 2
+        bitrate = MPEG_BITRATES[(mpeg1, layer)][bitrate_index]
+        samples_per_frame = 384 if layer == 1 else (1152 if mpeg1 or layer == 2 else 576)
+        audio_bytes = file_size - tag_size - pos
+        # header VBR: Xing/Info setelah side info, VBRI di offset tetap 32
+        side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+        frames = None
+        xing = pos + 4 + side_info
+        if head[xing:xing + 4] in (b'Xing', b'Info') and len(head) >= xing + 12 and head[xing + 7] & 1:
+            frames = int.from_bytes(head[xing + 8:xing + 12], 'big')
+        elif head[pos + 36:pos + 40] == b'VBRI':
+            frames = int.from_bytes(head[pos + 50:pos + 54], 'big')
+        if frames:
+            meta['duration'] = frames * samples_per_frame / meta['sample_rate']
+            meta['bitrate'] = round(audio_bytes * 8 / meta['duration'] / 1000) if meta['duration'] else bitrate
+        else:
+            meta['duration'] = audio_bytes * 8 / (bitrate * 1000)
+            meta['bitrate'] = bitrate
+        break
+    return meta
+
+def read_flac(path):
+    meta = empty_audio_metadata('flac')
+    with open(path, 'rb') as f:
+        if f.read(4) != b'fLaC':
+            return meta
+        last = False
+        while not last:
+            header = f.read(4)
+            if len(header) < 4:
+                break
+            last, block_type = header[0] & 0x80, header[0] & 0x7F
+            data = f.read(int.from_bytes(header[1:4], 'big'))
+            if block_type == 0 and len(data) >= 18:   # STREAMINFO
+                info = int.from_bytes(data[10:18], 'big')
+                meta['sample_rate'] = info >> 44
+                meta['channels'] = ((info >> 41) & 7) + 1
+                total = info & 0xFFFFFFFFF
+                if meta['sample_rate']:
+                    meta['duration'] = total / meta['sample_rate']
+            elif block_type == 4:   # VORBIS_COMMENT, little-endian
+                pos = 4 + int.from_bytes(data[:4], 'little')
+                count = int.from_bytes(data[pos:pos + 4], 'little')
+                pos += 4
+                for _ in range(count):
+                    if pos + 4 > len(data):
+                        break   # block terpotong
+                    length = int.from_bytes(data[pos:pos + 4], 'little')
+                    key, _, value = data[pos + 4:pos + 4 + length].decode('utf-8', 'replace').partition('=')
+                    pos += 4 + length
+                    if key.lower() in AUDIO_TAG_FIELDS and value:
+                        meta['tags'].setdefault(key.lower(), value.strip())
+            elif block_type == 6 and meta['picture'] is None:   # PICTURE
+                mime_len = int.from_bytes(data[4:8], 'big')
+                mime = data[8:8 + mime_len].decode('latin-1').lower()
+                pos = 8 + mime_len
+                pos += 4 + int.from_bytes(data[pos:pos + 4], 'big') + 16
+                length = int.from_bytes(data[pos:pos + 4], 'big')
+                meta['picture'] = (data[pos + 4:pos + 4 + length], mime)
+    if meta['duration']:
+        meta['bitrate'] = round(os.path.getsize(path) * 8 / meta['duration'] / 1000)
+    return meta
+
+def read_wav(path):
+    meta = empty_audio_metadata('wav')
+    try:
+        with wave.open(path, 'rb') as w:
+            meta['sample_rate'] = w.getframerate()
+            meta['channels'] = w.getnchannels()
+            if meta['sample_rate']:
+                meta['duration'] = w.getnframes() / meta['sample_rate']
+            meta['bitrate'] = round(meta['sample_rate'] * meta['channels'] * w.getsampwidth() * 8 / 1000)
+    except WAV_ERRORS:
+        return empty_audio_metadata('wav')   # durasi diambil dari waveform ffmpeg bila bisa
+    return meta
+
+def read_with_mutagen(path):
+    audio = mutagen.File(path)
+    if audio is None:
+        return None
+    info = audio.info
+    meta = empty_audio_metadata(type(audio).__name__.lower())
+    meta['duration'] = getattr(info, 'length', 0) or 0
+    meta['bitrate'] = (getattr(info, 'bitrate', 0) or 0) // 1000
+    meta['sample_rate'] = getattr(info, 'sample_rate', 0) or 0
+    meta['channels'] = getattr(info, 'channels', 0) or 0
+    easy = mutagen.File(path, easy=True)
+    for field in AUDIO_TAG_FIELDS:
+        values = easy.get(field) if easy is not None and easy.tags is not None else None
+        if values:
+            meta['tags'][field] = str(values[0]).strip()
+    tags = audio.tags
+    pictures = list(getattr(audio, 'pictures', None) or [])   # FLAC/Ogg
+    if not pictures and tags is not None and hasattr(tags, 'getall'):
+        pictures = tags.getall('APIC')   # ID3
+    if pictures:
+        picture = next((p for p in pictures if getattr(p, 'type', 0) == 3), pictures[0])
+        meta['picture'] = (picture.data, picture.mime.lower())
+    elif tags is not None and 'covr' in tags and tags['covr']:   # MP4
+        cover = tags['covr'][0]
+        meta['picture'] = (bytes(cover), 'image/png' if cover.imageformat == 14 else 'image/jpeg')
+    return meta
+
+AUDIO_READERS = {'mp3': read_mp3, 'flac': read_flac, 'wav': read_wav}
+
+def read_audio_metadata(path):
+    """Duration, bitrate, sample rate, channels, tags and embedded picture of an audio file"""
+    ext = path.rsplit('.', 1)[-1].lower()
+    meta = None
+    if mutagen is not None:
+        try:
+            meta = read_with_mutagen(path)
+        except Exception as e:
+            print("Error reading tags with mutagen:", e)
+    if meta is None and ext in AUDIO_READERS:
+        try:
+            meta = AUDIO_READERS[ext](path)
+        except (ValueError, IndexError) as e:
+            print("Error reading audio metadata:", e)
+    return meta or empty_audio_metadata(ext)
+
+def pcm_samples(data, width):
+    """Signed PCM samples from little-endian frames of 1-4 bytes"""
+    if width == 1:   # WAV 8-bit unsigned
+        data = data.translate(bytes((x + 128) & 0xFF for x in range(256)))
+        samples = array('b', data)
+    elif width == 3:  # ambil 2 byte atas setiap sampel 24-bit
+        top = bytearray(len(data) // 3 * 2)
+        top[0::2] = data[1::3]
+        top[1::2] = data[2::3]
+        samples = array('h', top)
+    else:
+        samples = array('h' if width == 2 else 'i', data[:len(data) - len(data) % width])
+    if sys.byteorder == 'big' and samples.itemsize > 1:
+        samples.byteswap()
+    return samples
+
+def pcm_levels(samples, full_scale):
+    """(peak, rms) of a block of samples, scaled to 0-255"""
+    if len(samples) > WAVEFORM_BLOCK_SAMPLES:
+        samples = samples[::len(samples) // WAVEFORM_BLOCK_SAMPLES]
+    if not samples:
+        return 0, 0
+    peak = max(max(samples), -min(samples))
+    rms = math.sqrt(sum(x * x for x in samples) / len(samples))
+    return min(255, round(peak * 255 / full_scale)), min(255, round(rms * 255 / full_scale))
+
+def encode_waveform(levels, duration):
+    """Blob: header (magic, points, duration ms) + peak bytes + rms bytes"""
+    return (WAVEFORM_HEADER.pack(WAVEFORM_MAGIC, len(levels), round(duration * 1000))
+            + bytes(p for p, _ in levels) + bytes(r for _, r in levels))
+
+def wav_waveform(path, points=WAVEFORM_POINTS):
+    with wave.open(path, 'rb') as w:
+        width, frames, rate = w.getsampwidth(), w.getnframes(), w.getframerate()
+        full_scale = 1 << (15 if width == 3 else 8 * min(width, 4) - 1)
+        points = min(points, frames)
+        levels = [pcm_levels(pcm_samples(w.readframes((i + 1) * frames // points - i * frames // points), width),
+                             full_scale)
+                  for i in range(points)]
+    return encode_waveform(levels, frames / rate if rate else 0)
+
+def ffmpeg_waveform(path, points=WAVEFORM_POINTS):
+    """Decode any format to mono PCM with ffmpeg, then reduce it like a WAV"""
+    result = subprocess.run(
+        [FFMPEG, '-v', 'error', '-i', path, '-ac', '1', '-ar', str(WAVEFORM_RATE), '-f', 's16le', '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=120, check=True)
+    samples = pcm_samples(result.stdout, 2)
+    total = len(samples)
+    points = min(points, total)
+    levels = [pcm_levels(samples[i * total // points:(i + 1) * total // points], 1 << 15) for i in range(points)]
+    return encode_waveform(levels, len(samples) / WAVEFORM_RATE)
+
+def build_waveform(path):
+    """Waveform blob for an audio file, or None when it cannot be decoded here"""
+    if path.lower().endswith('.wav'):
+        try:
+            return wav_waveform(path)
+        except WAV_ERRORS:
+            pass   # bukan PCM atau rusak; coba ffmpeg
+    if FFMPEG:
+        try:
+            return ffmpeg_waveform(path)
+        except subprocess.CalledProcessError:
+            return None   # ffmpeg juga tidak bisa decode; mengulang job tidak akan membantu
+    return None
+
+def store_waveform(blob):
+    filename = f'{hashlib.sha256(blob).hexdigest()[:16]}.wf'
+    target = os.path.join(WAVEFORM_FOLDER, filename)
+    if not os.path.exists(target):
+        tmp = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, target)
+    return f'/uploads/waveforms/{filename}'
+
+def store_embedded_cover(picture):
+    image, mime = picture
+    ext = PICTURE_EXTENSIONS.get(mime)
+    if not ext or not image or len(image) > MAX_IMAGE_SIZE:
+        return None
+    filename = f'{hashlib.sha256(image).hexdigest()}.{ext}'
+    target = os.path.join(COVER_FOLDER, filename)
+    if not os.path.exists(target):
+        tmp = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(image)
+        os.replace(tmp, target)
+    return f'/uploads/covers/{filename}'
+
+def process_audio(song_id, audio_path):
+    """Background task: attach real audio metadata and a waveform to a song if its audio is unchanged.
+
+    Returns the cover path taken from the file's embedded picture, if one was stored.
+    """
+    source = os.path.join(AUDIO_FOLDER, audio_path.rsplit('/', 1)[-1])
+    try:
+        with metrics.time('audio_analysis'):
+            meta = read_audio_metadata(source)
+            blob = build_waveform(source)
+    except FileNotFoundError:
+        return None
+    if not meta['duration'] and blob:   # format tanpa parser: pakai panjang hasil decode
+        meta['duration'] = WAVEFORM_HEADER.unpack_from(blob)[2] / 1000
+    with catalog_write():
+        song = song_catalog.get(song_id)
+        if not song or song.get('audio_path') != audio_path:
+            return None
+        fields = {'audio_info': {k: meta[k] for k in ('format', 'bitrate', 'sample_rate', 'channels')}}
+        fields['audio_info']['duration'] = round(meta['duration'], 3)
+        if meta['duration']:
+            fields['duration'] = round(meta['duration'])
+        for field, value in meta['tags'].items():
+            if value and not song.get(field):
+                fields[field] = value
+        if blob:
+            fields['waveform'] = store_waveform(blob)
+        if meta['picture'] and not song.get('cover_path'):
+            cover_path = store_embedded_cover(meta['picture'])
+            if cover_path:
+                fields['cover_path'] = cover_path
+                fields['covers'] = {}
+        song_catalog.update(song_id, fields)
+        index_song(song)
+        for path in upload_refs.track(song_id, song_upload_paths(song)):
+            remove_upload(path)
+        save_song('update', song)
+    event_hub.publish('catalog_changed', {'version': catalog_journal.seq})
+    return fields.get('cover_path')
+
+# === PERSISTENSI DATA ===
+# Katalog disimpan sebagai snapshot + journal append-only. Setiap perubahan
+# ditulis sebagai satu baris JSON di journal (fsync dikelompokkan oleh thread
+# flusher), lalu secara berkala journal dipadatkan menjadi snapshot baru.
+# Semua worker process menulis ke journal yang sama di bawah flock; sebelum
+# menulis, worker menerapkan dulu record dari worker lain sehingga seq tetap
+# berurutan, dan worker yang hanya membaca mengikuti journal lewat offset.
+DATA_DIR = 'data'
+SNAPSHOT_FILE = os.path.join(DATA_DIR, 'catalog.snapshot.json')
+JOURNAL_FILE = os.path.join(DATA_DIR, 'catalog.journal')
+LEGACY_DATA_FILE = 'songs_data.json'
+JOURNAL_FSYNC_INTERVAL = 0.05   # detik
+JOURNAL_COMPACT_RECORDS = 10000
+JOURNAL_COMPACT_INTERVAL = 300  # detik
+JOURNAL_COMPACT_RETRY = 30      # detik, jeda sebelum compaction yang gagal dicoba lagi
+JOURNAL_DURABLE_TIMEOUT = 5     # detik
+
+class JournalTimeout(Exception):
+    """A journal record was not fsynced in time; the change is applied but may not survive a crash"""
+
+class CatalogJournal:
+    def __init__(self, snapshot_file, journal_file, apply=None):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.rotated_file = journal_file + '.old'   # sisa compaction versi lama
+        self.lock_file = journal_file + '.lock'
+        self.apply = apply        # fungsi(records) untuk record dari worker lain
+        self.seq = 0              # seq record terakhir yang ditulis atau diterapkan
+        self.synced_seq = 0       # seq terakhir yang sudah di-fsync
+        self.records = 0          # record sejak snapshot terakhir
+        self.last_compaction = time.monotonic()
+        self.retry_at = 0         # compaction gagal: jangan coba lagi sebelum ini
+        self.compacting = False
+        self.file = None
+        self.reader = None        # fd baca untuk mengikuti journal
+        self.read_ino = None
+        self.read_offset = 0
+        self.lock_fd = None
+        self.lock_depth = 0
+        self.cond = threading.Condition()
+
+    # --- recovery ---
+    def exists(self):
+        return any(os.path.exists(p) for p in (self.snapshot_file, self.journal_file, self.rotated_file))
+
+    def recover(self):
+        """Snapshot songs plus every journal record after it, in order; call inside locked()"""
+        songs_by_id, snapshot_seq = {}, 0
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            snapshot_seq = snapshot['seq']
+            songs_by_id = {song['id']: song for song in snapshot['songs']}
+        self.seq = snapshot_seq
+        self.records = 0
+        for path in (self.rotated_file, self.journal_file):
+            for record in self._read_records(path):
+                if record['seq'] <= snapshot_seq:
+                    continue
+                apply_journal_record(songs_by_id, record)
+                self.seq = record['seq']
+                self.records += 1
+        self.synced_seq = self.seq
+        songs = list(songs_by_id.values())
+        self._close_reader()
+        try:
+            st = os.stat(self.journal_file)
+            self.read_ino, self.read_offset = st.st_ino, st.st_size
+        except FileNotFoundError:
+            self.read_ino, self.read_offset = None, 0
+        if os.path.exists(self.rotated_file):
+            # compaction versi lama terputus: .old sudah ikut di-replay, jadi
+            # simpan hasilnya sebagai snapshot lalu buang .old
+            try:
+                self.write_snapshot(songs, self.seq)
+                os.remove(self.rotated_file)
+                self._replace_journal(self.read_offset)
+                self.records = 0
+            except OSError as e:
+                print("Error folding rotated catalog journal:", e)
+        return songs
+
+    def _read_records(self, path):
+        if not os.path.exists(path):
+            return
+        good_offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # baris terakhir terpotong saat crash
+                good_offset += len(line)
+                yield record
+        if good_offset < os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+
+    # --- worker lain ---
+    @contextmanager
+    def locked(self):
+        """Exclusive journal lock shared by every worker process; call with catalog_lock held"""
+        if self.lock_depth == 0 and fcntl is not None:
+            if self.lock_fd is None:
+                os.makedirs(os.path.dirname(self.lock_file) or '.', exist_ok=True)
+                self.lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+        self.lock_depth += 1
+        try:
+            yield
+        finally:
+            self.lock_depth -= 1
+            if self.lock_depth == 0 and fcntl is not None:
+                fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def changed(self):
+        """One stat: has the journal moved past what this process has read?"""
+        try:
+            st = os.stat(self.journal_file)
+        except FileNotFoundError:
+            return False
+        return st.st_ino != self.read_ino or st.st_size != self.read_offset
+
+    def catch_up(self, exclusive=False):
+        """Apply the records other workers appended since the last call; call with catalog_lock held.
+
+        Outside locked() a half-written last line is left for the next call;
+        inside it (exclusive) that line can only be a torn write and is cut off.
+        """
+        records = []
+        gap = False
+        while True:
+            if self.reader is None:
+                try:
+                    self.reader = open(self.journal_file, 'rb')
+                except FileNotFoundError:
+                    break
+                ino = os.fstat(self.reader.fileno()).st_ino
+                if ino != self.read_ino:
+                    self.read_ino, self.read_offset = ino, 0
+            try:
+                replaced = os.stat(self.journal_file).st_ino != self.read_ino
+            except FileNotFoundError:
+                replaced = True
+            # file lama (sudah diganti compaction) tetap dibaca sampai habis lewat fd-nya
+            gap = self._read_new(records, exclusive and not replaced) or gap
+            if not replaced:
+                break
+            self._close_reader()
+            self.read_ino, self.read_offset = None, 0
+        if gap:
+            # tertinggal lebih dari satu compaction: muat ulang dari snapshot
+            with self.locked():
+                songs = self.recover()
+            records = [{'seq': self.seq, 'op': 'load', 'songs': songs}]
+        if exclusive and self.file is not None and os.fstat(self.file.fileno()).st_ino != self.read_ino:
+            with self.cond:
+                self.file.close()
+                self.file = open(self.journal_file, 'ab')
+        if records and self.apply:
+            self.apply(records)
+        return records
+
+    def _read_new(self, records, truncate):
+        """Read complete lines after read_offset into records; True when seqs are missing"""
+        self.reader.seek(self.read_offset)
+        for line in self.reader:
+            if not line.endswith(b'\n'):
+                if truncate:
+                    os.truncate(self.journal_file, self.read_offset)
+                break
+            self.read_offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                print("Error reading catalog journal record:", e)
+                continue
+            if record['seq'] <= self.seq:
+                continue   # record sendiri atau sudah ada di snapshot
+            if record['seq'] != self.seq + 1:
+                return True
+            with self.cond:
+                self.seq = record['seq']
+                self.records += len(record.get('songs', ())) + len(record.get('deleted', ())) or 1
+            records.append(record)
+        return False
+
+    def _close_reader(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    # --- writing ---
+    def open(self):
+        os.makedirs(os.path.dirname(self.journal_file) or '.', exist_ok=True)
+        self.file = open(self.journal_file, 'ab')
+        threading.Thread(target=self._flush_loop, name='journal-flusher', daemon=True).start()
+
+    def append(self, op, weight=1, **payload):
+        """Append one mutation inside locked(); returns its seq for wait_durable().
+
+        weight counts toward compaction, so a batch of n songs weighs n.
+        """
+        with self.cond:
+            self.seq += 1
+            payload.update({'seq': self.seq, 'op': op})
+            self.file.write(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+            self.file.flush()
+            self.records += weight
+            self.cond.notify_all()
+            return self.seq
+
+    def wait_durable(self, seq, timeout=JOURNAL_DURABLE_TIMEOUT):
+        """Block until seq is fsynced; raises JournalTimeout after timeout seconds"""
+        with metrics.time('journal_wait_durable'), self.cond:
+            if not self.cond.wait_for(lambda: self.synced_seq >= seq, timeout):
+                raise JournalTimeout(f'Catalog change {seq} was applied but is not on disk yet')
+
+    def _flush_loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.seq > self.synced_seq, JOURNAL_COMPACT_INTERVAL)
+            time.sleep(JOURNAL_FSYNC_INTERVAL)  # kumpulkan beberapa append dalam satu fsync
+            try:
+                self.sync()
+            except OSError as e:
+                print("Error syncing catalog journal:", e)
+                continue
+            if self.records and time.monotonic() >= self.retry_at and (
+                    self.records >= JOURNAL_COMPACT_RECORDS or
+                    time.monotonic() - self.last_compaction >= JOURNAL_COMPACT_INTERVAL):
+                try:
+                    self.compact()
+                except OSError as e:
+                    print("Error compacting catalog journal:", e)
+                    self.retry_at = time.monotonic() + JOURNAL_COMPACT_RETRY
+
+    def sync(self):
+        with metrics.time('journal_fsync'), self.cond:
+            seq = self.seq
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.synced_seq = seq
+            self.cond.notify_all()
+
+    # --- compaction ---
+    def compact(self):
+        """Write a snapshot of the catalog and drop the journal records it covers"""
+        with metrics.time('journal_compact'):
+            self._compact()
+
+    def _compact(self):
+        with catalog_lock:
+            if self.compacting:
+                return
+            self.compacting = True
+        try:
+            with self._compaction_lock() as acquired:
+                if acquired:   # selain itu worker lain sedang compaction
+                    self._compact_locked()
+        finally:
+            self.last_compaction = time.monotonic()
+            self.compacting = False
+
+    def _compact_locked(self):
+        # 1. titik potong: seq dan offset journal saat snapshot diambil
+        with catalog_lock, self.locked():
+            self.catch_up(exclusive=True)
+            snapshot_seq, cut, ino, compacted = self.seq, self.read_offset, self.read_ino, self.records
+            songs = [dict(song) for song in songs_library]
+        # 2. snapshot ditulis tanpa menahan lock, worker lain tetap bisa menulis
+        try:
+            self.write_snapshot(songs, snapshot_seq)
+        except Exception as e:
+            print("Error compacting catalog journal:", e)
+            self.retry_at = time.monotonic() + JOURNAL_COMPACT_RETRY
+            return
+        # 3. ganti journal dengan record setelah titik potong
+        with catalog_lock, self.locked():
+            self.catch_up(exclusive=True)
+            if self.read_ino == ino:
+                self._replace_journal(cut)
+                self.records = max(self.records - compacted, 0)
+        self.retry_at = 0
+
+    @contextmanager
+    def _compaction_lock(self):
+        """Non-blocking lock so only one worker compacts at a time; yields whether it was taken"""
+        if fcntl is None:
+            yield True
+            return
+        fd = os.open(self.snapshot_file + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+            except BlockingIOError:
+                acquired = False
+            yield acquired
+        finally:
+            os.close(fd)
+
+    def _replace_journal(self, cut):
+        """Atomically replace the journal with its bytes after offset cut; call inside locked()"""
+        try:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(cut)
+                tail = f.read()
+        except FileNotFoundError:
+            tail = b''
+        tmp = f'{self.journal_file}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal_file)
+        # worker lain melihat inode baru dan pindah setelah membaca sisa file lama
+        with self.cond:
+            if self.file is not None:
+                self.file.close()
+                self.file = open(self.journal_file, 'ab')
+        self._close_reader()
+        self.read_ino, self.read_offset = os.stat(self.journal_file).st_ino, len(tail)
+
+    def write_snapshot(self, songs, seq):
+        tmp = f'{self.snapshot_file}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'seq': seq, 'songs': songs}, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_file)
+
+    def close(self):
+        if self.file and not self.file.closed:
+            self.sync()
+            self.file.close()
+        self._close_reader()
+
+def apply_journal_record(songs_by_id, record):
+    op = record['op']
+    if op in ('add', 'update'):
+        songs_by_id[record['song']['id']] = record['song']
+    elif op == 'delete':
+        songs_by_id.pop(record['id'], None)
+    elif op == 'batch':   # satu baris = semua atau tidak sama sekali saat recovery
+        for song in record['songs']:
+            songs_by_id[song['id']] = song
+        for song_id in record['deleted']:
+            songs_by_id.pop(song_id, None)
+
+def apply_catalog_records(records):
+    """Bring the catalog and indexes up to date with records journaled by other workers"""
+    for record in records:
+        op = record['op']
+        if op == 'load':   # tertinggal terlalu jauh: katalog lengkap dari recover()
+            song_catalog.load(record['songs'])
+            rebuild_data_structures()
+            continue
+        songs = [record['song']] if op in ('add', 'update') else record.get('songs', [])
+        deleted = [record['id']] if op == 'delete' else record.get('deleted', [])
+        changed = [(song['id'], song) for song in songs if song_catalog.get(song['id'])]
+        if changed:
+            song_catalog.update_many(changed)
+        for song in songs:
+            if song_catalog.get(song['id']) is None:
+                song_catalog.add(song)
+            song = song_catalog.get(song['id'])
+            index_song(song)
+            upload_refs.track(song['id'], song_upload_paths(song))   # file sudah diurus worker penulis
+        for song in song_catalog.remove_many(deleted):
+            unindex_song(song['id'])
+            upload_refs.release(song['id'])
+    event_hub.publish('catalog_changed', {'version': records[-1]['seq']})
+
+catalog_journal = CatalogJournal(SNAPSHOT_FILE, JOURNAL_FILE, apply_catalog_records)
+atexit.register(catalog_journal.close)
+
+@app.errorhandler(JournalTimeout)
+def journal_timeout(e):
+    count_exception(e)
+    return jsonify({'error': str(e)}), 503
+
+@contextmanager
+def catalog_write():
+    """catalog_lock plus the cross-worker journal lock, with the catalog caught up first"""
+    with catalog_lock, catalog_journal.locked():
+        catalog_journal.catch_up(exclusive=True)
+        yield
+
+def refresh_catalog():
+    """Apply catalog changes journaled by other workers; skipped while this worker is writing"""
+    if catalog_journal.changed() and catalog_lock.acquire(blocking=False):
+        try:
+            catalog_journal.catch_up()
+        finally:
+            catalog_lock.release()
+
+@app.before_request
+def refresh_catalog_before_request():
+    refresh_catalog()
+
+def save_song(op, song):
+    """Journal an added or updated song; returns the seq to wait on"""
+    with metrics.time('journal_append'):
+        return catalog_journal.append(op, song=song)
+
+def save_song_deleted(song_id):
+    with metrics.time('journal_append'):
+        return catalog_journal.append('delete', id=song_id)
+
+def save_songs_batch(songs, deleted=()):
+    """Journal many added/updated songs and deletions as one record"""
+    with metrics.time('journal_append'):
+        return catalog_journal.append('batch', weight=max(len(songs) + len(deleted), 1),
+                                      songs=list(songs), deleted=list(deleted))
+
+def load_songs():
+    try:
+        if catalog_journal.exists():
+            song_catalog.load(catalog_journal.recover())
+        elif os.path.exists(LEGACY_DATA_FILE):
+            # Migrasi satu kali dari songs_data.json lama
+            with open(LEGACY_DATA_FILE, 'r', encoding='utf-8') as f:
+                song_catalog.load(json.load(f))
+            os.makedirs(DATA_DIR, exist_ok=True)
+            catalog_journal.write_snapshot(songs_library, 0)
+
+        # Rebuild data structures after loading
+        rebuild_data_structures()
+
+    except Exception as e:
+        print("Error loading songs:", e)
+
+# === USER STATE STORE ===
+# Playlist, favorit, antrean, dan history disimpan di backend bersama agar
+# beberapa worker process melihat state yang sama. Setiap key punya versi;
+# worker menyimpan objek hasil decode dan hanya membaca ulang jika versi di
+# backend berubah. History disimpan utuh per key; playlist dan favorit
+# disimpan per baris (satu baris per lagu dengan prev/next), antrean satu
+# baris per entry dengan posisinya, sehingga edit hanya menulis baris yang
+# berubah.
+STATE_DB_FILE = os.path.join(DATA_DIR, 'user_state.db')
+
+class StateBackend(ABC):
+    """Versioned key -> JSON value store plus the event relay between workers.
+
+    SQLiteStateBackend is the default; a Redis-compatible backend can
+    implement the same methods (GET/SET/INCR for values and versions,
+    HGETALL/HSET/HDEL for rows, SCAN for keys, a SET NX lock for lock()
+    and a capped stream with XADD/XRANGE for the events).
+    """
+    @abstractmethod
+    def get(self, key):
+        """Return (version, value); (0, None) for a missing key"""
+
+    @abstractmethod
+    def version(self, key):
+        pass
+
+    @abstractmethod
+    def put(self, key, value):
+        """Store value and return the new version; call inside lock()"""
+
+    @abstractmethod
+    def get_rows(self, key):
+        """Return (version, {field: value}) for a key stored as rows"""
+
+    @abstractmethod
+    def put_rows(self, key, rows, deleted=()):
+        """Delete fields, then upsert rows, and return the new version; call inside lock()"""
+
+    @abstractmethod
+    def count_rows(self, prefix, parts):
+        """Number of rows whose field has `parts` elements, over every key starting with prefix"""
+
+    @abstractmethod
+    def value_keys(self, prefix):
+        """Keys starting with prefix that still hold a whole value instead of rows"""
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def keys(self, prefix):
+        pass
+
+    @abstractmethod
+    def lock(self, key):
+        """Context manager giving exclusive write access across processes"""
+
+    @abstractmethod
+    def add_event(self, origin, username, name, data):
+        """Relay a user event to the other workers; only the last EVENT_BACKLOG are kept"""
+
+    @abstractmethod
+    def events_after(self, event_id):
+        """(last_id, [(origin, username, name, data)]) newer than event_id; None starts at the newest"""
+
+class SQLiteStateBackend(StateBackend):
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, version INTEGER NOT NULL, value TEXT NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS rows (key TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, '
+                     'PRIMARY KEY (key, field)) WITHOUT ROWID')
+        conn.execute('CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, '
+                     'username TEXT, name TEXT NOT NULL, data TEXT NOT NULL)')
+
+    def _conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.depth = 0
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute('SELECT version, value FROM kv WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return 0, None
+        return row[0], json.loads(row[1])
+
+    def version(self, key):
+        row = self._conn().execute('SELECT version FROM kv WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
+
+    def put(self, key, value):
+        conn = self._conn()
+        conn.execute(
+            'INSERT INTO kv (key, version, value) VALUES (?, 1, ?) '
+            'ON CONFLICT(key) DO UPDATE SET version = version + 1, value = excluded.value',
+            (key, json.dumps(value, ensure_ascii=False, separators=(',', ':'))))
+        return self.version(key)
+
+    def get_rows(self, key):
+        conn = self._conn()
+        with self.lock(key) if self.local.depth else self._snapshot(conn):
+            version = self.version(key)
+            rows = conn.execute('SELECT field, value FROM rows WHERE key = ?', (key,)).fetchall()
+        return version, {field: json.loads(value) for field, value in rows}
+
+    def put_rows(self, key, rows, deleted=()):
+        conn = self._conn()
+        conn.executemany('DELETE FROM rows WHERE key = ? AND field = ?', [(key, field) for field in deleted])
+        conn.executemany(
+            'INSERT INTO rows (key, field, value) VALUES (?, ?, ?) '
+            'ON CONFLICT(key, field) DO UPDATE SET value = excluded.value',
+            [(key, field, json.dumps(value, ensure_ascii=False, separators=(',', ':'))) for field, value in rows.items()])
+        # baris kv tetap ada untuk versi dan keys(); value lama (blob) tidak dipakai lagi
+        conn.execute(
+            "INSERT INTO kv (key, version, value) VALUES (?, 1, 'null') "
+            "ON CONFLICT(key) DO UPDATE SET version = version + 1, value = 'null'", (key,))
+        return self.version(key)
+
+    def count_rows(self, prefix, parts):
+        return self._conn().execute(
+            'SELECT COUNT(*) FROM rows WHERE key >= ? AND key < ? AND json_array_length(field) = ?',
+            (prefix, prefix + '\uffff', parts)).fetchone()[0]
+
+    def value_keys(self, prefix):
+        rows = self._conn().execute(
+            "SELECT key FROM kv WHERE key >= ? AND key < ? AND value != 'null'", (prefix, prefix + '\uffff')).fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+        conn.execute('DELETE FROM rows WHERE key = ?', (key,))
+
+    def keys(self, prefix):
+        rows = self._conn().execute(
+            'SELECT key FROM kv WHERE key >= ? AND key < ?', (prefix, prefix + '\uffff')).fetchall()
+        return [row[0] for row in rows]
+
+    def add_event(self, origin, username, name, data):
+        conn = self._conn()
+        with self.lock('events'):
+            cursor = conn.execute('INSERT INTO events (origin, username, name, data) VALUES (?, ?, ?, ?)',
+                                  (origin, username, name, json.dumps(data, ensure_ascii=False)))
+            conn.execute('DELETE FROM events WHERE id <= ?', (cursor.lastrowid - EVENT_BACKLOG,))
+
+    def events_after(self, event_id):
+        conn = self._conn()
+        if event_id is None:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0], []
+        rows = conn.execute('SELECT id, origin, username, name, data FROM events WHERE id > ? ORDER BY id',
+                            (event_id,)).fetchall()
+        if not rows:
+            return event_id, []
+        return rows[-1][0], [(origin, username, name, json.loads(data)) for _, origin, username, name, data in rows]
+
+    @contextmanager
+    def _snapshot(self, conn):
+        """Read transaction so the version and rows come from the same commit"""
+        conn.execute('BEGIN')
+        try:
+            yield
+        finally:
+            conn.execute('COMMIT')
+
+    @contextmanager
+    def lock(self, key):
+        conn = self._conn()
+        if self.local.depth == 0:
+            conn.execute('BEGIN IMMEDIATE')
+        self.local.depth += 1
+        try:
+            yield
+        except BaseException:
+            self.local.depth -= 1
+            if self.local.depth == 0:
+                conn.execute('ROLLBACK')
+            raise
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            conn.execute('COMMIT')
+
+def playlists_from_state(state):
+    return {name: Playlist.from_state(songs) for name, songs in (state or {}).items()}
+
+def row_field(*parts):
+    return json.dumps(parts, ensure_ascii=False, separators=(',', ':'))
+
+def playlist_rows(playlist, prefix=(), full=False):
+    """(rows, deleted fields) for the songs whose links changed; every song when full"""
+    links, removed = playlist.take_changes()
+    if full:
+        links, removed = {i: playlist.links(i) for i in playlist.nodes}, []
+    rows = {row_field(*prefix, i): link for i, link in links.items()}
+    return rows, [row_field(*prefix, i) for i in removed]
+
+class FavoritesRows:
+    """favorites:<user> as one row per song: '[song_id]' -> [prev_id, next_id]"""
+    legacy = staticmethod(Playlist.from_state)
+
+    @staticmethod
+    def decode(rows):
+        return Playlist.from_links({json.loads(field)[0]: link for field, link in rows.items()})
+
+    copy = staticmethod(Playlist.copy)
+
+    @staticmethod
+    def begin(playlist):
+        return playlist
+
+    @staticmethod
+    def changes(old, playlist):
+        return playlist_rows(playlist, full=old is None)
+
+class PlaylistsRows:
+    """playlists:<user> as rows: '[name]' -> {'created': t} and '[name, song_id]' -> [prev_id, next_id]"""
+    legacy = staticmethod(playlists_from_state)
+
+    @staticmethod
+    def decode(rows):
+        created, links = {}, {}
+        for field, value in rows.items():
+            parts = json.loads(field)
+            if len(parts) == 1:
+                created[parts[0]] = value['created']
+            else:
+                links.setdefault(parts[0], {})[parts[1]] = value
+        return {name: Playlist.from_links(links.get(name, {}))
+                for name in sorted(created, key=lambda name: (created[name], name))}
+
+    @staticmethod
+    def copy(playlists):
+        return {name: playlist.copy() for name, playlist in playlists.items()}
+
+    @staticmethod
+    def begin(playlists):
+        # dict lama tetap utuh agar changes() bisa melihat playlist yang dihapus
+        return dict(playlists)
+
+    @staticmethod
+    def changes(old, playlists):
+        rows, deleted = {}, []
+        old = old or {}
+        for name, playlist in old.items():
+            if playlists.get(name) is not playlist:   # dihapus atau diganti objek baru
+                deleted.append(row_field(name))
+                deleted.extend(row_field(name, i) for i in playlist.nodes.keys() | playlist.dirty)
+        for name, playlist in playlists.items():
+            full = old.get(name) is not playlist
+            if full:
+                rows[row_field(name)] = {'created': time.time()}
+            changed, removed = playlist_rows(playlist, (name,), full)
+            rows.update(changed)
+            deleted.extend(removed)
+        return rows, deleted
+
+class QueueRows:
+    """queue:<user> as rows: '["meta"]' -> {next_entry_id, current} and '[entry_id]' -> [position, song_id]"""
+    legacy = staticmethod(SongQueue.from_state)
+    META = row_field('meta')
+
+    @staticmethod
+    def decode(rows):
+        meta = rows.pop(QueueRows.META, None)
+        return SongQueue.from_rows(meta, {json.loads(field)[0]: entry for field, entry in rows.items()})
+
+    copy = staticmethod(SongQueue.copy)
+
+    @staticmethod
+    def begin(queue):
+        return queue
+
+    @staticmethod
+    def changes(old, queue):
+        changed, removed = queue.take_changes()
+        if old is None:
+            changed, removed = {e: [queue.positions[e], s] for e, s in queue.entries.items()}, []
+        rows = {row_field(e): entry for e, entry in changed.items()}
+        if queue.meta_dirty or old is None:
+            rows[QueueRows.META] = queue.meta()
+            queue.meta_dirty = False
+        return rows, [row_field(e) for e in removed]
+
+# kind -> (decode, encode) untuk key yang disimpan utuh
+STATE_KINDS = {
+    'history': (HistoryStack.from_state, HistoryStack.to_state),
+}
+
+# kind -> codec untuk key yang disimpan per baris
+ROW_KINDS = {
+    'favorites': FavoritesRows,
+    'playlists': PlaylistsRows,
+    'queue': QueueRows,
+}
+
+class UserStateStore:
+    def __init__(self, backend, kinds=STATE_KINDS, row_kinds=ROW_KINDS):
+        self.backend = backend
+        self.kinds = kinds
+        self.row_kinds = row_kinds
+        # key -> (version, objek kerja edit() atau None, stored_as_rows, snapshot pembaca atau None)
+        self.cache = {}
+        self.key_locks = {}   # key -> RLock: edit() dan pembuatan snapshot
+        self.lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.RLock())
+
+    def _read(self, kind, key):
+        if kind not in self.row_kinds:
+            version, value = self.backend.get(key)
+            return version, self.kinds[kind][0](value), False
+        codec = self.row_kinds[kind]
+        version, rows = self.backend.get_rows(key)
+        if not rows:
+            _, value = self.backend.get(key)
+            if value is not None:   # blob format lama: ditulis ulang sebagai baris pada edit berikutnya
+                return version, codec.legacy(value), False
+        return version, codec.decode(rows), True
+
+    def _snapshot(self, kind, key, cached):
+        """Reader copy of the object edit() works on, made once per version; None if it changed meanwhile"""
+        with self._key_lock(key):   # tidak ada edit() yang sedang mengubah objek kerja
+            if self.cache.get(key) is not cached:
+                return None
+            snapshot = self.row_kinds[kind].copy(cached[1])
+            with self.lock:
+                self.cache[key] = cached[:3] + (snapshot,)
+        return snapshot
+
+    def load(self, kind, username):
+        """Current state; a snapshot that edit() never changes, so treat it as read-only"""
+        key = f'{kind}:{username}'
+        cached = self.cache.get(key)
+        if cached and cached[0] == self.backend.version(key):
+            snapshot = cached[3] if cached[3] is not None else self._snapshot(kind, key, cached)
+            if snapshot is not None:
+                return snapshot
+        version, obj, stored = self._read(kind, key)
+        with self.lock:
+            self.cache[key] = (version, None, stored, obj)
+        return obj
+
+    @contextmanager
+    def edit(self, kind, username):
+        """Yield the state to change; it is written back when the block exits.
+
+        Whole-value kinds get a fresh copy. Row kinds edit a cached working
+        object under the backend lock and only the changed rows are written;
+        readers get snapshots from load(), never the working object.
+        """
+        key = f'{kind}:{username}'
+        if kind not in self.row_kinds:
+            decode, encode = self.kinds[kind]
+            with self.backend.lock(key):
+                _, value = self.backend.get(key)
+                obj = decode(value)
+                yield obj
+                version = self.backend.put(key, encode(obj))
+            with self.lock:
+                self.cache[key] = (version, None, False, obj)
+            return
+
+        codec = self.row_kinds[kind]
+        try:
+            with self.backend.lock(key), self._key_lock(key):
+                version = self.backend.version(key)
+                cached = self.cache.get(key)
+                if not cached or cached[0] != version:
+                    cached = self._read(kind, key) + (None,)
+                version, current, stored, snapshot = cached
+                if current is None:   # baru dibaca lewat load(): objeknya milik pembaca
+                    current = codec.copy(snapshot)
+                obj = codec.begin(current)
+                yield obj
+                rows, deleted = codec.changes(current if stored else None, obj)
+                if rows or deleted or not stored:   # blob lama selalu diganti baris
+                    version = self.backend.put_rows(key, rows, deleted)
+                    snapshot = None
+                with self.lock:
+                    self.cache[key] = (version, obj, True, snapshot)
+        except BaseException:
+            # objek kerja mungkin sudah setengah berubah
+            with self.lock:
+                self.cache.pop(key, None)
+            raise
+
+    def usernames(self, kind):
+        return [key.split(':', 1)[1] for key in self.backend.keys(f'{kind}:')]
+
+    def count_playlists(self):
+        """Playlists of every user: one '[name]' row each, without decoding any playlist"""
+        total = self.backend.count_rows('playlists:', 1)
+        for key in self.backend.value_keys('playlists:'):   # blob lama yang belum jadi baris
+            total += len(self.backend.get(key)[1] or {})
+        return total
+
+user_state = UserStateStore(SQLiteStateBackend(STATE_DB_FILE))
+event_hub.relay = user_state.backend
+
+# === PLAY EVENT LOG ===
+# Setiap pemutaran ditambahkan ke log biner append-only (satu os.write per
+# event pada fd O_APPEND, aman dipakai beberapa worker). Agregat di memori
+# diperbarui di background (worker-sync) dan saat statistik diminta dengan
+# membaca bagian log yang belum diproses, lalu disimpan
+# sebagai checkpoint {offset, agregat} agar startup tidak perlu scan ulang.
+PLAY_LOG_FILE = os.path.join(DATA_DIR, 'plays.log')
+PLAY_STATS_FILE = os.path.join(DATA_DIR, 'plays.stats.json')
+PLAY_RECORD = struct.Struct('<BBII')   # magic, panjang username, timestamp, song id
+PLAY_RECORD_MAGIC = 0xA5
+PLAY_STATS_DAYS = 35                   # jumlah hari yang disimpan per-hari
+PLAY_STATS_WEEKS = 13
+PLAY_CHECKPOINT_EVENTS = 100000
+PLAY_READ_CHUNK = 1 << 20
+
+class PlayStats:
+    """Rolling play aggregates; apply() is O(1) per event"""
+    def __init__(self):
+        self.total = 0
+        self.songs = Counter()
+        self.users = Counter()
+        self.days = {}    # day number -> {'plays', 'songs', 'artists', 'genres'}
+        self.weeks = {}   # week number (Senin) -> idem
+
+    @staticmethod
+    def new_bucket():
+        return {'plays': 0, 'songs': Counter(), 'artists': Counter(), 'genres': Counter()}
+
+    def _bucket(self, buckets, key, keep):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = self.new_bucket()
+            for old in [k for k in buckets if k <= key - keep]:
+                del buckets[old]
+        return bucket
+
+    def apply(self, ts, song_id, username):
+        self.total += 1
+        self.songs[song_id] += 1
+        self.users[username] += 1
+        day = ts // 86400
+        song = song_catalog.get(song_id)
+        for bucket in (self._bucket(self.days, day, PLAY_STATS_DAYS),
+                       self._bucket(self.weeks, (day + 3) // 7, PLAY_STATS_WEEKS)):
+            bucket['plays'] += 1
+            bucket['songs'][song_id] += 1
+            if song:
+                bucket['artists'][song.get('artist') or 'Unknown'] += 1
+                bucket['genres'][genre_key(song.get('genre'))] += 1
+
+    def to_state(self):
+        encode = lambda buckets: {str(k): dict(v, songs=list(v['songs'].items())) for k, v in buckets.items()}
+        return {
+            'total': self.total,
+            'songs': list(self.songs.items()),
+            'users': self.users,
+            'days': encode(self.days),
+            'weeks': encode(self.weeks),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        decode = lambda buckets: {int(k): {'plays': v['plays'], 'songs': Counter(dict(v['songs'])),
+                                           'artists': Counter(v['artists']), 'genres': Counter(v['genres'])}
+                                  for k, v in buckets.items()}
+        stats.total = state['total']
+        stats.songs = Counter(dict(state['songs']))
+        stats.users = Counter(state['users'])
+        stats.days = decode(state['days'])
+        stats.weeks = decode(state['weeks'])
+        return stats
+
+class PlayEventLog:
+    def __init__(self, log_file, stats_file):
+        self.log_file = log_file
+        self.stats_file = stats_file
+        self.fd = None
+        self.offset = 0            # byte pertama yang belum masuk agregat
+        self.checkpoint_offset = 0
+        self.unsaved = 0
+        self.stats = PlayStats()
+        self.colisten_state = None  # dimuat ke colisten_graph setelah katalog siap
+        self.checkpointing = False
+        self.lock = threading.RLock()
+        try:
+            with open(stats_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.stats = PlayStats.from_state(state)
+            self.colisten_state = state.get('colisten')
+            self.offset = self.checkpoint_offset = state['offset']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Error loading play stats checkpoint:", e)
+
+    def append(self, username, song_id):
+        name = username.encode('utf-8')[:255]
+        record = PLAY_RECORD.pack(PLAY_RECORD_MAGIC, len(name), int(time.time()), song_id) + name
+        if self.fd is None:
+            os.makedirs(os.path.dirname(self.log_file) or '.', exist_ok=True)
+            self.fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self.fd, record)
+
+    def refresh(self):
+        """Apply log records written since the last call (by any worker)"""
+        with self.lock:
+            try:
+                size = os.path.getsize(self.log_file)
+            except FileNotFoundError:
+                return self.stats
+            if size < self.offset:   # log dihapus/diganti: mulai dari awal
+                self.stats, self.offset = PlayStats(), 0
+            with open(self.log_file, 'rb') as f:
+                f.seek(self.offset)
+                buf = b''
+                while True:
+                    chunk = f.read(PLAY_READ_CHUNK)
+                    if not chunk:
+                        break
+                    self.offset += len(chunk)
+                    buf = self._apply(buf + chunk)
+            self.offset -= len(buf)  # record terakhir belum lengkap: baca ulang nanti
+            if self.unsaved >= PLAY_CHECKPOINT_EVENTS and not self.checkpointing:
+                self.checkpointing = True
+                media_pool.submit(self.checkpoint)
+            return self.stats
+
+    def _apply(self, buf):
+        """Apply complete records in buf; returns the unconsumed tail"""
+        pos, end = 0, len(buf)
+        header = PLAY_RECORD.size
+        while pos + header <= end:
+            magic, name_len, ts, song_id = PLAY_RECORD.unpack_from(buf, pos)
+            if magic != PLAY_RECORD_MAGIC:
+                pos += 1   # data rusak: cari record berikutnya
+                continue
+            if pos + header + name_len > end:
+                break
+            username = buf[pos + header:pos + header + name_len].decode('utf-8', 'replace')
+            self.stats.apply(ts, song_id, username)
+            colisten_graph.observe_play(ts, song_id, username)
+            self.unsaved += 1
+            pos += header + name_len
+        return buf[pos:]
+
+    def checkpoint(self):
+        """Write aggregates and co-listen pairs with the offset they cover"""
+        try:
+            with self.lock:
+                if self.offset == self.checkpoint_offset:
+                    return
+                offset = self.offset
+                state = self.stats.to_state()
+                state['colisten'] = colisten_graph.to_state()
+                state['offset'] = offset
+                self.unsaved = 0
+                # serialisasi di dalam lock agar konsisten, tulis file di luar lock
+                state = json.dumps(state, separators=(',', ':'))
+            tmp = f'{self.stats_file}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(state)
+            os.replace(tmp, self.stats_file)
+            self.checkpoint_offset = offset
+        except Exception as e:
+            print("Error writing play stats checkpoint:", e)
+        finally:
+            self.checkpointing = False
+
+    def close(self):
+        self.refresh()
+        self.checkpoint()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+play_log = PlayEventLog(PLAY_LOG_FILE, PLAY_STATS_FILE)
+atexit.register(play_log.close)
+
+def record_play(username, song):
+    """Push a played song onto the user's history and the play log"""
+    with user_state.edit('history', username) as history:
+        history.push(song)
+    try:
+        play_log.append(username, song['id'])   # agregat dan co-listen diperbarui thread worker-sync
+    except OSError as e:
+        print("Error writing play event:", e)
+    event_hub.publish_user(username, 'history_changed')
+
+# === PROFILING ===
+# Admin dapat memprofil sebagian request (sample rate) atau endpoint tertentu
+# dengan cProfile atau stack sampler. Request yang lebih lambat dari ambang
+# batas (slow_ms, default mati) ditangkap lewat stack sampler yang berjalan
+# di background. Hasilnya disimpan di ring buffer di disk (file terlama dihapus).
+# Config di-cache per process; perubahan dari worker lain datang lewat event
+# relay state backend (worker-sync), TTL hanya cadangan bila event terlewat.
+PROFILE_DIR = os.path.join(DATA_DIR, 'profiles')
+PROFILE_RING_SIZE = 50
+PROFILE_SAMPLE_INTERVAL = 0.005     # detik antar sampel stack
+PROFILE_MAX_DEPTH = 64
+PROFILE_CONFIG_TTL = 300.0          # detik; cadangan, normalnya cache dibuang lewat event relay
+PROFILE_DEFAULTS = {'sample_rate': 0.0, 'endpoints': [], 'mode': 'cprofile', 'slow_ms': 0}
+# Sejak 3.12 cProfile memakai sys.monitoring: hanya satu profiler aktif per
+# process (profiler kedua raise ValueError) dan ia merekam semua thread.
+PROFILE_CPROFILE_EXCLUSIVE = sys.version_info >= (3, 12)
+PROFILE_ID = re.compile(r'^[0-9]+-[0-9a-f]{8}$')
+
+class StackSampler:
+    """Samples the stacks of registered threads; output is collapsed-stack text"""
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}   # thread id -> Counter(stack -> samples)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self, thread_id):
+        with self.lock:
+            self.active[thread_id] = Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self.thread.start()
+
+    def stop(self, thread_id):
+        with self.lock:
+            return self.active.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self.active.items():
+                    frame = frames.get(thread_id)
+                    names = []
+                    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+                        code = frame.f_code
+                        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                        frame = frame.f_back
+                    if names:
+                        stacks[';'.join(reversed(names))] += 1
+
+    @staticmethod
+    def collapsed(stacks):
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+class RequestProfiler:
+    def __init__(self, folder, backend, events):
+        self.folder = folder
+        self.backend = backend
+        self.events = events
+        self.sampler = StackSampler(PROFILE_SAMPLE_INTERVAL)
+        self.config = None
+        self.config_checked = 0.0
+        self.lock = threading.Lock()
+        self.cprofile_lock = threading.Lock()
+        events.on_relay('profiler_config', self.invalidate)
+
+    def invalidate(self, data=None):
+        self.config = None
+
+    def get_config(self):
+        config = self.config
+        if config is None or time.monotonic() - self.config_checked > PROFILE_CONFIG_TTL:
+            self.config_checked = time.monotonic()
+            _, value = self.backend.get('profiler:config')
+            config = self.config = dict(PROFILE_DEFAULTS, **(value or {}))
+        return config
+
+    def set_config(self, changes):
+        with self.backend.lock('profiler:config'):
+            _, value = self.backend.get('profiler:config')
+            config = dict(PROFILE_DEFAULTS, **(value or {}))
+            config.update(changes)
+            self.backend.put('profiler:config', config)
+        self.config, self.config_checked = config, time.monotonic()
+        self.events.notify_workers('profiler_config')
+        return config
+
+    def _start_cprofile(self):
+        """An enabled cProfile.Profile, or None when another profiler is already active"""
+        if PROFILE_CPROFILE_EXCLUSIVE and not self.cprofile_lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:   # alat lain (debugger, coverage) memegang sys.monitoring
+            if PROFILE_CPROFILE_EXCLUSIVE:
+                self.cprofile_lock.release()
+            return None
+        return profile
+
+    def _stop_cprofile(self, profile):
+        try:
+            profile.disable()
+        finally:
+            if PROFILE_CPROFILE_EXCLUSIVE:
+                self.cprofile_lock.release()
+
+    def begin(self, endpoint):
+        """Start profiling the current request if it is selected; returns the state to pass to end()"""
+        config = self.get_config()
+        reason = None
+        if endpoint in config['endpoints']:
+            reason = 'endpoint'
+        elif config['sample_rate'] and random.random() < config['sample_rate']:
+            reason = 'sampled'
+        profile = None
+        if reason and config['mode'] == 'cprofile':
+            profile = self._start_cprofile()   # None: request lain sedang diprofil, pakai sampler
+        if profile is None and (reason or config['slow_ms']):
+            self.sampler.start(threading.get_ident())
+        return {'start': time.perf_counter(), 'reason': reason, 'profile': profile, 'slow_ms': config['slow_ms']}
+
+    def end(self, state, status):
+        duration_ms = (time.perf_counter() - state['start']) * 1000
+        profile = state['profile']
+        if profile:
+            self._stop_cprofile(profile)
+        stacks = self.sampler.stop(threading.get_ident())
+        reason = state['reason']
+        if not reason and state['slow_ms'] and duration_ms >= state['slow_ms']:
+            reason = 'slow'
+        if not reason:
+            return
+        if profile:
+            stats = pstats.Stats(profile)
+            kind, data = 'cprofile', None
+        else:
+            kind, data = 'sampler', StackSampler.collapsed(stacks or Counter())
+            stats = None
+        meta = {
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'args': request.args.to_dict(flat=False),
+            'view_args': request.view_args or {},
+            'status': status,
+            'duration_ms': round(duration_ms, 3),
+            'reason': reason,
+            'kind': kind,
+        }
+        try:
+            self.save(meta, stats, data)
+        except Exception as e:
+            print("Error saving profile:", e)
+
+    def save(self, meta, stats, data):
+        os.makedirs(self.folder, exist_ok=True)
+        profile_id = f'{time.time_ns()}-{os.urandom(4).hex()}'
+        meta.update({'id': profile_id, 'created': time.time()})
+        if stats is not None:
+            meta['file'] = profile_id + '.prof'
+            stats.dump_stats(os.path.join(self.folder, meta['file']))
+        else:
+            meta['file'] = profile_id + '.txt'
+            with open(os.path.join(self.folder, meta['file']), 'w', encoding='utf-8') as f:
+                f.write(data)
+        with open(os.path.join(self.folder, profile_id + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        self.trim()
+
+    def trim(self):
+        with self.lock:
+            ids = sorted(name[:-5] for name in os.listdir(self.folder) if name.endswith('.json'))
+            for profile_id in ids[:-PROFILE_RING_SIZE]:
+                for ext in ('.json', '.prof', '.txt'):
+                    try: os.remove(os.path.join(self.folder, profile_id + ext))
+                    except OSError: pass
+
+    def list(self):
+        if not os.path.isdir(self.folder):
+            return []
+        profiles = []
+        for name in sorted(os.listdir(self.folder), reverse=True):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.folder, name), 'r', encoding='utf-8') as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    pass  # sedang ditulis atau baru saja dihapus oleh trim()
+        return profiles
+
+    def get(self, profile_id):
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.folder, profile_id + '.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+request_profiler = RequestProfiler(PROFILE_DIR, user_state.backend, event_hub)
+
+@app.before_request
+def start_request_profile():
+    request.environ['musicapp.profile'] = request_profiler.begin(request.endpoint)
+
+@app.teardown_request
+def finish_request_profile(exc):
+    state = request.environ.pop('musicapp.profile', None)
+    if state:
+        status = 500 if exc else request.environ.get('musicapp.status')
+        request_profiler.end(state, status)
+
+@app.after_request
+def remember_response_status(response):
+    request.environ['musicapp.status'] = response.status_code
+    return response
+
+# === BACKGROUND JOBS ===
+# Pekerjaan lambat setelah perubahan katalog (hapus file lama, analisis
+# audio, derivatif cover) dijalankan worker thread dari antrean terbatas.
+# Record job disimpan di state backend (job:<id>) sehingga status bisa dibaca
+# dari worker process mana pun. Job yang sedang dikerjakan punya lease yang
+# diperpanjang heartbeat; job dengan lease kedaluwarsa (process mati atau
+# restart) diambil alih dan dijalankan ulang. Handler harus idempotent.
+JOB_WORKERS = 2
+JOB_QUEUE_SIZE = 1000
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 2.0        # detik, dikali dua setiap percobaan ulang
+JOB_LEASE = 60               # detik
+JOB_HEARTBEAT = 15           # detik
+JOB_PROGRESS_INTERVAL = 0.5  # detik antar penulisan progress
+JOB_HISTORY = 1000           # job selesai/gagal yang disimpan
+JOB_STATUSES = ('queued', 'running', 'retrying', 'done', 'failed')
+METRIC_HELP['musicapp_jobs_total'] = ('counter', 'Finished background jobs by kind and status')
+METRIC_HELP['musicapp_jobs_queued'] = ('gauge', 'Jobs waiting in this process')
+
+class JobError(Exception):
+    """A job failure that retrying cannot fix"""
+
+class JobQueue:
+    def __init__(self, backend, handlers, workers=JOB_WORKERS, maxsize=JOB_QUEUE_SIZE):
+        self.backend = backend
+        self.handlers = handlers      # kind -> fn(payload, progress)
+        self.workers = workers
+        self.queue = queue.Queue(maxsize)
+        self.overflow = deque()       # job_id yang tidak muat di queue, diambil worker
+        self.active = {}              # job_id -> dedupe key, job milik process ini
+        self.keys = {}                # dedupe key -> job_id
+        self.finished = 0
+        self.lock = threading.Lock()
+        self.started = False
+
+    @staticmethod
+    def new_id():
+        # diawali waktu (ms) agar urutan key = urutan pembuatan
+        return f'{int(time.time() * 1000):013d}-{os.urandom(3).hex()}'
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f'job-{i}', daemon=True).start()
+        threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True).start()
+
+    def full(self):
+        return self.queue.full()
+
+    def submit(self, kind, payload, key=None):
+        """Persist and enqueue a job; with key, an unfinished job for the same key is reused"""
+        with self.lock:
+            if key is not None and key in self.keys:
+                return self.get(self.keys[key])
+            job_id = self.new_id()
+            self.active[job_id] = key
+            if key is not None:
+                self.keys[key] = job_id
+        now = time.time()
+        job = {
+            'id': job_id, 'kind': kind, 'payload': payload, 'key': key,
+            'status': 'queued', 'attempts': 0, 'error': None, 'result': None,
+            'progress': {'done': 0, 'total': 0, 'message': None},
+            'created': now, 'updated': now, 'lease': now + JOB_LEASE,
+        }
+        with self.backend.lock(f'job:{job_id}'):
+            self.backend.put(f'job:{job_id}', job)
+        self._enqueue(job_id)
+        return job
+
+    def get(self, job_id):
+        return self.backend.get(f'job:{job_id}')[1]
+
+    def list(self, status=None, limit=50):
+        """Newest jobs first, optionally only one status"""
+        jobs = []
+        for key in reversed(self.backend.keys('job:')):
+            job = self.backend.get(key)[1]
+            if job and (status is None or job['status'] == status):
+                jobs.append(job)
+                if len(jobs) >= limit:
+                    break
+        return jobs
+
+    def update(self, job_id, **fields):
+        key = f'job:{job_id}'
+        with self.backend.lock(key):
+            _, job = self.backend.get(key)
+            if job is None:
+                return None
+            job.update(fields, updated=time.time())
+            self.backend.put(key, job)
+        return job
+
+    def queued(self):
+        return self.queue.qsize() + len(self.overflow)
+
+    def _enqueue(self, job_id):
+        with self.lock:
+            if self.overflow:
+                self.overflow.append(job_id)   # jaga urutan: yang lebih dulu luber jalan lebih dulu
+            else:
+                try:
+                    self.queue.put_nowait(job_id)
+                except queue.Full:
+                    # tetap tercatat sebagai queued; worker mengambilnya setelah antrean longgar
+                    self.overflow.append(job_id)
+        metrics.set('musicapp_jobs_queued', self.queued())
 
-# 5. Binary Search Tree - Search
-class TreeNode:
-    def __init__(self, song):
-        self.song = song
-        self.left = None
-        self.right = None
+    def _refill(self):
+        """Move overflowed job ids into the queue while it has room"""
+        with self.lock:
+            while self.overflow and not self.queue.full():
+                self.queue.put_nowait(self.overflow.popleft())
 
-class SongBST:
-    def __init__(self):
-        self.root = None
-    
-    def insert(self, song):
-        if not self.root:
-            self.root = TreeNode(song)
-        else:
-            self._insert_recursive(self.root, song)
-    
-    def _insert_recursive(self, node, song):
-        if song['title'].lower() < node.song['title'].lower():
-            if node.left is None:
-                node.left = TreeNode(song)
-            else:
-                self._insert_recursive(node.left, song)
-        else:
-            if node.right is None:
-                node.right = TreeNode(song)
-            else:
-                self._insert_recursive(node.right, song)
-    
-    def search(self, query):
-        results = []
-        self._search_recursive(self.root, query.lower(), results)
-        return results
-    
-    def _search_recursive(self, node, query, results):
-        if node is None:
+    def _worker(self):
+        while True:
+            job_id = self.queue.get()
+            self._refill()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                print("Error in job worker:", e)
+            finally:
+                self.queue.task_done()
+            metrics.set('musicapp_jobs_queued', self.queued())
+
+    def _run(self, job_id):
+        job = self.get(job_id)
+        if job is None or job['status'] in ('done', 'failed'):
+            self._forget(job_id)
             return
-        
-        # Search in title, artist, genre, and album
-        if (query in node.song['title'].lower() or 
-            query in node.song['artist'].lower() or 
-            query in node.song['genre'].lower() or
-            query in node.song.get('album', '').lower()):
-            results.append(node.song)
-        
-        self._search_recursive(node.left, query, results)
-        self._search_recursive(node.right, query, results)
-    
-    def clear(self):
-        self.root = None
+        job = self.update(job_id, status='running', attempts=job['attempts'] + 1, lease=time.time() + JOB_LEASE)
+        last_write = [0.0]
 
-# 6. Graph - Recommendations
-class RecommendationGraph:
-    def __init__(self):
-        self.graph = {}
-    
-    def add_edge(self, song1_id, song2_id):
-        if song1_id not in self.graph:
-            self.graph[song1_id] = []
-        if song2_id not in self.graph:
-            self.graph[song2_id] = []
-        
-        if song2_id not in self.graph[song1_id]:
-            self.graph[song1_id].append(song2_id)
-        if song1_id not in self.graph[song2_id]:
-            self.graph[song2_id].append(song1_id)
-    
-    def get_recommendations(self, song_id):
-        if song_id in self.graph:
-            return self.graph[song_id]
-        return []
-    
-    def clear(self):
-        self.graph = {}
+        def progress(done, total, message=None):
+            now = time.monotonic()
+            if done < total and now - last_write[0] < JOB_PROGRESS_INTERVAL:
+                return
+            last_write[0] = now
+            self.update(job_id, progress={'done': done, 'total': total, 'message': message})
 
-# === GLOBAL DATA ===
-songs_library = []
-user_playlists = {}
-user_favorites = {}
-user_queues = {}
-user_history = {}
-song_bst = SongBST()
-recommendation_graph = RecommendationGraph()
+        try:
+            with metrics.time(f"job_{job['kind']}"):
+                result = self.handlers[job['kind']](job['payload'], progress)
+        except Exception as e:
+            print(f"Error in job {job_id} ({job['kind']}):", e)
+            if job['attempts'] < JOB_MAX_ATTEMPTS and not isinstance(e, JobError):
+                self.update(job_id, status='retrying', error=str(e))
+                delay = JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1)
+                timer = threading.Timer(delay, self._enqueue, args=(job_id,))
+                timer.daemon = True
+                timer.start()
+                return
+            self._finish(job, 'failed', str(e))
+            return
+        self._finish(job, 'done', None, result)
 
-# Demo users
-users = {
-    'user': {'password': 'user123', 'role': 'user'},
-    'admin': {'password': 'admin123', 'role': 'admin'}
+    def _finish(self, job, status, error, result=None):
+        self.update(job['id'], status=status, error=error, result=result, lease=None)
+        metrics.inc('musicapp_jobs_total', kind=job['kind'], status=status)
+        self._forget(job['id'])
+        with self.lock:
+            self.finished += 1
+            trim = self.finished % 100 == 0
+        if trim:
+            self.trim()
+
+    def _forget(self, job_id):
+        with self.lock:
+            key = self.active.pop(job_id, None)
+            if key is not None and self.keys.get(key) == job_id:
+                del self.keys[key]
+
+    def trim(self):
+        """Drop the oldest finished jobs beyond JOB_HISTORY"""
+        finished = 0
+        for key in reversed(self.backend.keys('job:')):
+            job = self.backend.get(key)[1]
+            if job and job['status'] in ('done', 'failed'):
+                finished += 1
+                if finished > JOB_HISTORY:
+                    with self.backend.lock(key):
+                        self.backend.delete(key)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT)
+            try:
+                with self.lock:
+                    mine = list(self.active)
+                if mine:
+                    lease = time.time() + JOB_LEASE
+                    with self.backend.lock('jobs:heartbeat'):
+                        for job_id in mine:
+                            self.update(job_id, lease=lease)
+                self.resume()
+            except Exception as e:
+                print("Error in job heartbeat:", e)
+
+    def resume(self):
+        """Adopt unfinished jobs whose lease expired (their process died)"""
+        now = time.time()
+        orphaned = lambda job: (job and job['status'] not in ('done', 'failed')
+                                and job['id'] not in self.active and (job['lease'] or 0) <= now)
+        for key in self.backend.keys('job:'):
+            if not orphaned(self.backend.get(key)[1]):
+                continue
+            with self.backend.lock(key):
+                _, job = self.backend.get(key)
+                if not orphaned(job):
+                    continue
+                job.update(status='queued', lease=now + JOB_LEASE, updated=now)
+                self.backend.put(key, job)
+            with self.lock:
+                self.active[job['id']] = job['key']
+                if job['key'] is not None:
+                    self.keys[job['key']] = job['id']
+            self._enqueue(job['id'])
+
+def run_song_media(payload, progress):
+    """Remove released files, read the audio and build cover derivatives for one song"""
+    remove = payload.get('remove') or []
+    steps = len(remove) + 2
+    for i, path in enumerate(remove):
+        with catalog_write():
+            if not upload_refs.counts.get(path):   # bisa sudah dipakai upload baru
+                remove_upload(path)
+        progress(i + 1, steps, 'remove')
+    cover_path = payload.get('cover_path')
+    if payload.get('audio_path'):
+        progress(len(remove), steps, 'audio')
+        cover_path = process_audio(payload['song_id'], payload['audio_path']) or cover_path
+    if cover_path and Image is not None:
+        progress(len(remove) + 1, steps, 'cover')
+        process_cover(payload['song_id'], cover_path)
+    progress(steps, steps)
+
+def song_media_needed(song):
+    return ((song.get('audio_path') and not song.get('audio_info'))
+            or (Image is not None and song.get('cover_path') and not song.get('covers')))
+
+def run_media_backfill(payload, progress):
+    """Startup job: analyse audio and covers of songs that never got them"""
+    with catalog_lock:
+        pending = [song['id'] for song in songs_library if song_media_needed(song)]
+    for i, song_id in enumerate(pending):
+        song = song_catalog.get(song_id)
+        if song and song_media_needed(song):
+            try:
+                run_song_media({
+                    'song_id': song_id,
+                    'audio_path': None if song.get('audio_info') else song.get('audio_path'),
+                    'cover_path': None if song.get('covers') else song.get('cover_path'),
+                }, lambda *args: None)
+            except Exception as e:
+                print(f"Error in media backfill for song {song_id}:", e)
+        progress(i + 1, len(pending))
+
+def run_content_build(payload, progress):
+    """Job: rebuild the content similarity matrix until it matches the catalog version"""
+    rebuilt = False
+    while True:   # katalog bisa berubah lagi selama build; submit berikutnya memakai job ini
+        with catalog_lock:
+            version = song_catalog.version
+            if content_engine.version == version:
+                return {'songs': len(content_engine.rows), 'rebuilt': rebuilt}
+            songs = list(songs_library)
+        progress(0, len(songs), 'build')
+        with metrics.time('content_similarity_build'):
+            content_engine.build(songs, version)
+        progress(len(songs), len(songs), 'build')
+        rebuilt = True
+
+JOB_HANDLERS = {
+    'song_media': run_song_media,
+    'media_backfill': run_media_backfill,
+    'content_build': run_content_build,
 }
 
-# === HELPER: REBUILD DATA STRUCTURES ===
-def rebuild_data_structures():
-    """Rebuild BST and recommendation graph from songs_library"""
-    global song_bst, recommendation_graph
-    
-    # Clear and rebuild BST
-    song_bst.clear()
-    for song in songs_library:
-        if song.get('title') and song.get('artist'):
-            song_bst.insert(song)
-    
-    # Clear and rebuild recommendation graph
-    recommendation_graph.clear()
-    for song in songs_library:
-        for other in songs_library:
-            if (song['id'] != other['id'] and
-                song.get('genre') and other.get('genre') and
-                song['genre'].strip().lower() == other['genre'].strip().lower()):
-                recommendation_graph.add_edge(song['id'], other['id'])
+job_queue = JobQueue(user_state.backend, JOB_HANDLERS)
 
-# === PERSISTENSI DATA ===
-DATA_FILE = 'songs_data.json'
+def schedule_song_media(song, audio=True, cover=True, remove=()):
+    """Queue the background work for a changed song; returns the job id or None"""
+    payload = {'song_id': song['id'], 'remove': list(remove)}
+    if audio and song.get('audio_path'):
+        payload['audio_path'] = song['audio_path']
+    if cover and Image is not None and song.get('cover_path'):
+        payload['cover_path'] = song['cover_path']
+    if not payload['remove'] and len(payload) == 2:
+        return None
+    return job_queue.submit('song_media', payload)['id']
+
+# === BULK IMPORT ===
+# Impor banyak lagu sekaligus dari folder audio atau manifest CSV/JSONL.
+# Hash, tag, dan waveform dihitung paralel di process pool; hasilnya di-dedup
+# terhadap katalog dan sesama item, file disalin ke uploads, lalu semua lagu
+# masuk katalog di bawah satu lock dengan satu record journal 'batch'.
+IMPORT_FOLDER = 'imports'          # root yang boleh dipakai endpoint admin
+IMPORT_WORKERS = os.cpu_count() or 1
+IMPORT_MANIFEST_EXTENSIONS = ('.csv', '.jsonl')
+IMPORT_REPORT_LIMIT = 1000         # item dilewati/gagal yang dicantumkan di hasil
+UNKNOWN_ARTIST = 'Unknown Artist'
+
+def read_import_manifest(path):
+    """Entries of a CSV or JSONL manifest; file/cover paths are relative to the manifest"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    entries = []
+    for row in rows:
+        if not isinstance(row, dict):
+            raise ValueError(f'{path}: every manifest row must be an object')
+        row = {k.strip().lower(): v for k, v in row.items() if k and v not in (None, '')}
+        entry = {k: str(row[k]).strip() for k in ('title', 'artist', 'album', 'genre', 'duration') if k in row}
+        entry['file'] = os.path.join(base, str(row.get('file', '')))
+        if row.get('cover'):
+            entry['cover'] = os.path.join(base, str(row['cover']))
+        entries.append(entry)
+    return entries
+
+def list_import_entries(source, root=None):
+    if os.path.isdir(source):
+        entries = [{'file': os.path.join(folder, name)}
+                   for folder, _, names in sorted(os.walk(source)) for name in sorted(names)
+                   if allowed_file(name, ALLOWED_AUDIO_EXTENSIONS)]
+    elif source.lower().endswith(IMPORT_MANIFEST_EXTENSIONS):
+        entries = read_import_manifest(source)
+    else:
+        raise ValueError('source must be a directory or a .csv/.jsonl manifest')
+    if root is not None:
+        # manifest dari endpoint admin tidak boleh menunjuk ke luar root
+        inside = lambda path: os.path.commonpath([root, os.path.abspath(path)]) == root
+        for entry in entries:
+            if not inside(entry['file']) or not inside(entry.get('cover', root)):
+                raise ValueError(f"{entry['file']} is outside the import folder")
+    return entries
+
+def scan_import_file(path):
+    """Process pool task: sha256, tags and waveform of one audio file"""
+    if os.path.getsize(path) > MAX_AUDIO_SIZE:
+        raise ValueError(f'File exceeds the {MAX_AUDIO_SIZE // (1024 * 1024)}MB limit')
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest(), read_audio_metadata(path), build_waveform(path)
+
+import_env_lock = threading.Lock()
+
+class ImportWorkerProcess:
+    """Process mixin: the child starts with IMPORT_WORKER set, the server's os.environ is restored"""
+    def start(self):
+        # env dibaca saat child (atau forkserver) dibuat; child lain seperti
+        # reloader Werkzeug tidak boleh ikut mewarisi flag ini
+        with import_env_lock:
+            previous = os.environ.get(IMPORT_WORKER_ENV)
+            os.environ[IMPORT_WORKER_ENV] = '1'
+            try:
+                super().start()
+            finally:
+                if previous is None:
+                    del os.environ[IMPORT_WORKER_ENV]
+                else:
+                    os.environ[IMPORT_WORKER_ENV] = previous
+
+class SpawnImportProcess(ImportWorkerProcess, multiprocessing.context.SpawnProcess):
+    pass
+
+class SpawnImportContext(multiprocessing.context.SpawnContext):
+    Process = SpawnImportProcess
+
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    class ForkServerImportProcess(ImportWorkerProcess, multiprocessing.context.ForkServerProcess):
+        pass
 
-def save_songs():
+    class ForkServerImportContext(multiprocessing.context.ForkServerContext):
+        Process = ForkServerImportProcess
+else:
+    ForkServerImportContext = None
+
+def import_pool():
+    # fork dari server yang punya banyak thread bisa mewarisi lock yang sedang dipegang;
+    # worker forkserver/spawn mengimpor ulang app dengan startup dilewati (IMPORT_WORKER)
+    context = ForkServerImportContext() if ForkServerImportContext else SpawnImportContext()
+    return ProcessPoolExecutor(IMPORT_WORKERS, mp_context=context)
+
+def copy_upload(source, folder, url_prefix, digest):
+    """Copy a file into an upload folder as <sha256>.<ext>; returns its /uploads path"""
+    filename = f"{digest}.{source.rsplit('.', 1)[1].lower()}"
+    target = os.path.join(folder, filename)
+    if not os.path.exists(target):
+        tmp = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    return f'{url_prefix}/{filename}'
+
+def import_cover(entry, meta):
+    cover = entry.get('cover')
+    if cover:
+        if not allowed_file(cover, ALLOWED_IMAGE_EXTENSIONS) or os.path.getsize(cover) > MAX_IMAGE_SIZE:
+            raise ValueError(f'Invalid cover image {cover}')
+        with open(cover, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        return copy_upload(cover, COVER_FOLDER, '/uploads/covers', digest)
+    if meta['picture']:
+        return store_embedded_cover(meta['picture'])
+    return None
+
+def import_duration(entry, meta):
+    """Seconds from the audio, else from the manifest; ValueError for a bad manifest value"""
+    if meta['duration']:
+        return round(meta['duration'])
+    value = entry.get('duration')
+    if not value:
+        return 0
     try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(songs_library, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        print("Error saving songs:", e)
+        duration = float(value)
+    except ValueError:
+        raise ValueError(f'Invalid duration {value!r}')
+    if not math.isfinite(duration) or duration < 0:
+        raise ValueError(f'Invalid duration {value!r}')
+    return int(duration)
 
-def load_songs():
-    global songs_library
+def import_song_fields(entry, meta):
+    """Manifest values win over tags, tags over an "Artist - Title" file name"""
+    stem = os.path.splitext(os.path.basename(entry['file']))[0]
+    artist, sep, title = stem.partition(' - ')
+    if not sep:
+        artist, title = '', stem
+    tags = meta['tags']
+    return {
+        'title': entry.get('title') or tags.get('title') or title.strip(),
+        'artist': entry.get('artist') or tags.get('artist') or artist.strip() or UNKNOWN_ARTIST,
+        'duration': import_duration(entry, meta),
+        'genre': entry.get('genre') or tags.get('genre'),
+        'album': entry.get('album') or tags.get('album'),
+    }
+
+def run_import(payload, progress):
+    """Job handler: import a directory or manifest as one catalog batch"""
+    if not isinstance(payload.get('source'), str):
+        raise JobError('source must be a path')
+    try:
+        entries = list_import_entries(payload['source'], payload.get('root'))
+    except (OSError, ValueError, csv.Error) as e:
+        raise JobError(str(e))
+    total = len(entries)
+    counts = Counter()
+    report = []
+
+    def skip(entry, status, error=None):
+        counts[status] += 1
+        if len(report) < IMPORT_REPORT_LIMIT:
+            report.append({'file': entry['file'], 'status': status, 'error': error})
+
+    # 1. hash, tag, dan waveform paralel
+    scanned = []
+    progress(0, total, 'scan')
+    with import_pool() as pool:
+        futures = {}
+        for index, entry in enumerate(entries):
+            if allowed_file(entry['file'], ALLOWED_AUDIO_EXTENSIONS):
+                futures[pool.submit(scan_import_file, entry['file'])] = (index, entry)
+            else:
+                skip(entry, 'error', 'Unsupported audio file')
+        for done, future in enumerate(as_completed(futures), 1):
+            index, entry = futures[future]
+            try:
+                scanned.append((index, entry) + future.result())
+            except Exception as e:
+                skip(entry, 'error', str(e))
+            progress(done, total, 'scan')
+    scanned.sort(key=lambda item: item[0])
 
-    if os.path.exists(DATA_FILE):
+    # 2. dedup lalu salin file ke uploads (di luar lock katalog)
+    staged = []
+    seen = set()
+    unused = []   # file yang sudah disalin tetapi tidak dipakai lagu baru
+    for done, (_, entry, digest, meta, blob) in enumerate(scanned, 1):
+        try:
+            fields = import_song_fields(entry, meta)
+        except ValueError as e:
+            skip(entry, 'error', str(e))
+            continue
+        key = song_key(fields['title'], fields['artist'])
+        if key in seen or song_catalog.find_duplicate(fields['title'], fields['artist']):
+            skip(entry, 'duplicate')
+            continue
         try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                songs_library = json.load(f)
-            
-            # Rebuild data structures after loading
+            fields['audio_path'] = copy_upload(entry['file'], AUDIO_FOLDER, '/uploads/audio', digest)
+            fields['cover_path'] = import_cover(entry, meta)
+        except (OSError, ValueError) as e:
+            unused.append(fields.get('audio_path'))
+            skip(entry, 'error', str(e))
+            continue
+        fields['audio_info'] = {k: meta[k] for k in ('format', 'bitrate', 'sample_rate', 'channels')}
+        fields['audio_info']['duration'] = round(meta['duration'], 3)
+        fields['waveform'] = store_waveform(blob) if blob else None
+        seen.add(key)
+        staged.append((entry, digest, fields))
+        progress(done, len(scanned), 'stage')
+
+    # 3. satu commit: katalog, index, dan satu record journal
+    added = []
+    seq = None
+    with catalog_write():
+        for entry, digest, fields in staged:
+            if song_catalog.find_duplicate(fields['title'], fields['artist']):
+                skip(entry, 'duplicate')   # ditambahkan lewat jalur lain selama impor
+                unused.extend(song_upload_paths(fields))
+                continue
+            # file dengan isi sama bisa terhapus oleh job lain sejak disalin
+            copy_upload(entry['file'], AUDIO_FOLDER, '/uploads/audio', digest)
+            song = dict(id=song_catalog.allocate_id(), **fields)
+            song_catalog.add(song)
+            index_song(song)
+            upload_refs.track(song['id'], song_upload_paths(song))
+            added.append(song)
+        if added:
+            seq = save_songs_batch(added)
+        # file yang juga dipakai lagu lain (isi sama) tetap disimpan
+        for path in dict.fromkeys(p for p in unused if p):
+            if not upload_refs.counts.get(path):
+                remove_upload(path)
+    if seq:
+        catalog_journal.wait_durable(seq)
+        event_hub.publish('catalog_changed', {'version': catalog_journal.seq})
+        if any(song_media_needed(song) for song in added):
+            job_queue.submit('media_backfill', {}, key='media_backfill')
+    progress(total, total, 'commit')
+    return {'total': total, 'added': len(added), 'duplicate': counts['duplicate'],
+            'error': counts['error'], 'items': report}
+
+JOB_HANDLERS['import'] = run_import
+
+@app.cli.command('import-songs')
+@click.argument('source', type=click.Path(exists=True))
+def import_songs_command(source):
+    """Import a folder of audio files or a CSV/JSONL manifest.
+
+    Commits under the shared journal lock, so running workers pick the
+    songs up; without fcntl (Windows) stop the server first.
+    """
+    def progress(done, total, message=None):
+        if done == total or done % max(total // 20, 1) == 0:
+            click.echo(f'{message}: {done}/{total}')
+
+    result = run_import({'source': os.path.abspath(source)}, progress)
+    for item in result.pop('items'):
+        click.echo(f"{item['status']}: {item['file']}" + (f" ({item['error']})" if item['error'] else ''))
+    click.echo(json.dumps(result))
+
+# Load saat start; worker yang start bersamaan menunggu di lock journal
+# sehingga hanya satu yang mengisi sample songs
+if not IMPORT_WORKER:
+    with catalog_lock, catalog_journal.locked():
+        load_songs()
+
+        # Jika tidak ada lagu yang berhasil dimuat, isi dengan sample songs
+        if not songs_library:
+            song_catalog.load([
+                {
+                    'id': 1,
+                    'title': 'Sample Song 1',
+                    'artist': 'Sample Artist',
+                    'duration': 180,
+                    'genre': 'Pop',
+                    'album': 'Sample Album',
+                    'audio_path': None,
+                    'cover_path': None
+                },
+                {
+                    'id': 2,
+                    'title': 'Sample Song 2',
+                    'artist': 'Sample Artist',
+                    'duration': 200,
+                    'genre': 'Rock',
+                    'album': 'Rock Album',
+                    'audio_path': None,
+                    'cover_path': None
+                }
+            ])
             rebuild_data_structures()
+            os.makedirs(DATA_DIR, exist_ok=True)
+            catalog_journal.write_snapshot(songs_library, catalog_journal.seq)
+
+        catalog_journal.open()
+
+# Job yang tertinggal dari process sebelumnya diambil alih setelah lease-nya
+# habis; lagu lama tanpa derivatif cover atau metadata audio dikerjakan satu job
+if not IMPORT_WORKER:
+    job_queue.start()
+    job_queue.resume()
+    if any(song_media_needed(song) for song in songs_library):
+        job_queue.submit('media_backfill', {}, key='media_backfill')
+
+def load_colisten():
+    """Co-listen graph: play pairs from the checkpoint, every playlist, then the log tail"""
+    with play_log.lock:
+        colisten_graph.load_state(play_log.colisten_state, lambda i: song_catalog.get(i) is not None)
+        play_log.colisten_state = None
+    for username in user_state.usernames('playlists'):
+        for playlist in user_state.load('playlists', username).values():
+            colisten_graph.observe_playlist(playlist, playlist.song_ids())
+    play_log.refresh()
 
+if not IMPORT_WORKER:
+    load_colisten()
+
+# Perubahan katalog (journal) dan event user (relay) dari worker lain juga
+# sampai ke client SSE worker ini walaupun worker ini tidak sedang menerima request;
+# pemutaran baru di play log masuk ke agregat dan co-listen graph di sini juga
+WORKER_SYNC_INTERVAL = 0.5  # detik
+
+def sync_workers():
+    while True:
+        time.sleep(WORKER_SYNC_INTERVAL)
+        try:
+            refresh_catalog()
+            event_hub.poll_relay()
+            play_log.refresh()
         except Exception as e:
-            print("Error loading songs:", e)
-
-# Load saat start
-load_songs()
-
-# Jika tidak ada lagu yang berhasil dimuat, isi dengan sample songs
-if not songs_library:
-    songs_library = [
-        {
-            'id': 1,
-            'title': 'Sample Song 1',
-            'artist': 'Sample Artist',
-            'duration': 180,
-            'genre': 'Pop',
-            'album': 'Sample Album',
-            'audio_path': None,
-            'cover_path': None
-        },
-        {
-            'id': 2,
-            'title': 'Sample Song 2',
-            'artist': 'Sample Artist',
-            'duration': 200,
-            'genre': 'Rock',
-            'album': 'Rock Album',
-            'audio_path': None,
-            'cover_path': None
-        }
-    ]
-    rebuild_data_structures()
+            print("Error syncing with other workers:", e)
+
+if not IMPORT_WORKER:
+    event_hub.poll_relay()   # mulai dari event terbaru
+    threading.Thread(target=sync_workers, name='worker-sync', daemon=True).start()
 
 # === ROUTES ===
 
@@ -344,16 +4138,6 @@ def login():
         session['username'] = username
         session['role'] = users[username]['role']
         
-        # Initialize user data
-        if username not in user_playlists:
-            user_playlists[username] = {}
-        if username not in user_favorites:
-            user_favorites[username] = Playlist()
-        if username not in user_queues:
-            user_queues[username] = SongQueue()
-        if username not in user_history:
-            user_history[username] = HistoryStack()
-        
         return jsonify({
             'success': True,
             'role': users[username]['role'],
@@ -383,73 +4167,200 @@ def admin_page():
 
 @app.route('/uploads/audio/<filename>')
 def serve_audio(filename):
-    return send_from_directory(AUDIO_FOLDER, filename)
+    """Stream audio with Range/206 and ETag/Last-Modified support.
+
+    Full responses and ranges that run to the end of the file (browsers
+    open with "Range: bytes=0-") go through wsgi.file_wrapper on a seeked
+    file, so servers that support it (gunicorn, uWSGI) send them with
+    sendfile(); bounded ranges seek straight to the requested span.
+    """
+    entry = audio_stat_cache.get(filename)
+    if entry is None:
+        abort(404)
+    path, size, mtime, etag = entry
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        audio_stat_cache.invalidate(filename)
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = Response(wrap_file(request.environ, f), mimetype=mimetype, direct_passthrough=True)
+    response.content_length = size
+    response.last_modified = mtime
+    response.set_etag(etag)
+    response.cache_control.public = True
+    if CONTENT_ADDRESSED_NAME.match(filename):
+        response.cache_control.max_age = UPLOAD_CACHE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = AUDIO_CACHE_MAX_AGE
+    try:
+        response.make_conditional(request.environ, accept_ranges=True, complete_length=size)
+    except Exception:
+        f.close()
+        raise
+    if response.status_code == 206 and response.content_range.stop == size:
+        # sisa file sampai akhir: Content-Length sudah membatasi, jadi
+        # file_wrapper bisa dipakai lagi dari posisi awal range
+        f.seek(response.content_range.start)
+        response.response = wrap_file(request.environ, f)
+    return response
+
+COVER_DERIVATIVE_NAME = re.compile(r'^[0-9a-f]{16}_\d+\.(webp|jpg)$')
 
 @app.route('/uploads/covers/<filename>')
 def serve_cover(filename):
-    return send_from_directory(COVER_FOLDER, filename)
+    """Serve a cover; ?size= picks the nearest pre-sized derivative"""
+    size = request.args.get('size', type=int)
+    if size and filename in cover_variants:
+        fmt = 'webp' if any(m == 'image/webp' for m, _ in request.accept_mimetypes) else 'jpg'
+        derivative = nearest_cover(cover_variants[filename], size, fmt)
+        if derivative:
+            response = send_from_directory(os.path.abspath(COVER_FOLDER), derivative.rsplit('/', 1)[-1], max_age=24 * 3600)
+            response.vary.add('Accept')
+            return response
+
+    if COVER_DERIVATIVE_NAME.match(filename):
+        response = send_from_directory(os.path.abspath(COVER_FOLDER), filename, max_age=COVER_CACHE_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    if CONTENT_ADDRESSED_NAME.match(filename):
+        # nama file = sha256 isinya, jadi aslinya juga tidak pernah berubah
+        response = send_from_directory(os.path.abspath(COVER_FOLDER), filename, max_age=UPLOAD_CACHE_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    return send_from_directory(os.path.abspath(COVER_FOLDER), filename)
+
+WAVEFORM_NAME = re.compile(r'^[0-9a-f]{16}\.wf$')
+
+@app.route('/uploads/waveforms/<filename>')
+def serve_waveform(filename):
+    """Waveform blobs are content-addressed, so they can be cached forever"""
+    if not WAVEFORM_NAME.match(filename):
+        abort(404)
+    response = send_from_directory(os.path.abspath(WAVEFORM_FOLDER), filename,
+                                   mimetype='application/octet-stream', max_age=WAVEFORM_CACHE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
 
 # === API ENDPOINTS ===
 
+def cached_catalog_response(cache, variant, build, version=None):
+    """JSON response cached per catalog version (plus an extra version), with ETag/304 and gzip"""
+    body, gzip_body, etag = cache.get((song_catalog.version, version), variant, lambda: build(catalog_journal.seq))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    response = Response(mimetype='application/json')
+    if 'gzip' in request.accept_encodings:
+        response.set_data(gzip_body)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response.set_data(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/api/songs', methods=['GET'])
 def get_songs():
-    return jsonify({'songs': songs_library})
+    """Full or paginated song list, projected to ?fields= and revalidated by ETag"""
+    fields = request.args.get('fields')
+    if fields:
+        fields = tuple(f for f in fields.split(',') if f)
+        unknown = [f for f in fields if f not in SONG_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    page = request.args.get('page', type=int)
+    per_page = min(max(request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    if page is not None:
+        page = max(page, 1)
+
+    def build(version):
+        songs = songs_library
+        if page:
+            songs = songs[(page - 1) * per_page:page * per_page]
+        if fields:
+            songs = Fragment(encode_json([{f: s.get(f) for f in fields} for s in songs]))
+        else:
+            songs = song_list(songs)
+        payload = {'songs': songs, 'version': version}
+        if page:
+            payload.update({'page': page, 'per_page': per_page, 'total': len(songs_library)})
+        return payload
+
+    return cached_catalog_response(songs_response_cache, (fields, page, per_page if page else None), build)
+
+@app.route('/api/songs/browse', methods=['GET'])
+def browse_songs():
+    """Browse library A-Z by title, optionally filtered by prefix or range"""
+    limit = min(max(request.args.get('limit', 50, type=int), 0), 500)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    prefix = request.args.get('prefix')
+    if prefix:
+        song_ids, total = title_index.prefix(prefix, offset, limit)
+    else:
+        song_ids, total = title_index.range(request.args.get('start'), request.args.get('end'), offset, limit)
+    songs = song_list([song_catalog.get(i) for i in song_ids])
+    return json_response({'songs': songs, 'total': total, 'offset': offset, 'limit': limit})
 
 @app.route('/api/songs/<int:song_id>', methods=['GET'])
 def get_song(song_id):
-    song = next((s for s in songs_library if s['id'] == song_id), None)
+    song = song_catalog.get(song_id)
     if song:
-        return jsonify(song)
+        return json_response(Fragment(song_catalog.encode(song)))
     return jsonify({'error': 'Song not found'}), 404
 
 @app.route('/api/play_next/<int:song_id>', methods=['GET'])
 def play_next(song_id):
     """Get next song: prioritize playlist, then genre, then library"""
-    current_song = next((s for s in songs_library if s['id'] == song_id), None)
+    current_song = song_catalog.get(song_id)
     if not current_song:
         return jsonify({'song': None, 'message': 'Current song not found'})
 
     username = session.get('username')
     playlist_name = session.get('current_playlist')
+    next_song, source = None, 'none'
 
     # 1️⃣ Jika ada playlist aktif
-    if username and playlist_name and playlist_name in user_playlists.get(username, {}):
-        playlist = user_playlists[username][playlist_name]
-        songs_in_playlist = playlist.get_all_songs()
-
-        current_index = next((i for i, s in enumerate(songs_in_playlist) if s['id'] == song_id), -1)
-        if current_index >= 0 and current_index < len(songs_in_playlist) - 1:
-            next_song = songs_in_playlist[current_index + 1]
-            if username not in user_history:
-                user_history[username] = HistoryStack()
-            user_history[username].push(next_song)
-            return jsonify({'song': next_song})
+    with metrics.time('play_next_playlist'):
+        playlists = user_state.load('playlists', username) if username else {}
+        if playlist_name and playlist_name in playlists:
+            next_song = song_catalog.get(playlists[playlist_name].next_song_id(song_id))
+            source = 'playlist'
         # kalau playlist sudah habis → lanjut ke rekomendasi genre
 
-    # 2️⃣ Rekomendasi genre
-    rec_ids = recommendation_graph.get_recommendations(song_id)
-    if rec_ids:
-        same_genre_songs = [s for s in songs_library if s['id'] in rec_ids]
-        if same_genre_songs:
-            import random
-            next_song = random.choice(same_genre_songs)
-            if username:
-                if username not in user_history:
-                    user_history[username] = HistoryStack()
-                user_history[username].push(next_song)
-            return jsonify({'song': next_song})
+    # 2️⃣ Co-listen top-K, lalu tetangga genre; lewati lagu yang baru diputar
+    if not next_song:
+        with metrics.time('play_next_recommend'):
+            recent = {s['id'] for s in user_state.load('history', username).get_all()} if username else set()
+            recent.add(song_id)
+            colisten = colisten_graph.neighbors(song_id)
+            for candidate in recommend_ids(song_id, COLISTEN_TOP_K, request.args.get('seed', type=int)):
+                if candidate not in recent:
+                    next_song = song_catalog.get(candidate)
+                    source = 'colisten' if candidate in colisten else 'genre'
+                    break
 
     # 3️⃣ Fallback ke library
-    current_index = next((i for i, s in enumerate(songs_library) if s['id'] == song_id), -1)
-    if current_index >= 0 and current_index < len(songs_library) - 1:
-        next_song = songs_library[current_index + 1]
-        if username:
-            if username not in user_history:
-                user_history[username] = HistoryStack()
-            user_history[username].push(next_song)
-        return jsonify({'song': next_song})
+    if not next_song:
+        with metrics.time('play_next_library'):
+            current_index = song_catalog.position(song_id)
+            if current_index >= 0 and current_index < len(songs_library) - 1:
+                next_song = songs_library[current_index + 1]
+                source = 'library'
 
-    return jsonify({'song': None, 'message': 'No more songs'})
+    if not next_song:
+        metrics.inc('musicapp_play_next_total', source='none')
+        return jsonify({'song': None, 'message': 'No more songs'})
+
+    metrics.inc('musicapp_play_next_total', source=source)
+    if username:
+        record_play(username, next_song)
+    return jsonify({'song': next_song})
 
 @app.route('/api/playlists/<playlist_name>/songs/<int:song_id>/play', methods=['POST'])
 def play_song_from_playlist(playlist_name, song_id):
@@ -457,19 +4368,17 @@ def play_song_from_playlist(playlist_name, song_id):
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session['username']
-    if playlist_name not in user_playlists.get(username, {}):
+    if playlist_name not in user_state.load('playlists', username):
         return jsonify({'error': 'Playlist not found'}), 404
     
     # Set playlist aktif
     session['current_playlist'] = playlist_name
     
-    song = next((s for s in songs_library if s['id'] == song_id), None)
+    song = song_catalog.get(song_id)
     if not song:
         return jsonify({'error': 'Song not found'}), 404
     
-    if username not in user_history:
-        user_history[username] = HistoryStack()
-    user_history[username].push(song)
+    record_play(username, song)
     
     return jsonify({'success': True, 'song': song})
 
@@ -487,48 +4396,57 @@ def add_song():
         album = request.form.get('album')
 
         # Check for duplicates
-        for s in songs_library:
-            if s['title'].strip().lower() == title.strip().lower() and \
-               s['artist'].strip().lower() == artist.strip().lower():
+        if song_catalog.find_duplicate(title, artist):
+            return jsonify({'error': 'Song already exists'}), 400
+        if job_queue.full():
+            return jsonify({'error': 'Too many background jobs, try again later'}), 503
+
+        # Simpan file dan ubah katalog di bawah lock yang sama agar file yang
+        # baru di-dedup tidak terhapus oleh lagu lain yang melepas referensinya
+        with catalog_write():
+            # cek ulang di dalam lock: request lain bisa menambah lagu yang sama
+            if song_catalog.find_duplicate(title, artist):
                 return jsonify({'error': 'Song already exists'}), 400
+            audio_path, cover_path = None, None
 
-        audio_path, cover_path = None, None
-
-        if 'audio_file' in request.files:
-            audio_file = request.files['audio_file']
-            if audio_file and allowed_file(audio_file.filename, ALLOWED_AUDIO_EXTENSIONS):
-                filename = secure_filename(f"{datetime.now().timestamp()}_{audio_file.filename}")
-                audio_file.save(os.path.join(AUDIO_FOLDER, filename))
-                audio_path = f'/uploads/audio/{filename}'
-
-        if 'cover_file' in request.files:
-            cover_file = request.files['cover_file']
-            if cover_file and allowed_file(cover_file.filename, ALLOWED_IMAGE_EXTENSIONS):
-                filename = secure_filename(f"{datetime.now().timestamp()}_{cover_file.filename}")
-                cover_file.save(os.path.join(COVER_FOLDER, filename))
-                cover_path = f'/uploads/covers/{filename}'
-
-        new_id = max([s['id'] for s in songs_library], default=0) + 1
-        new_song = {
-            'id': new_id,
-            'title': title,
-            'artist': artist,
-            'duration': duration,
-            'genre': genre,
-            'album': album,
-            'audio_path': audio_path,
-            'cover_path': cover_path
-        }
+            if 'audio_file' in request.files:
+                audio_file = request.files['audio_file']
+                if audio_file and allowed_file(audio_file.filename, ALLOWED_AUDIO_EXTENSIONS):
+                    audio_path = store_upload(audio_file, AUDIO_FOLDER, '/uploads/audio')
 
-        songs_library.append(new_song)
-        
-        # Rebuild data structures
-        rebuild_data_structures()
+            if 'cover_file' in request.files:
+                cover_file = request.files['cover_file']
+                if cover_file and allowed_file(cover_file.filename, ALLOWED_IMAGE_EXTENSIONS):
+                    cover_path = store_upload(cover_file, COVER_FOLDER, '/uploads/covers')
 
-        save_songs()
-        return jsonify({'success': True, 'song': new_song})
+            new_id = song_catalog.allocate_id()
+            new_song = {
+                'id': new_id,
+                'title': title,
+                'artist': artist,
+                'duration': duration,
+                'genre': genre,
+                'album': album,
+                'audio_path': audio_path,
+                'cover_path': cover_path
+            }
 
+            song_catalog.add(new_song)
+            index_song(new_song)
+            upload_refs.track(new_id, song_upload_paths(new_song))
+            seq = save_song('add', new_song)
+        catalog_journal.wait_durable(seq)
+        event_hub.publish('catalog_changed', {'version': catalog_journal.seq})
+        job_id = schedule_song_media(new_song)
+        return jsonify({'success': True, 'song': new_song, 'job_id': job_id})
+
+    except RequestEntityTooLarge as e:
+        return jsonify({'error': e.description}), 413
+    except JournalTimeout as e:
+        return journal_timeout(e)
     except Exception as e:
+        count_exception(e)
+        print(f"Error in {request.endpoint}:", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -537,90 +4455,240 @@ def update_song(song_id):
     if 'username' not in session or session.get('role') != 'admin':
         return jsonify({'error': 'Unauthorized'}), 403
     try:
-        song = next((s for s in songs_library if s['id'] == song_id), None)
+        song = song_catalog.get(song_id)
         if not song:
             return jsonify({'error': 'Song not found'}), 404
 
-        song['title'] = request.form.get('title', song['title'])
-        song['artist'] = request.form.get('artist', song['artist'])
-        song['duration'] = int(request.form.get('duration', song['duration']))
-        song['genre'] = request.form.get('genre', song['genre'])
-        song['album'] = request.form.get('album', song.get('album'))
-
-        if 'audio_file' in request.files:
-            audio_file = request.files['audio_file']
-            if audio_file and allowed_file(audio_file.filename, ALLOWED_AUDIO_EXTENSIONS):
-                if song['audio_path']:
-                    old_path = song['audio_path'].replace('/uploads/audio/', '')
-                    try: os.remove(os.path.join(AUDIO_FOLDER, old_path))
-                    except: pass
-                filename = secure_filename(f"{datetime.now().timestamp()}_{audio_file.filename}")
-                audio_file.save(os.path.join(AUDIO_FOLDER, filename))
-                song['audio_path'] = f'/uploads/audio/{filename}'
-                
-        if 'cover_file' in request.files:
-            cover_file = request.files['cover_file']
-            if cover_file and allowed_file(cover_file.filename, ALLOWED_IMAGE_EXTENSIONS):
-                if song['cover_path']:
-                    old_path = song['cover_path'].replace('/uploads/covers/', '')
-                    try: os.remove(os.path.join(COVER_FOLDER, old_path))
-                    except: pass
-                filename = secure_filename(f"{datetime.now().timestamp()}_{cover_file.filename}")
-                cover_file.save(os.path.join(COVER_FOLDER, filename))
-                song['cover_path'] = f'/uploads/covers/{filename}'
-
-        # Rebuild data structures
-        rebuild_data_structures()
-        
-        save_songs()
-        return jsonify({'success': True, 'song': song})
+        fields = {
+            'title': request.form.get('title', song['title']),
+            'artist': request.form.get('artist', song['artist']),
+            'duration': int(request.form.get('duration', song['duration'])),
+            'genre': request.form.get('genre', song['genre']),
+            'album': request.form.get('album', song.get('album'))
+        }
+        if song_catalog.find_duplicate(fields['title'], fields['artist'], exclude_id=song_id):
+            return jsonify({'error': 'Song already exists'}), 400
+        if job_queue.full():
+            return jsonify({'error': 'Too many background jobs, try again later'}), 503
+
+        # Simpan file dan ubah katalog di bawah lock yang sama agar file yang
+        # baru di-dedup tidak terhapus oleh lagu lain yang melepas referensinya
+        with catalog_write():
+            if song_catalog.get(song_id) is not song:
+                return jsonify({'error': 'Song not found'}), 404
+            if song_catalog.find_duplicate(fields['title'], fields['artist'], exclude_id=song_id):
+                return jsonify({'error': 'Song already exists'}), 400
+            if 'audio_file' in request.files:
+                audio_file = request.files['audio_file']
+                if audio_file and allowed_file(audio_file.filename, ALLOWED_AUDIO_EXTENSIONS):
+                    fields['audio_path'] = store_upload(audio_file, AUDIO_FOLDER, '/uploads/audio')
+                    if fields['audio_path'] != song.get('audio_path'):
+                        fields['audio_info'] = None
+                        fields['waveform'] = None
+
+            if 'cover_file' in request.files:
+                cover_file = request.files['cover_file']
+                if cover_file and allowed_file(cover_file.filename, ALLOWED_IMAGE_EXTENSIONS):
+                    fields['cover_path'] = store_upload(cover_file, COVER_FOLDER, '/uploads/covers')
+                    if fields['cover_path'] != song.get('cover_path'):
+                        fields['covers'] = {}
+
+            song_catalog.update(song_id, fields)
+            index_song(song)
+            released = upload_refs.track(song_id, song_upload_paths(song))
+            seq = save_song('update', song)
+        catalog_journal.wait_durable(seq)
+        event_hub.publish('catalog_changed', {'version': catalog_journal.seq})
+        # file lama dihapus dan file baru dianalisis oleh job di background
+        job_id = schedule_song_media(song, audio='audio_info' in fields, cover='covers' in fields, remove=released)
+        return jsonify({'success': True, 'song': song, 'job_id': job_id})
+    except RequestEntityTooLarge as e:
+        return jsonify({'error': e.description}), 413
+    except JournalTimeout as e:
+        return journal_timeout(e)
     except Exception as e:
+        count_exception(e)
+        print(f"Error in {request.endpoint}:", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/songs/<int:song_id>', methods=['DELETE'])
 def delete_song(song_id):
     if 'username' not in session or session.get('role') != 'admin':
         return jsonify({'error': 'Unauthorized'}), 403
-    global songs_library
-    song = next((s for s in songs_library if s['id'] == song_id), None)
+    song = song_catalog.get(song_id)
     if not song:
         return jsonify({'error': 'Song not found'}), 404
 
-    if song['audio_path']:
-        audio_path = song['audio_path'].replace('/uploads/audio/', '')
-        try: os.remove(os.path.join(AUDIO_FOLDER, audio_path))
-        except: pass
-    if song['cover_path']:
-        cover_path = song['cover_path'].replace('/uploads/covers/', '')
-        try: os.remove(os.path.join(COVER_FOLDER, cover_path))
-        except: pass
+    with catalog_write():
+        if song_catalog.get(song_id) is None:   # sudah dihapus worker lain
+            return jsonify({'error': 'Song not found'}), 404
+        # journal dulu: jika langkah berikutnya gagal, penghapusan tetap tercatat
+        seq = save_song_deleted(song_id)
+        song = song_catalog.remove(song_id)
+        unindex_song(song_id)
+        released = upload_refs.release(song_id)
+    catalog_journal.wait_durable(seq)
+    event_hub.publish('catalog_changed', {'version': catalog_journal.seq})
+    job_id = schedule_song_media(song, audio=False, cover=False, remove=released)
+    return jsonify({'success': True, 'job_id': job_id})
 
-    songs_library = [s for s in songs_library if s['id'] != song_id]
-    
-    # Rebuild data structures
-    rebuild_data_structures()
-    
-    save_songs()
-    return jsonify({'success': True})
+# Batch update/delete: semua operasi divalidasi dulu di bawah catalog_lock;
+# jika satu saja gagal tidak ada yang diubah. Setelah itu katalog dan index
+# diperbarui sekali jalan dan ditulis sebagai satu record journal 'batch'.
+BATCH_MAX_OPS = 10000
+BATCH_PATCH_FIELDS = ('title', 'artist', 'duration', 'genre', 'album')
+BATCH_FILTER_FIELDS = ('title', 'artist', 'album', 'genre')
+
+def validate_song_patch(patch):
+    """Return (fields, error) for a batch patch"""
+    if not isinstance(patch, dict) or not patch:
+        return None, 'patch must be a non-empty object'
+    unknown = [f for f in patch if f not in BATCH_PATCH_FIELDS]
+    if unknown:
+        return None, f'unknown fields: {", ".join(unknown)}'
+    fields = {}
+    for field, value in patch.items():
+        if field == 'duration':
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                return None, 'duration must be a non-negative integer'
+        elif value is not None and not isinstance(value, str):
+            return None, f'{field} must be a string'
+        elif field in ('title', 'artist') and not (value or '').strip():
+            return None, f'{field} cannot be empty'
+        fields[field] = value
+    return fields, None
+
+def batch_filter_ids(criteria):
+    """Ids of songs whose fields equal every criterion, ignoring case and surrounding spaces"""
+    wanted = {field: genre_key(value) for field, value in criteria.items()}
+    return [song['id'] for song in songs_library
+            if all(genre_key(song.get(field)) == value for field, value in wanted.items())]
+
+@app.route('/api/songs/batch', methods=['POST'])
+def batch_songs():
+    """{"operations": [{"op": "update", "id": 1, "patch": {...}}, {"op": "delete", "id": 2}]}
+    or {"filter": {"genre": "pop"}, "patch": {"genre": "Pop"}} / {"filter": {...}, "delete": true}
+    """
+    if 'username' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body must be a JSON object'}), 400
+    if 'filter' in data:
+        criteria = data['filter']
+        if not isinstance(criteria, dict) or not criteria or any(f not in BATCH_FILTER_FIELDS for f in criteria):
+            return jsonify({'error': f'filter must use: {", ".join(BATCH_FILTER_FIELDS)}'}), 400
+        if not all(isinstance(value, str) for value in criteria.values()):
+            return jsonify({'error': 'filter values must be strings'}), 400
+        if data.get('delete') is True:
+            template = {'op': 'delete'}
+        elif 'patch' in data:
+            template = {'op': 'update', 'patch': data['patch']}
+        else:
+            return jsonify({'error': 'filter needs a patch or "delete": true'}), 400
+        operations = None
+    else:
+        operations = data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'operations must be a non-empty list'}), 400
+        if len(operations) > BATCH_MAX_OPS:
+            return jsonify({'error': f'At most {BATCH_MAX_OPS} operations per batch'}), 400
+    if job_queue.full():
+        return jsonify({'error': 'Too many background jobs, try again later'}), 503
+
+    with catalog_write():
+        if operations is None:
+            operations = [dict(template, id=song_id) for song_id in batch_filter_ids(criteria)]
+
+        # 1. validasi semua operasi
+        results = []
+        planned = []           # (op, song, fields, result)
+        seen_ids = set()
+        deleted = set()
+        final_keys = {}        # song_id -> (title, artist) setelah batch
+        for index, operation in enumerate(operations):
+            op = operation.get('op') if isinstance(operation, dict) else None
+            song_id = operation.get('id') if isinstance(operation, dict) else None
+            result = {'index': index, 'id': song_id, 'op': op, 'status': 'ok'}
+            results.append(result)
+            song = song_catalog.get(song_id) if type(song_id) is int else None
+            fields = None
+            if op not in ('update', 'delete'):
+                result['error'] = 'op must be "update" or "delete"'
+            elif song is None:
+                result['error'] = 'Song not found'
+            elif song_id in seen_ids:
+                result['error'] = 'Song appears more than once in the batch'
+            elif op == 'update':
+                fields, error = validate_song_patch(operation.get('patch'))
+                if error:
+                    result['error'] = error
+            if result.get('error'):
+                result['status'] = 'error'
+                continue
+            seen_ids.add(song_id)
+            if op == 'delete':
+                deleted.add(song_id)
+            else:
+                merged = dict(song, **fields)
+                final_keys[song_id] = song_key(merged.get('title'), merged.get('artist'))
+            planned.append((op, song, fields, result))
+
+        # judul/artis hasil update tidak boleh bentrok dengan lagu lain
+        claimed = {}
+        for op, song, fields, result in planned:
+            if op != 'update':
+                continue
+            key = final_keys[song['id']]
+            other = song_catalog.by_key.get(key)
+            conflict = claimed.get(key)
+            if conflict is None and other is not None and other['id'] != song['id'] and other['id'] not in deleted:
+                if final_keys.get(other['id'], key) == key:
+                    conflict = other['id']
+            if conflict is not None:
+                result.update(status='error', error=f'Song already exists (id {conflict})')
+            claimed.setdefault(key, song['id'])
+
+        if any(r['status'] == 'error' for r in results):
+            return jsonify({'success': False, 'error': 'Batch rejected; no songs were changed',
+                            'results': results}), 400
+
+        # 2. terapkan: katalog, index, dan referensi file sekali jalan
+        released = []
+        for song in song_catalog.remove_many(deleted):
+            unindex_song(song['id'])
+            released.extend(upload_refs.release(song['id']))
+        updated = song_catalog.update_many([(song['id'], fields) for op, song, fields, _ in planned if op == 'update'])
+        for song in updated:
+            index_song(song)
+        seq = save_songs_batch(updated, sorted(deleted)) if planned else None
+    if seq:
+        catalog_journal.wait_durable(seq)
+        event_hub.publish('catalog_changed', {'version': catalog_journal.seq})
+    job_id = None
+    if released:
+        job_id = job_queue.submit('song_media', {'song_id': None, 'remove': released})['id']
+    for result in results:
+        result['status'] = 'updated' if result['op'] == 'update' else 'deleted'
+    return jsonify({'success': True, 'updated': len(updated), 'deleted': len(deleted),
+                    'results': results, 'job_id': job_id})
 
 @app.route('/api/search', methods=['GET'])
 def search_songs():
     query = request.args.get('q', '').strip()
-    if not query:
-        return jsonify({'results': []})
-    
-    # Use BST to search
-    results = song_bst.search(query)
-    
-    # Remove duplicates based on song ID
-    seen = set()
-    unique_results = []
-    for song in results:
-        if song['id'] not in seen:
-            seen.add(song['id'])
-            unique_results.append(song)
-    
-    return jsonify({'results': unique_results})
+    limit = min(request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int), MAX_SEARCH_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    if not query or limit <= 0:
+        return jsonify({'results': [], 'total': 0, 'total_exact': True, 'limit': limit, 'offset': offset})
+
+    with metrics.time('search'):
+        result_ids, total, total_exact = search_index.search(query, limit=limit, offset=offset)
+    results = song_list([song_catalog.get(i) for i in result_ids])
+
+    # total_exact false: pencarian berhenti setelah halaman ini pasti, total hanya estimasi
+    return json_response({'results': results, 'total': total, 'total_exact': total_exact,
+                          'limit': limit, 'offset': offset})
 
 @app.route('/api/favorites', methods=['GET'])
 def get_favorites():
@@ -628,10 +4696,7 @@ def get_favorites():
         return jsonify({'favorites': []})
     
     username = session['username']
-    if username not in user_favorites:
-        user_favorites[username] = Playlist()
-    
-    return jsonify({'favorites': user_favorites[username].get_all_songs()})
+    return json_response({'favorites': song_list(user_state.load('favorites', username).get_all_songs())})
 
 @app.route('/api/favorites/<int:song_id>', methods=['POST'])
 def add_favorite(song_id):
@@ -639,15 +4704,14 @@ def add_favorite(song_id):
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session['username']
-    song = next((s for s in songs_library if s['id'] == song_id), None)
+    song = song_catalog.get(song_id)
     
     if not song:
         return jsonify({'error': 'Song not found'}), 404
     
-    if username not in user_favorites:
-        user_favorites[username] = Playlist()
-    
-    user_favorites[username].add_song(song)
+    with user_state.edit('favorites', username) as favorites:
+        favorites.add_song(song)
+    event_hub.publish_user(username, 'favorites_changed')
     return jsonify({'success': True})
 
 @app.route('/api/favorites/<int:song_id>', methods=['DELETE'])
@@ -656,8 +4720,10 @@ def remove_favorite(song_id):
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session['username']
-    if username in user_favorites:
-        user_favorites[username].remove_song(song_id)
+    with user_state.edit('favorites', username) as favorites:
+        removed = favorites.remove_song(song_id)
+    if removed:
+        event_hub.publish_user(username, 'favorites_changed')
     
     return jsonify({'success': True})
 
@@ -667,10 +4733,8 @@ def get_queue():
         return jsonify({'queue': []})
     
     username = session['username']
-    if username not in user_queues:
-        user_queues[username] = SongQueue()
-    
-    return jsonify({'queue': user_queues[username].get_all()})
+    queue = user_state.load('queue', username)
+    return jsonify({'queue': queue.get_all(), 'current': queue.get_current()})
 
 @app.route('/api/queue/<int:song_id>', methods=['POST'])
 def add_to_queue(song_id):
@@ -678,15 +4742,96 @@ def add_to_queue(song_id):
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session['username']
-    song = next((s for s in songs_library if s['id'] == song_id), None)
+    song = song_catalog.get(song_id)
     
     if not song:
         return jsonify({'error': 'Song not found'}), 404
     
-    if username not in user_queues:
-        user_queues[username] = SongQueue()
+    # {"next": true} = putar setelah lagu sekarang, {"position": n} = posisi tertentu
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body must be a JSON object'}), 400
+    position = data.get('position')
+    with user_state.edit('queue', username) as queue:
+        entry_id = queue.enqueue(song, play_next=bool(data.get('next')))
+        if type(position) is int:
+            queue.move(entry_id, position)
+    event_hub.publish_user(username, 'queue_changed')
+    return jsonify({'success': True, 'entry_id': entry_id})
+
+@app.route('/api/queue/bulk', methods=['POST'])
+def bulk_add_to_queue():
+    """Enqueue {"playlist": name}, {"album": name} or {"song_ids": [...]}"""
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    username = session['username']
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body must be a JSON object'}), 400
+    if 'playlist' in data:
+        playlist = user_state.load('playlists', username).get(data['playlist'])
+        if playlist is None:
+            return jsonify({'error': 'Playlist not found'}), 404
+        song_ids = playlist.song_ids()
+    elif 'album' in data:
+        album = str(data['album']).strip().lower()
+        song_ids = [s['id'] for s in songs_library if (s.get('album') or '').strip().lower() == album]
+    elif isinstance(data.get('song_ids'), list):
+        song_ids = data['song_ids']
+    else:
+        return jsonify({'error': 'playlist, album or song_ids required'}), 400
+    
+    song_ids = [i for i in song_ids if type(i) is int and song_catalog.get(i)]
+    if not song_ids:
+        return jsonify({'error': 'No songs to enqueue'}), 404
+    
+    with user_state.edit('queue', username) as queue:
+        entry_ids = queue.enqueue_many(song_ids, play_next=bool(data.get('next')))
+    event_hub.publish_user(username, 'queue_changed')
+    return jsonify({'success': True, 'entry_ids': entry_ids})
+
+@app.route('/api/queue/shuffle', methods=['POST'])
+def shuffle_queue():
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    username = session['username']
+    with user_state.edit('queue', username) as queue:
+        queue.shuffle()
+    event_hub.publish_user(username, 'queue_changed')
+    return jsonify({'success': True})
+
+@app.route('/api/queue/entries/<int:entry_id>', methods=['DELETE'])
+def remove_queue_entry(entry_id):
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    username = session['username']
+    if entry_id not in user_state.load('queue', username).entries:
+        return jsonify({'error': 'Queue entry not found'}), 404
+    
+    with user_state.edit('queue', username) as queue:
+        queue.remove_entry(entry_id)
+    event_hub.publish_user(username, 'queue_changed')
+    return jsonify({'success': True})
+
+@app.route('/api/queue/entries/<int:entry_id>/move', methods=['POST'])
+def move_queue_entry(entry_id):
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
     
-    user_queues[username].enqueue(song)
+    username = session['username']
+    data = request.get_json(silent=True)
+    position = data.get('position') if isinstance(data, dict) else None
+    if type(position) is not int:
+        return jsonify({'error': 'position required'}), 400
+    if entry_id not in user_state.load('queue', username).entries:
+        return jsonify({'error': 'Queue entry not found'}), 404
+    
+    with user_state.edit('queue', username) as queue:
+        queue.move(entry_id, position)
+    event_hub.publish_user(username, 'queue_changed')
     return jsonify({'success': True})
 
 @app.route('/api/queue/next', methods=['POST'])
@@ -695,10 +4840,9 @@ def get_next_in_queue():
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session['username']
-    if username not in user_queues:
-        user_queues[username] = SongQueue()
-    
-    next_song = user_queues[username].dequeue()
+    with user_state.edit('queue', username) as queue:
+        next_song = queue.dequeue()
+    event_hub.publish_user(username, 'queue_changed')
     return jsonify({'song': next_song})
 
 @app.route('/api/queue/<int:song_id>', methods=['DELETE'])
@@ -707,12 +4851,11 @@ def remove_from_queue(song_id):
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session['username']
-    if username not in user_queues:
-        return jsonify({'success': True})
     
     # Remove specific song from queue
-    queue = user_queues[username]
-    queue.items = [s for s in queue.items if s['id'] != song_id]
+    with user_state.edit('queue', username) as queue:
+        queue.remove_song(song_id)
+    event_hub.publish_user(username, 'queue_changed')
     
     return jsonify({'success': True})
 
@@ -722,8 +4865,9 @@ def clear_queue():
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session['username']
-    if username in user_queues:
-        user_queues[username].clear()
+    with user_state.edit('queue', username) as queue:
+        queue.clear()
+    event_hub.publish_user(username, 'queue_changed')
     
     return jsonify({'success': True})
 
@@ -733,10 +4877,7 @@ def get_history():
         return jsonify({'history': []})
     
     username = session['username']
-    if username not in user_history:
-        user_history[username] = HistoryStack()
-    
-    return jsonify({'history': user_history[username].get_all()})
+    return json_response({'history': song_list(user_state.load('history', username).get_all())})
 
 @app.route('/api/history/<int:song_id>', methods=['POST'])
 def add_to_history(song_id):
@@ -744,22 +4885,148 @@ def add_to_history(song_id):
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session['username']
-    song = next((s for s in songs_library if s['id'] == song_id), None)
+    song = song_catalog.get(song_id)
     
     if not song:
         return jsonify({'error': 'Song not found'}), 404
     
-    if username not in user_history:
-        user_history[username] = HistoryStack()
-    
-    user_history[username].push(song)
+    record_play(username, song)
     return jsonify({'success': True})
 
+def recommend_ids(song_id, limit, seed=None):
+    """Co-listen neighbors by weight, then genre neighbors; O(K + limit).
+
+    Without a seed the genre fill is the same on every call; a seed
+    makes it a reproducible random sample.
+    """
+    ids = [i for i in colisten_graph.neighbors(song_id)[:limit] if song_catalog.get(i)]
+    if len(ids) < limit:
+        rng = random.Random(seed * 1000003 + song_id) if seed is not None else None
+        picked = set(ids)
+        for i in recommendation_graph.get_recommendations(song_id, limit + len(ids), rng):
+            if i not in picked:
+                ids.append(i)
+                if len(ids) >= limit:
+                    break
+    return ids
+
+RECOMMENDATION_ENGINES = ('colisten', 'content')
+
+def content_recommend_ids(song_id, limit):
+    """Most similar songs by content; a stale matrix answers while the new one builds"""
+    version = song_catalog.version
+    if content_engine.version != version and content_engine.scheduled != version:
+        content_engine.scheduled = version
+        job_queue.submit('content_build', {}, key='content_build')
+    if content_engine.matrix is None:
+        # matriks pertama belum siap: lagu se-genre dulu
+        return recommendation_graph.get_recommendations(song_id, limit)
+    with metrics.time('content_similarity'):
+        # lagu yang sudah dihapus bisa masih ada di matriks lama
+        ids = content_engine.similar(song_id, limit + 10)
+    return [i for i in ids if song_catalog.get(i)][:limit]
+
 @app.route('/api/recommendations/<int:song_id>', methods=['GET'])
 def get_recommendations(song_id):
-    rec_ids = recommendation_graph.get_recommendations(song_id)
-    recommendations = [s for s in songs_library if s['id'] in rec_ids]
-    return jsonify({'recommendations': recommendations})
+    limit = min(max(request.args.get('limit', MAX_RECOMMENDATIONS, type=int), 1), MAX_RECOMMENDATIONS)
+    engine = request.args.get('engine', 'colisten')
+    if engine not in RECOMMENDATION_ENGINES:
+        return jsonify({'error': f'engine must be one of: {", ".join(RECOMMENDATION_ENGINES)}'}), 400
+    if engine == 'content':
+        if not ContentSimilarity.available():
+            return jsonify({'error': 'content engine requires numpy and scipy'}), 501
+        rec_ids = content_recommend_ids(song_id, limit)
+    else:
+        rec_ids = recommend_ids(song_id, limit, request.args.get('seed', type=int))
+    recommendations = song_list([song_catalog.get(i) for i in rec_ids])
+    return json_response({'recommendations': recommendations})
+
+def collect_recommendations(seed_ids, limit, include_seeds=False):
+    """Merge the recommendations of several seeds into one deduplicated list of songs"""
+    seen = set() if include_seeds else set(seed_ids)
+    results = []
+    for seed_id in seed_ids:
+        candidates = recommend_ids(seed_id, limit + len(seen))
+        if include_seeds:
+            candidates = [seed_id] + candidates
+        for song_id in candidates:
+            song = song_catalog.get(song_id)
+            if song is None or song_id in seen:
+                continue
+            seen.add(song_id)
+            results.append(song)
+            if len(results) >= limit:
+                return results
+    return results
+
+@app.route('/api/recommendations', methods=['GET'])
+def get_batch_recommendations():
+    try:
+        seeds = [int(x) for x in request.args.get('seeds', '').split(',') if x.strip()]
+    except ValueError:
+        return jsonify({'error': 'seeds must be a comma separated list of song ids'}), 400
+    limit = min(max(request.args.get('limit', HOME_FEED_SIZE, type=int), 1), MAX_RECOMMENDATIONS)
+    return json_response({'recommendations': song_list(collect_recommendations(seeds[:MAX_RECOMMENDATIONS], limit))})
+
+@app.route('/api/home_feed', methods=['GET'])
+def get_home_feed():
+    """Recommendation strip for the home page: first songs plus their genre neighbors"""
+    def build(version):
+        seeds = [s['id'] for s in songs_library[:HOME_FEED_SEEDS]]
+        feed = collect_recommendations(seeds, HOME_FEED_SIZE, include_seeds=True)
+        if len(feed) < HOME_FEED_SIZE:
+            picked = {s['id'] for s in feed}
+            for song in songs_library:
+                if len(feed) >= HOME_FEED_SIZE:
+                    break
+                if song['id'] not in picked:
+                    feed.append(song)
+        return {'songs': song_list(feed), 'version': version}
+
+    # rekomendasi co-listen ikut berubah, jadi versi graph masuk key cache (dan ETag lewat isi body)
+    return cached_catalog_response(home_feed_cache, 'home', build, colisten_graph.version)
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Server-Sent Events: catalog changes for everyone, state changes for the session user"""
+    username = session.get('username')
+    last_event_id = request.headers.get('Last-Event-ID')
+    last_seq = event_hub.parse_event_id(last_event_id)
+    if not event_hub.open_stream():
+        response = jsonify({'error': 'Too many event streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '10'
+        return response
+
+    def generate(cursor, resync):
+        yield f'retry: 3000\nevent: hello\ndata: {json.dumps({"version": catalog_journal.seq})}\n\n'
+        if resync:
+            # id dari process lain atau sebelum restart: seq-nya tidak berarti di sini
+            yield f'id: {event_hub.event_id(cursor)}\nevent: resync\ndata: {{}}\n\n'
+        while True:
+            cursor_before = cursor
+            cursor, events = event_hub.wait(cursor)
+            if events is None:
+                # Client tertinggal terlalu jauh, minta reload penuh
+                yield f'id: {event_hub.event_id(cursor)}\nevent: resync\ndata: {{}}\n\n'
+                continue
+            sent = False
+            for seq, target, name, data in events:
+                if target is not None and target != username:
+                    continue
+                yield f'id: {event_hub.event_id(seq)}\nevent: {name}\ndata: {json.dumps(data)}\n\n'
+                sent = True
+            if not sent and cursor == cursor_before:
+                yield ': keepalive\n\n'
+
+    resync = last_event_id is not None and last_seq is None
+    if last_seq is None:
+        last_seq = event_hub.seq
+    response = Response(generate(last_seq, resync), mimetype='text/event-stream')
+    response.call_on_close(event_hub.close_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
@@ -771,9 +5038,163 @@ def get_stats():
     return jsonify({
         'total_songs': len(songs_library),
         'total_users': total_users,
-        'total_playlists': sum(len(p) for p in user_playlists.values())
+        'total_playlists': user_state.count_playlists(),
+        'total_plays': play_log.refresh().total
     })
 
+def day_label(day):
+    return time.strftime('%Y-%m-%d', time.gmtime(day * 86400))
+
+def top_songs(counter, limit):
+    return [{'song': song_catalog.get(song_id) or {'id': song_id}, 'plays': plays}
+            for song_id, plays in counter.most_common(limit)]
+
+def play_bucket_summary(bucket, limit):
+    bucket = bucket or PlayStats.new_bucket()
+    return {
+        'plays': bucket['plays'],
+        'top_songs': top_songs(bucket['songs'], limit),
+        'top_artists': [{'artist': a, 'plays': n} for a, n in bucket['artists'].most_common(limit)],
+        'top_genres': [{'genre': g, 'plays': n} for g, n in bucket['genres'].most_common(limit)],
+    }
+
+# hasil terakhir per parameter; dipakai ulang selama log tidak bertambah
+play_stats_cache = {}
+
+@app.route('/api/stats/plays', methods=['GET'])
+def get_play_stats():
+    """Play analytics: all-time, per user, and per day/week (UTC)"""
+    if 'username' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    day = int(time.time()) // 86400
+    if request.args.get('date'):
+        try:
+            day = calendar.timegm(time.strptime(request.args['date'], '%Y-%m-%d')) // 86400
+        except ValueError:
+            return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    week = (day + 3) // 7
+    
+    stats = play_log.refresh()
+    song_id = request.args.get('song_id', type=int)
+    if song_id is not None:
+        return jsonify({'song_id': song_id, 'plays': stats.songs.get(song_id, 0)})
+    
+    key = (limit, day)
+    cached = play_stats_cache.get(key)
+    if cached and cached[0] == play_log.offset:
+        return jsonify(cached[1])
+    
+    payload = {
+        'total_plays': stats.total,
+        'top_songs': top_songs(stats.songs, limit),
+        'top_users': [{'username': u, 'plays': n} for u, n in stats.users.most_common(limit)],
+        'day': dict(play_bucket_summary(stats.days.get(day), limit), date=day_label(day)),
+        'week': dict(play_bucket_summary(stats.weeks.get(week), limit), start=day_label(week * 7 - 3)),
+        'daily': [{'date': day_label(d), 'plays': stats.days[d]['plays']} for d in sorted(stats.days)],
+    }
+    if len(play_stats_cache) > 32:
+        play_stats_cache.clear()
+    play_stats_cache[key] = (play_log.offset, payload)
+    return jsonify(payload)
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Captured profiles (newest first) and the current profiler config"""
+    if 'username' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify({'config': request_profiler.get_config(), 'profiles': request_profiler.list()})
+
+@app.route('/api/admin/profiles/config', methods=['PUT'])
+def update_profile_config():
+    """{"sample_rate": 0..1, "endpoints": [...], "mode": "cprofile"|"sampler", "slow_ms": n (0 = off)}"""
+    if 'username' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body must be a JSON object'}), 400
+    changes = {}
+    if 'sample_rate' in data:
+        if not isinstance(data['sample_rate'], (int, float)) or not 0 <= data['sample_rate'] <= 1:
+            return jsonify({'error': 'sample_rate must be between 0 and 1'}), 400
+        changes['sample_rate'] = float(data['sample_rate'])
+    if 'endpoints' in data:
+        unknown = [e for e in data['endpoints'] if e not in app.view_functions] if isinstance(data['endpoints'], list) else None
+        if unknown is None or unknown:
+            return jsonify({'error': 'Unknown endpoints', 'endpoints': unknown}), 400
+        changes['endpoints'] = data['endpoints']
+    if 'mode' in data:
+        if data['mode'] not in ('cprofile', 'sampler'):
+            return jsonify({'error': 'mode must be cprofile or sampler'}), 400
+        changes['mode'] = data['mode']
+    if 'slow_ms' in data:
+        if not isinstance(data['slow_ms'], (int, float)) or data['slow_ms'] < 0:
+            return jsonify({'error': 'slow_ms must be >= 0'}), 400
+        changes['slow_ms'] = data['slow_ms']
+    return jsonify({'success': True, 'config': request_profiler.set_config(changes)})
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """Download a profile: .prof for pstats/snakeviz, .txt collapsed stacks for flame graphs"""
+    if 'username' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    meta = request_profiler.get(profile_id)
+    if not meta:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_from_directory(os.path.abspath(PROFILE_DIR), meta['file'], as_attachment=True)
+
+@app.route('/api/admin/import', methods=['POST'])
+def import_songs():
+    """{"source": folder or .csv/.jsonl manifest inside imports/}; runs as a background job"""
+    if 'username' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body must be a JSON object'}), 400
+    root = os.path.abspath(IMPORT_FOLDER)
+    source = safe_join(root, str(data.get('source', '')).strip('/'))
+    if source is None:
+        return jsonify({'error': 'source must be inside the import folder'}), 400
+    if not os.path.exists(source):
+        return jsonify({'error': 'Import source not found'}), 404
+    if not (os.path.isdir(source) or source.lower().endswith(IMPORT_MANIFEST_EXTENSIONS)):
+        return jsonify({'error': 'source must be a directory or a .csv/.jsonl manifest'}), 400
+    if job_queue.full():
+        return jsonify({'error': 'Too many background jobs, try again later'}), 503
+    job = job_queue.submit('import', {'source': source, 'root': root})
+    return jsonify({'success': True, 'job_id': job['id']}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    if 'username' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job': job})
+
+@app.route('/api/admin/jobs', methods=['GET'])
+def list_jobs():
+    if 'username' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    status = request.args.get('status')
+    if status is not None and status not in JOB_STATUSES:
+        return jsonify({'error': f'status must be one of: {", ".join(JOB_STATUSES)}'}), 400
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    return jsonify({'jobs': job_queue.list(status, limit), 'queued': job_queue.queued()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition"""
+    metrics.set('musicapp_catalog_songs', len(songs_library))
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # === PLAYLIST ENDPOINTS ===
 
 @app.route('/api/playlists', methods=['GET'])
@@ -782,18 +5203,15 @@ def get_playlists():
         return jsonify({'playlists': []})
     
     username = session['username']
-    if username not in user_playlists:
-        user_playlists[username] = {}
-    
     playlists_data = []
-    for name, playlist in user_playlists[username].items():
+    for name, playlist in user_state.load('playlists', username).items():
         playlists_data.append({
             'name': name,
-            'songs': playlist.get_all_songs(),
-            'count': len(playlist.get_all_songs())
+            'songs': song_list(playlist.get_all_songs()),
+            'count': len(playlist)
         })
     
-    return jsonify({'playlists': playlists_data})
+    return json_response({'playlists': playlists_data})
 
 @app.route('/api/playlists', methods=['POST'])
 def create_playlist():
@@ -803,17 +5221,16 @@ def create_playlist():
     data = request.json
     playlist_name = data.get('name')
     
-    if not playlist_name:
+    if not playlist_name or not isinstance(playlist_name, str):
         return jsonify({'error': 'Playlist name required'}), 400
     
     username = session['username']
-    if username not in user_playlists:
-        user_playlists[username] = {}
-    
-    if playlist_name in user_playlists[username]:
+    if playlist_name in user_state.load('playlists', username):
         return jsonify({'error': 'Playlist already exists'}), 400
     
-    user_playlists[username][playlist_name] = Playlist()
+    with user_state.edit('playlists', username) as playlists:
+        playlists.setdefault(playlist_name, Playlist())
+    event_hub.publish_user(username, 'playlists_changed')
     return jsonify({'success': True, 'message': 'Playlist created'})
 
 @app.route('/api/playlists/<playlist_name>', methods=['DELETE'])
@@ -822,8 +5239,10 @@ def delete_playlist(playlist_name):
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session['username']
-    if username in user_playlists and playlist_name in user_playlists[username]:
-        del user_playlists[username][playlist_name]
+    if playlist_name in user_state.load('playlists', username):
+        with user_state.edit('playlists', username) as playlists:
+            playlists.pop(playlist_name, None)
+        event_hub.publish_user(username, 'playlists_changed')
         return jsonify({'success': True})
     
     return jsonify({'error': 'Playlist not found'}), 404
@@ -834,19 +5253,23 @@ def add_song_to_playlist(playlist_name, song_id):
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session['username']
-    song = next((s for s in songs_library if s['id'] == song_id), None)
+    song = song_catalog.get(song_id)
     
     if not song:
         return jsonify({'error': 'Song not found'}), 404
     
-    if username not in user_playlists:
-        user_playlists[username] = {}
-    
-    if playlist_name not in user_playlists[username]:
+    if playlist_name not in user_state.load('playlists', username):
         return jsonify({'error': 'Playlist not found'}), 404
     
-    user_playlists[username][playlist_name].add_song(song)
-    return jsonify({'success': True})
+    if song_id in user_state.load('playlists', username)[playlist_name]:
+        return jsonify({'success': True, 'added': False})
+    
+    with user_state.edit('playlists', username) as playlists:
+        added = playlist_name in playlists and playlists[playlist_name].add_song(song)
+        if added:
+            colisten_graph.observe_playlist(playlists[playlist_name], [song_id])
+    event_hub.publish_user(username, 'playlists_changed')
+    return jsonify({'success': True, 'added': added})
 
 @app.route('/api/playlists/<playlist_name>/songs/<int:song_id>', methods=['DELETE'])
 def remove_song_from_playlist(playlist_name, song_id):
@@ -855,11 +5278,105 @@ def remove_song_from_playlist(playlist_name, song_id):
     
     username = session['username']
     
-    if username in user_playlists and playlist_name in user_playlists[username]:
-        user_playlists[username][playlist_name].remove_song(song_id)
+    if playlist_name in user_state.load('playlists', username):
+        with user_state.edit('playlists', username) as playlists:
+            if playlist_name in playlists:
+                playlists[playlist_name].remove_song(song_id)
+        event_hub.publish_user(username, 'playlists_changed')
         return jsonify({'success': True})
     
     return jsonify({'error': 'Playlist not found'}), 404
 
+@app.route('/api/playlists/<playlist_name>/songs', methods=['GET'])
+def get_playlist_songs(playlist_name):
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    playlist = user_state.load('playlists', session['username']).get(playlist_name)
+    if playlist is None:
+        return jsonify({'error': 'Playlist not found'}), 404
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    return json_response({
+        'name': playlist_name,
+        'songs': song_list(playlist.get_all_songs((page - 1) * per_page, per_page)),
+        'page': page,
+        'per_page': per_page,
+        'total': len(playlist)
+    })
+
+@app.route('/api/playlists/<playlist_name>/songs', methods=['POST'])
+def add_songs_to_playlist(playlist_name):
+    """Bulk add: {"song_ids": [...]}; unknown or duplicate ids are skipped"""
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    username = session['username']
+    song_ids = (request.json or {}).get('song_ids')
+    if not isinstance(song_ids, list):
+        return jsonify({'error': 'song_ids must be a list'}), 400
+    if playlist_name not in user_state.load('playlists', username):
+        return jsonify({'error': 'Playlist not found'}), 404
+    
+    song_ids = [i for i in song_ids if type(i) is int and song_catalog.get(i)]
+    with user_state.edit('playlists', username) as playlists:
+        added = playlists[playlist_name].add_songs(song_ids) if playlist_name in playlists else []
+        if added:
+            colisten_graph.observe_playlist(playlists[playlist_name], added)
+    if added:
+        event_hub.publish_user(username, 'playlists_changed')
+    return jsonify({'success': True, 'added': added})
+
+@app.route('/api/playlists/<playlist_name>/songs', methods=['PUT'])
+def reorder_playlist(playlist_name):
+    """Replace the order: {"song_ids": [...]} with exactly the playlist's songs"""
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    username = session['username']
+    song_ids = (request.json or {}).get('song_ids')
+    if not isinstance(song_ids, list) or not all(type(i) is int for i in song_ids):
+        return jsonify({'error': 'song_ids must be a list'}), 400
+    if playlist_name not in user_state.load('playlists', username):
+        return jsonify({'error': 'Playlist not found'}), 404
+    
+    with user_state.edit('playlists', username) as playlists:
+        ok = playlist_name in playlists and playlists[playlist_name].reorder(song_ids)
+    if not ok:
+        return jsonify({'error': 'song_ids must match the songs in the playlist'}), 400
+    event_hub.publish_user(username, 'playlists_changed')
+    return jsonify({'success': True})
+
+@app.route('/api/playlists/<playlist_name>/songs/<int:song_id>/move', methods=['POST'])
+def move_song_in_playlist(playlist_name, song_id):
+    """Move a song: {"after": <song id or null>} or {"position": <index>}"""
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    username = session['username']
+    data = request.json or {}
+    playlist = user_state.load('playlists', username).get(playlist_name)
+    if playlist is None or song_id not in playlist:
+        return jsonify({'error': 'Playlist or song not found'}), 404
+    if 'after' in data:
+        if data['after'] is not None and type(data['after']) is not int:
+            return jsonify({'error': 'after must be a song id or null'}), 400
+    elif type(data.get('position')) is not int:
+        return jsonify({'error': 'after or position required'}), 400
+    
+    with user_state.edit('playlists', username) as playlists:
+        playlist = playlists.get(playlist_name)
+        if playlist is None:
+            ok = False
+        elif 'after' in data:
+            ok = playlist.move_song(song_id, data['after'])
+        else:
+            ok = playlist.move_to(song_id, data['position'])
+    if not ok:
+        return jsonify({'error': 'Invalid position'}), 400
+    event_hub.publish_user(username, 'playlists_changed')
+    return jsonify({'success': True})
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,6 @@
+"""Benchmarks for the music app.
+
+    python -m benchmarks.suite --sizes 1000 10000 100000
+    python benchmarks/audio_stream.py
+    python benchmarks/state_workers.py
+"""
@@ -0,0 +1,94 @@
+"""Concurrent audio streaming benchmark for /uploads/audio/<filename>.
+
+Compares the old ``send_from_directory`` path with ``serve_audio`` by
+running both behind a threaded werkzeug server and letting N clients
+fetch a track in Range chunks, the way a browser seeks and buffers.
+
+    python benchmarks/audio_stream.py --clients 16 --size-mb 20
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fetch_ranges(port, path, size, chunk, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    received = 0
+    start = time.perf_counter()
+    for offset in range(0, size, chunk):
+        end = min(offset + chunk, size) - 1
+        conn.request('GET', path, headers={'Range': f'bytes={offset}-{end}'})
+        response = conn.getresponse()
+        received += len(response.read())
+    conn.close()
+    results.append((received, time.perf_counter() - start))
+
+
+def run(port, path, size, clients, chunk):
+    results = []
+    threads = [threading.Thread(target=fetch_ranges, args=(port, path, size, chunk, results))
+               for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = sum(r[0] for r in results)
+    return {
+        'bytes': total,
+        'seconds': round(elapsed, 3),
+        'throughput_mb_s': round(total / elapsed / 1024 / 1024, 1),
+        'requests_per_s': round(clients * -(-size // chunk) / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--size-mb', type=int, default=20)
+    parser.add_argument('--chunk-kb', type=int, default=256)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='audio-bench-')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    import app as music_app
+    from flask import send_from_directory
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    @music_app.app.route('/bench/baseline/<filename>')
+    def baseline_audio(filename):
+        return send_from_directory(os.path.abspath(music_app.AUDIO_FOLDER), filename)
+
+    size = args.size_mb * 1024 * 1024
+    with open(os.path.join(music_app.AUDIO_FOLDER, 'bench.mp3'), 'wb') as f:
+        f.write(os.urandom(size))
+
+    server = make_server('127.0.0.1', 0, music_app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    chunk = args.chunk_kb * 1024
+    report = {
+        'clients': args.clients,
+        'size_mb': args.size_mb,
+        'chunk_kb': args.chunk_kb,
+        'before': run(server.port, '/bench/baseline/bench.mp3', size, args.clients, chunk),
+        'after': run(server.port, '/uploads/audio/bench.mp3', size, args.clients, chunk),
+    }
+    server.shutdown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
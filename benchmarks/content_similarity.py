@@ -0,0 +1,80 @@
+"""Build and query benchmark for the content-similarity engine.
+
+Builds the feature matrix for a synthetic catalog of each size, then
+times top-K queries for random songs twice: once cold (every query
+computes cosine similarity) and once warm (served from the LRU cache).
+Needs numpy and scipy.
+
+    python benchmarks/content_similarity.py --sizes 100000 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import generate_catalog  # noqa: E402
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def time_queries(engine, song_ids, k):
+    samples = []
+    for song_id in song_ids:
+        start = time.perf_counter()
+        engine.similar(song_id, k)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def run(music_app, size, queries, k, seed):
+    songs = generate_catalog(size, seed)
+    engine = music_app.ContentSimilarity(cache_size=queries)
+    start = time.perf_counter()
+    engine.build(songs, version=1)
+    build_s = time.perf_counter() - start
+    matrix = engine.matrix
+    rng = random.Random(seed)
+    sample = rng.sample(range(1, size + 1), queries)
+    return {
+        'songs': size,
+        'features': matrix.shape[1],
+        'nnz': int(matrix.nnz),
+        'matrix_mb': round((matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) * 2 / 1024 / 1024, 1),
+        'build_s': round(build_s, 2),
+        'cold': time_queries(engine, sample, k),
+        'cached': time_queries(engine, sample, k),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='content-bench-'))
+    import app as music_app
+    if not music_app.ContentSimilarity.available():
+        sys.exit('numpy and scipy are required for this benchmark')
+    report = [run(music_app, size, args.queries, args.k, args.seed) for size in args.sizes]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Short-query latency benchmark for the search index.
+
+Builds a SearchIndex over a synthetic catalog (1M songs by default) and
+times the queries a search box sends while the user types: one to three
+letters, word prefixes, whole words, two words and word + number. Each
+query is also checked against a brute-force scan of a sample of the
+catalog so a fast but wrong index fails the run. Exits non-zero when the
+overall p99 is above --max-p99-ms.
+
+    python benchmarks/search_short.py --sizes 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import GENRES, WORDS, generate_catalog  # noqa: E402
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def make_queries(rng, count):
+    """(kind, query) pairs, spread evenly over the kinds"""
+    makers = {
+        'one_char': lambda: rng.choice(WORDS)[0],
+        'two_chars': lambda: rng.choice(WORDS)[:2],
+        'three_chars': lambda: rng.choice(WORDS)[:3],
+        'word': lambda: rng.choice(WORDS + [g.lower() for g in GENRES]),
+        'two_words': lambda: f'{rng.choice(WORDS)} {rng.choice(WORDS)}',
+        'word_prefix': lambda: f'{rng.choice(WORDS)} {rng.choice(WORDS)[:2]}',
+        'word_number': lambda: f'{rng.choice(WORDS)} {rng.randint(1, 99)}',
+    }
+    kinds = list(makers)
+    return [(kinds[i % len(kinds)], makers[kinds[i % len(kinds)]]()) for i in range(count)]
+
+
+def check(music_app, index, sample, query, limit):
+    """Results come in rank order and no sampled song that ranks higher is missing"""
+    ids, _, _ = index.search(query, limit=limit)
+    forms = [music_app.term_forms(term) for term in dict.fromkeys(query.lower().split())]
+    keys = [(-index._score(i, forms), i) for i in ids]
+    assert keys == sorted(keys) and all(score for score, _ in keys), f'{query!r}: bad ranking'
+    last = keys[-1] if len(ids) == limit else (0, float('inf'))
+    for song in sample:
+        score = index._score(song['id'], forms)
+        if score and (-score, song['id']) < last:
+            assert song['id'] in ids, f'{query!r}: missed song {song["id"]}'
+
+
+def run(music_app, size, queries, limit, seed, check_sample):
+    songs = generate_catalog(size, seed)
+    index = music_app.SearchIndex()
+    before = rss_mb()
+    start = time.perf_counter()
+    for song in songs:
+        index.add_song(song)
+    build_s = time.perf_counter() - start
+    index_mb = rss_mb() - before
+
+    rng = random.Random(seed)
+    sample = rng.sample(songs, min(check_sample, size))
+    workload = make_queries(rng, queries)
+    for _, query in workload[:50]:
+        check(music_app, index, sample, query, limit)
+
+    by_kind = {}
+    for kind, query in workload:
+        start = time.perf_counter()
+        index.search(query, limit=limit)
+        by_kind.setdefault(kind, []).append((time.perf_counter() - start) * 1000)
+    samples = [ms for values in by_kind.values() for ms in values]
+    return {
+        'songs': size,
+        'build_s': round(build_s, 1),
+        'index_mb': round(index_mb),
+        'queries': len(samples),
+        'p50_ms': round(statistics.median(samples), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'max_ms': round(max(samples), 3),
+        'by_kind': {kind: {'p50_ms': round(statistics.median(values), 3),
+                           'p99_ms': round(percentile(values, 99), 3)}
+                    for kind, values in by_kind.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--check-sample', type=int, default=20000,
+                        help='songs scanned by the brute-force correctness check')
+    parser.add_argument('--max-p99-ms', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='search-bench-'))
+    import app as music_app
+    report = [run(music_app, size, args.queries, args.limit, args.seed, args.check_sample) for size in args.sizes]
+    print(json.dumps(report, indent=2))
+    slow = [r['songs'] for r in report if r['p99_ms'] > args.max_p99_ms]
+    if slow:
+        sys.exit(f'p99 above {args.max_p99_ms} ms for sizes {slow}')
+
+
+if __name__ == '__main__':
+    main()
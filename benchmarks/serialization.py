@@ -0,0 +1,91 @@
+"""Encode-time and allocation benchmark for catalog JSON responses.
+
+Serializes a list response of every song in a synthetic catalog three
+ways: the old path (jsonify, and json.dumps as used by the response
+cache), the fragment path with an empty per-song cache (cold), and the
+fragment path with every song already encoded (warm). Allocations are
+the tracemalloc peak of one encode.
+
+    python benchmarks/serialization.py --sizes 10000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import generate_catalog  # noqa: E402
+
+
+def measure(encode, iterations, before=None):
+    samples = []
+    for _ in range(iterations):
+        if before:
+            before()
+        start = time.perf_counter()
+        body = encode()
+        samples.append((time.perf_counter() - start) * 1000)
+    if before:
+        before()
+    tracemalloc.start()
+    encode()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'p50_ms': round(statistics.median(samples), 2),
+        'min_ms': round(min(samples), 2),
+        'peak_alloc_kb': round(peak / 1024, 1),
+        'bytes': len(body),
+    }
+
+
+def run(music_app, size, iterations, seed):
+    catalog = music_app.song_catalog
+    catalog.load(generate_catalog(size, seed))
+    songs = catalog.songs
+
+    def old_jsonify():
+        with music_app.app.app_context():
+            return music_app.jsonify({'results': songs}).get_data()
+
+    def old_dumps():
+        return json.dumps({'songs': songs}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def fragments():
+        return music_app.encode_fragments({'songs': music_app.song_list(songs)})
+
+    # cek: isi sama dengan encoder lama
+    assert json.loads(fragments()) == json.loads(old_dumps())
+    report = {
+        'songs': size,
+        'encoder': 'orjson' if music_app.orjson is not None else 'json',
+        'jsonify': measure(old_jsonify, iterations),
+        'json_dumps': measure(old_dumps, iterations),
+        'fragments_cold': measure(fragments, iterations, before=catalog.encoded.clear),
+    }
+    fragments()
+    report['fragments_warm'] = measure(fragments, iterations)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='serialization-bench-'))
+    import app as music_app
+    report = [run(music_app, size, args.iterations, args.seed) for size in args.sizes]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Multi-worker load test for the shared user state store and catalog journal.
+
+Starts N worker processes in the same working directory, so they share
+data/user_state.db and data/catalog.journal the way gunicorn workers
+would. Each worker logs in its own user and loops over queue, favorites,
+playlist and history requests through the Flask test client for a fixed
+duration. Every worker also adds songs to the catalog as an admin and
+edits the queue and a playlist of one user that all workers share.
+After the run the state is checked from a fresh process: every added
+song is present exactly once, journal seqs are contiguous, the shared
+user's playlist and queue lost no edit, and every worker serves the same
+/api/songs ETag. Exits non-zero when a check fails.
+
+    python benchmarks/state_workers.py --workers 1 2 4 --seconds 5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def login(music_app, username, role='user'):
+    music_app.users[username] = {'password': 'bench', 'role': role}
+    client = music_app.app.test_client()
+    client.post('/login', json={'username': username, 'password': 'bench'})
+    return client
+
+
+def worker(workdir, index, seconds, compact_records, start_event, done_barrier, results):
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    import app as music_app
+    music_app.JOURNAL_COMPACT_RECORDS = compact_records   # compaction juga terjadi selama run
+
+    client = login(music_app, f'bench{index}')
+    shared = login(music_app, 'shared')
+    admin = login(music_app, f'admin{index}', role='admin')
+    client.post('/api/playlists', json={'name': 'bench'})
+    shared.post('/api/playlists', json={'name': 'shared'})   # 400 jika worker lain lebih dulu
+    song_ids = [song['id'] for song in music_app.songs_library]
+
+    start_event.wait()
+    ops = 0
+    errors = 0
+    created = []
+    enqueued = dequeued = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        song_id = song_ids[ops % len(song_ids)]
+        for method, path in (
+            ('post', f'/api/queue/{song_id}'),
+            ('get', '/api/queue'),
+            ('post', '/api/queue/next'),
+            ('post', f'/api/favorites/{song_id}'),
+            ('get', '/api/favorites'),
+            ('post', f'/api/playlists/bench/songs/{song_id}'),
+            ('get', '/api/playlists'),
+            ('post', f'/api/history/{song_id}'),
+            ('get', '/api/history'),
+        ):
+            if getattr(client, method)(path).status_code != 200:
+                errors += 1
+            ops += 1
+
+        # katalog dan user yang sama dari semua worker
+        response = admin.post('/api/songs', data={'title': f'Bench {index}-{len(created)}', 'artist': 'Bench'})
+        ops += 1
+        if response.status_code != 200:
+            errors += 1
+            continue
+        new_id = response.get_json()['song']['id']
+        created.append(new_id)
+        for path in (f'/api/playlists/shared/songs/{new_id}', f'/api/queue/{new_id}'):
+            if shared.post(path).status_code != 200:
+                errors += 1
+            ops += 1
+        enqueued += 1
+        if len(created) % 2 == 0:
+            response = shared.post('/api/queue/next')
+            ops += 1
+            if response.status_code != 200:
+                errors += 1
+            elif response.get_json()['song']:
+                dequeued += 1
+
+    # ETag dibandingkan setelah semua worker selesai menulis
+    done_barrier.wait()
+    etag = admin.get('/api/songs').headers.get('ETag')
+    results.put({'ops': ops, 'errors': errors, 'created': created,
+                 'enqueued': enqueued, 'dequeued': dequeued, 'etag': etag})
+
+
+def check_consistency(workdir, workers, stats, results):
+    """Checks run by a fresh process against what the workers reported"""
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    import app as music_app
+
+    created = [song_id for s in stats for song_id in s['created']]
+    journal = music_app.CatalogJournal(music_app.SNAPSHOT_FILE, music_app.JOURNAL_FILE)
+    with open(music_app.SNAPSHOT_FILE, encoding='utf-8') as f:
+        seqs = [json.load(f)['seq']]
+    seqs += [record['seq'] for record in journal._read_records(music_app.JOURNAL_FILE) if record['seq'] > seqs[0]]
+    playlist = music_app.user_state.load('playlists', 'shared')['shared']
+    queue = music_app.user_state.load('queue', 'shared')
+    etags = {s['etag'] for s in stats}
+    checks = {
+        'favorites': all(music_app.user_state.load('favorites', f'bench{i}').get_all_songs()
+                         for i in range(workers)),
+        'unique_song_ids': len(set(created)) == len(created),
+        'songs_present': all(music_app.song_catalog.get(i) for i in created),
+        'journal_seqs': seqs == list(range(seqs[0], seqs[0] + len(seqs))),
+        'shared_playlist': sorted(playlist.song_ids()) == sorted(created),
+        'shared_queue': len(queue) == sum(s['enqueued'] - s['dequeued'] for s in stats),
+        'same_etag': len(etags) == 1 and etags == {music_app.app.test_client().get('/api/songs').headers['ETag']},
+    }
+    results.put(checks)
+
+
+def run(workers, seconds, compact_records):
+    workdir = tempfile.mkdtemp(prefix='state-bench-')
+    ctx = multiprocessing.get_context('spawn')
+    start_event = ctx.Event()
+    done_barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(workdir, i, seconds, compact_records, start_event, done_barrier, results))
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+    # beri waktu worker untuk import app dan login
+    time.sleep(3)
+    start_event.set()
+    stats = [results.get(timeout=seconds + 120) for _ in procs]
+    for p in procs:
+        p.join()
+
+    checker = ctx.Process(target=check_consistency, args=(workdir, workers, stats, results))
+    checker.start()
+    checks = results.get(timeout=120)
+    checker.join()
+    ops = sum(s['ops'] for s in stats)
+    return {
+        'workers': workers,
+        'ops': ops,
+        'errors': sum(s['errors'] for s in stats),
+        'ops_per_s': round(ops / seconds, 1),
+        'songs_added': sum(len(s['created']) for s in stats),
+        'checks': checks,
+        'consistent': all(checks.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--compact-records', type=int, default=50,
+                        help='journal records before a worker compacts it')
+    args = parser.parse_args()
+    report = [run(n, args.seconds, args.compact_records) for n in args.workers]
+    print(json.dumps(report, indent=2))
+    failed = [r['workers'] for r in report if not r['consistent'] or r['errors']]
+    if failed:
+        sys.exit(f'inconsistent state or errors with {failed} workers')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+"""End-to-end benchmark suite over synthetic catalogs.
+
+For each catalog size a fresh child process is started in a temporary
+directory, seeded with a synthetic catalog snapshot and user state, and
+then:
+
+* every route is driven through the Flask test client (per-route
+  throughput and p50/p99 latency),
+* a threaded HTTP server is hammered by concurrent keep-alive clients
+  running a read-heavy mix,
+* startup, rebuild_data_structures and peak RSS are recorded.
+
+The JSON report carries the git commit and all parameters, so runs from
+two commits can be compared with --baseline:
+
+    python -m benchmarks.suite --sizes 1000 10000 100000 --output before.json
+    python -m benchmarks.suite --sizes 1000 10000 100000 --baseline before.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import TITLE_ORDERS, WORDS, generate_catalog, generate_user_state
+
+# endpoint yang sengaja tidak diukur
+EXCLUDED_ENDPOINTS = {'static', 'stream_events'}
+HTTP_MIX = ('get_song', 'get_songs_page', 'browse_prefix', 'search', 'play_next',
+            'recommendations', 'home_feed', 'queue_get', 'playlists_get')
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)]
+
+
+def summarize(latencies, elapsed, errors=0):
+    latencies = sorted(latencies)
+    return {
+        'n': len(latencies),
+        'errors': errors,
+        'ops_per_s': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss dalam KB di Linux, byte di macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Scenarios:
+    """Route scenarios: name -> (client, build) where build(rng) returns (method, path, kwargs)"""
+
+    def __init__(self, music_app, song_ids):
+        self.app = music_app
+        self.song_ids = song_ids
+        self.added_ids = []
+        self.created_playlists = []
+        albums = [s['album'] for s in music_app.songs_library[:100] if s.get('album')]
+        self.album = albums[0] if albums else ''
+
+    def song(self, rng):
+        return rng.choice(self.song_ids)
+
+    def playlist_ids(self):
+        return self.app.user_state.load('playlists', 'bench0')['playlist 0'].song_ids()
+
+    def queue_entry(self, rng):
+        entries = list(self.app.user_state.load('queue', 'bench0').entries)
+        return rng.choice(entries) if entries else 0
+
+    def next_added(self):
+        return self.added_ids.pop() if self.added_ids else 0
+
+    def profile_id(self, rng):
+        profiles = self.app.request_profiler.list()
+        return rng.choice(profiles)['id'] if profiles else 'none'
+
+    def job_id(self):
+        jobs = self.app.job_queue.list(limit=1)
+        return jobs[0]['id'] if jobs else 'none'
+
+    def new_playlist(self):
+        name = f'bench {len(self.created_playlists)}'
+        self.created_playlists.append(name)
+        return name
+
+    def all(self):
+        word = lambda r: r.choice(WORDS)
+        return [
+            ('index', 'user', lambda r: ('GET', '/', {})),
+            ('user_page', 'user', lambda r: ('GET', '/user', {})),
+            ('admin_page', 'admin', lambda r: ('GET', '/admin', {})),
+            ('login', 'anon', lambda r: ('POST', '/login', {'json': {'username': 'bench1', 'password': 'bench'}})),
+            ('logout', 'anon', lambda r: ('GET', '/logout', {})),
+            ('serve_audio', 'user', lambda r: ('GET', '/uploads/audio/bench.mp3',
+                                               {'headers': {'Range': 'bytes=0-262143'}})),
+            ('serve_cover', 'user', lambda r: ('GET', '/uploads/covers/bench.jpg?size=256', {})),
+            ('serve_waveform', 'user', lambda r: ('GET', '/uploads/waveforms/0123456789abcdef.wf', {})),
+            ('get_songs_full', 'user', lambda r: ('GET', '/api/songs', {})),
+            ('get_songs_page', 'user', lambda r: ('GET', f'/api/songs?page={r.randint(1, 10)}&per_page=100', {})),
+            ('get_songs_fields', 'user', lambda r: ('GET', '/api/songs?fields=id,title,artist', {})),
+            ('browse_prefix', 'user', lambda r: ('GET', f'/api/songs/browse?prefix={word(r)}', {})),
+            ('browse_range', 'user', lambda r: ('GET', f'/api/songs/browse?start={word(r)}&offset={r.randint(0, 500)}', {})),
+            ('get_song', 'user', lambda r: ('GET', f'/api/songs/{self.song(r)}', {})),
+            ('play_next', 'user', lambda r: ('GET', f'/api/play_next/{self.song(r)}', {})),
+            ('search', 'user', lambda r: ('GET', f'/api/search?q={word(r)}', {})),
+            ('search_two_words', 'user', lambda r: ('GET', f'/api/search?q={word(r)}+{word(r)}', {})),
+            ('search_short', 'user', lambda r: ('GET', f'/api/search?q={word(r)[:2]}', {})),
+            ('recommendations', 'user', lambda r: ('GET', f'/api/recommendations/{self.song(r)}', {})),
+            ('recommendations_content', 'user', lambda r: ('GET', f'/api/recommendations/{self.song(r)}?engine=content', {})),
+            ('recommendations_batch', 'user', lambda r: (
+                'GET', '/api/recommendations?seeds=' + ','.join(str(self.song(r)) for _ in range(5)), {})),
+            ('home_feed', 'user', lambda r: ('GET', '/api/home_feed', {})),
+            ('favorites_get', 'user', lambda r: ('GET', '/api/favorites', {})),
+            ('favorites_add', 'user', lambda r: ('POST', f'/api/favorites/{self.song(r)}', {})),
+            ('favorites_remove', 'user', lambda r: ('DELETE', f'/api/favorites/{self.song(r)}', {})),
+            ('queue_get', 'user', lambda r: ('GET', '/api/queue', {})),
+            ('queue_add', 'user', lambda r: ('POST', f'/api/queue/{self.song(r)}', {})),
+            ('queue_play_next', 'user', lambda r: ('POST', f'/api/queue/{self.song(r)}', {'json': {'next': True}})),
+            ('queue_bulk', 'user', lambda r: ('POST', '/api/queue/bulk', {'json': {'album': self.album}})),
+            ('queue_move', 'user', lambda r: ('POST', f'/api/queue/entries/{self.queue_entry(r)}/move',
+                                              {'json': {'position': 0}})),
+            ('queue_shuffle', 'user', lambda r: ('POST', '/api/queue/shuffle', {})),
+            ('queue_next', 'user', lambda r: ('POST', '/api/queue/next', {})),
+            ('queue_entry_delete', 'user', lambda r: ('DELETE', f'/api/queue/entries/{self.queue_entry(r)}', {})),
+            ('queue_remove_song', 'user', lambda r: ('DELETE', f'/api/queue/{self.song(r)}', {})),
+            ('queue_clear', 'user', lambda r: ('POST', '/api/queue/clear', {})),
+            ('history_add', 'user', lambda r: ('POST', f'/api/history/{self.song(r)}', {})),
+            ('history_get', 'user', lambda r: ('GET', '/api/history', {})),
+            ('playlists_get', 'user', lambda r: ('GET', '/api/playlists', {})),
+            ('playlist_create', 'user', lambda r: ('POST', '/api/playlists', {'json': {'name': self.new_playlist()}})),
+            ('playlist_songs_page', 'user', lambda r: ('GET', f'/api/playlists/playlist 0/songs?page={r.randint(1, 2)}', {})),
+            ('playlist_add_song', 'user', lambda r: ('POST', f'/api/playlists/playlist 1/songs/{self.song(r)}', {})),
+            ('playlist_remove_song', 'user', lambda r: ('DELETE', f'/api/playlists/playlist 1/songs/{self.song(r)}', {})),
+            ('playlist_bulk_add', 'user', lambda r: ('POST', '/api/playlists/playlist 2/songs',
+                                                     {'json': {'song_ids': r.sample(self.song_ids, min(50, len(self.song_ids)))}})),
+            ('playlist_move', 'user', lambda r: ('POST', f'/api/playlists/playlist 0/songs/{r.choice(self.playlist_ids())}/move',
+                                                 {'json': {'after': None}})),
+            ('playlist_reorder', 'user', lambda r: ('PUT', '/api/playlists/playlist 0/songs',
+                                                    {'json': {'song_ids': r.sample(self.playlist_ids(), len(self.playlist_ids()))}})),
+            ('play_from_playlist', 'player', lambda r: ('POST', f'/api/playlists/playlist 0/songs/{r.choice(self.playlist_ids())}/play', {})),
+            ('play_next_playlist', 'player', lambda r: ('GET', f'/api/play_next/{r.choice(self.playlist_ids())}', {})),
+            ('playlist_delete', 'user', lambda r: ('DELETE', f'/api/playlists/{self.created_playlists.pop() if self.created_playlists else "none"}', {})),
+            ('stats', 'admin', lambda r: ('GET', '/api/stats', {})),
+            ('stats_plays', 'admin', lambda r: ('GET', '/api/stats/plays', {})),
+            ('metrics', 'anon', lambda r: ('GET', '/metrics', {})),
+            ('add_song', 'admin', lambda r: ('POST', '/api/songs', {'data': {
+                'title': f'Bench {r.random()}', 'artist': 'Bench Artist', 'duration': '200',
+                'genre': 'Pop', 'album': 'Bench'}})),
+            ('update_song', 'admin', lambda r: ('PUT', f'/api/songs/{self.song(r)}', {'data': {'album': f'Bench {r.random()}'}})),
+            ('batch_update', 'admin', lambda r: ('POST', '/api/songs/batch', {'json': {'operations': [
+                {'op': 'update', 'id': song_id, 'patch': {'album': f'Bench {r.random()}'}}
+                for song_id in r.sample(self.song_ids, min(100, len(self.song_ids)))]}})),
+            ('delete_song', 'admin', lambda r: ('DELETE', f'/api/songs/{self.next_added()}', {})),
+            ('import', 'admin', lambda r: ('POST', '/api/admin/import', {'json': {'source': 'bench'}})),
+            ('job_get', 'admin', lambda r: ('GET', f'/api/jobs/{self.job_id()}', {})),
+            ('jobs_list', 'admin', lambda r: ('GET', '/api/admin/jobs', {})),
+            ('profile_config', 'admin', lambda r: ('PUT', '/api/admin/profiles/config', {'json': {'endpoints': ['get_metrics']}})),
+            ('metrics_profiled', 'anon', lambda r: ('GET', '/metrics', {})),
+            ('profiles_list', 'admin', lambda r: ('GET', '/api/admin/profiles', {})),
+            ('profile_download', 'admin', lambda r: ('GET', f'/api/admin/profiles/{self.profile_id(r)}', {})),
+            ('profile_config_reset', 'admin', lambda r: ('PUT', '/api/admin/profiles/config', {'json': {'endpoints': []}})),
+        ]
+
+
+def drive_routes(music_app, scenarios, clients, iterations, max_seconds, seed):
+    adapter = music_app.app.url_map.bind('localhost')
+    rng = random.Random(seed)
+    results, covered = {}, set()
+    for name, who, build in scenarios.all():
+        client = clients[who]
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        while len(latencies) < iterations and (not latencies or time.perf_counter() - start < max_seconds):
+            method, path, kwargs = build(rng)
+            t = time.perf_counter()
+            response = client.open(path, method=method, **kwargs)
+            response.get_data()
+            latencies.append(time.perf_counter() - t)
+            if response.status_code >= 500 or (response.status_code >= 400 and name not in ('delete_song',)):
+                errors += 1
+            if name == 'add_song' and response.status_code == 200:
+                scenarios.added_ids.append(response.get_json()['song']['id'])
+            response.close()
+        endpoint = adapter.match(path.split('?')[0], method=method)[0]
+        covered.add(endpoint)
+        results[name] = dict(summarize(latencies, time.perf_counter() - start, errors), endpoint=endpoint)
+    uncovered = sorted(set(music_app.app.view_functions) - covered - EXCLUDED_ENDPOINTS)
+    return results, uncovered
+
+
+def login_cookie(port, username):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    body = json.dumps({'username': username, 'password': 'bench'})
+    conn.request('POST', '/login', body=body, headers={'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.getheader('Set-Cookie').split(';', 1)[0]
+
+
+def http_load(music_app, scenarios, clients, seconds, users, seed):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, music_app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    builders = {name: build for name, _, build in scenarios.all() if name in HTTP_MIX}
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = [0.0]
+
+    def client(index):
+        rng = random.Random(seed + index)
+        cookie = login_cookie(server.port, f'bench{index % users}')
+        conn = http.client.HTTPConnection('127.0.0.1', server.port)
+        local, failed = [], 0
+        while time.perf_counter() < deadline[0]:
+            method, path, _ = builders[rng.choice(HTTP_MIX)](rng)
+            t = time.perf_counter()
+            conn.request(method, path.replace(' ', '%20'), headers={'Cookie': cookie})
+            response = conn.getresponse()
+            response.read()
+            local.append(time.perf_counter() - t)
+            if response.status >= 400:
+                failed += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    deadline[0] = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    return dict(summarize(latencies, elapsed, errors[0]), clients=clients, seconds=seconds)
+
+
+def run_child(args):
+    """Runs inside a fresh temp working directory; writes the result JSON to args.result"""
+    songs = generate_catalog(args.size, args.seed, args.title_order)
+    os.makedirs('data', exist_ok=True)
+    with open(os.path.join('data', 'catalog.snapshot.json'), 'w', encoding='utf-8') as f:
+        json.dump({'seq': 0, 'songs': songs}, f)
+    del songs
+
+    start = time.perf_counter()
+    import app as music_app
+    startup = time.perf_counter() - start
+
+    rebuilds = []
+    for _ in range(3):
+        t = time.perf_counter()
+        music_app.rebuild_data_structures()
+        rebuilds.append(time.perf_counter() - t)
+
+    with open(os.path.join(music_app.AUDIO_FOLDER, 'bench.mp3'), 'wb') as f:
+        f.write(os.urandom(1024 * 1024))
+    with open(os.path.join(music_app.COVER_FOLDER, 'bench.jpg'), 'wb') as f:
+        f.write(os.urandom(64 * 1024))
+    with open(os.path.join(music_app.WAVEFORM_FOLDER, '0123456789abcdef.wf'), 'wb') as f:
+        f.write(os.urandom(810))
+    music_app.job_queue.submit('song_media', {'song_id': 0, 'remove': []})
+    import_dir = os.path.join(music_app.IMPORT_FOLDER, 'bench')
+    os.makedirs(import_dir, exist_ok=True)
+    for i in range(20):
+        with wave.open(os.path.join(import_dir, f'Bench Import - Track {i}.wav'), 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(8000)
+            w.writeframes(os.urandom(16000))
+
+    song_ids = [song['id'] for song in music_app.songs_library]
+    usernames = [f'bench{i}' for i in range(args.users)]
+    t = time.perf_counter()
+    generate_user_state(music_app, usernames, song_ids, args.seed)
+    user_state_seconds = time.perf_counter() - t
+    music_app.users['benchadmin'] = {'password': 'bench', 'role': 'admin'}
+
+    clients = {}
+    for who, username in (('user', 'bench0'), ('player', 'bench1'), ('admin', 'benchadmin'), ('anon', None)):
+        clients[who] = music_app.app.test_client()
+        if username:
+            clients[who].post('/login', json={'username': username, 'password': 'bench'})
+
+    scenarios = Scenarios(music_app, song_ids)
+    routes, uncovered = drive_routes(music_app, scenarios, clients, args.iterations, args.max_seconds, args.seed)
+    http = http_load(music_app, scenarios, args.http_clients, args.http_seconds, args.users, args.seed)
+
+    result = {
+        'size': args.size,
+        'startup_seconds': round(startup, 3),
+        'rebuild_seconds': round(min(rebuilds), 3),
+        'user_state_seconds': round(user_state_seconds, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'routes': routes,
+        'uncovered_endpoints': uncovered,
+        'http': http,
+    }
+    with open(args.result, 'w') as f:
+        json.dump(result, f)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, threshold):
+    """List metrics that got slower than baseline by more than threshold"""
+    regressions = []
+    old_by_size = {r['size']: r for r in baseline.get('results', [])}
+    for result in report['results']:
+        old = old_by_size.get(result['size'])
+        if not old:
+            continue
+        pairs = [('rebuild_seconds', old['rebuild_seconds'], result['rebuild_seconds'])]
+        pairs += [(f'routes.{name}.p50_ms', old['routes'][name]['p50_ms'], stats['p50_ms'])
+                  for name, stats in result['routes'].items() if name in old.get('routes', {})]
+        pairs.append(('http.p99_ms', old['http']['p99_ms'], result['http']['p99_ms']))
+        for metric, before, after in pairs:
+            # abaikan selisih kecil yang hanya noise (0.5 ms / 50 ms)
+            min_delta = 0.05 if metric.endswith('seconds') else 0.5
+            if before and after and after > before * (1 + threshold) and after - before > min_delta:
+                regressions.append({'size': result['size'], 'metric': metric, 'before': before,
+                                    'after': after, 'ratio': round(after / before, 2)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--title-order', choices=TITLE_ORDERS, default='random')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--max-seconds', type=float, default=2.0, help='time cap per route scenario')
+    parser.add_argument('--http-clients', type=int, default=8)
+    parser.add_argument('--http-seconds', type=float, default=5.0)
+    parser.add_argument('--output', help='write the report here as well as stdout')
+    parser.add_argument('--baseline', help='earlier report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown before flagging')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {k: getattr(args, k) for k in ('seed', 'title_order', 'users', 'iterations',
+                                                 'max_seconds', 'http_clients', 'http_seconds')},
+        'results': [],
+    }
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix=f'bench-{size}-')
+        result_file = os.path.join(workdir, 'result.json')
+        cmd = [sys.executable, '-m', 'benchmarks.suite', '--child', '--size', str(size), '--result', result_file]
+        for key, value in report['params'].items():
+            cmd += [f'--{key.replace("_", "-")}', str(value)]
+        env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        # output app (print) dibuang agar stdout hanya berisi laporan JSON
+        subprocess.run(cmd, cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(result_file) as f:
+            report['results'].append(json.load(f))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['baseline_commit'] = baseline.get('commit')
+        report['regressions'] = compare(report, baseline, args.threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Synthetic catalogs and user state for benchmarks.
+
+Everything is derived from a seed so two runs (or two commits) see the
+same data. Genres and artists follow a Zipf-like distribution: a few
+dominate, with a long tail, like a real library.
+"""
+import random
+from itertools import accumulate
+
+GENRES = ['Pop', 'Rock', 'Hip-Hop', 'R&B', 'Jazz', 'Classical', 'Electronic', 'Indie',
+          'Country', 'Metal', 'Folk', 'Reggae', 'Blues', 'Soul', 'Latin', 'K-Pop',
+          'Ambient', 'Punk', 'Funk', 'Dangdut']
+WORDS = ['love', 'night', 'heart', 'fire', 'dream', 'rain', 'summer', 'city', 'light',
+         'blue', 'gold', 'wild', 'home', 'road', 'star', 'ocean', 'ghost', 'river',
+         'dance', 'youth', 'cold', 'moon', 'paper', 'glass', 'echo', 'silver', 'storm',
+         'sweet', 'lonely', 'forever', 'midnight', 'sunrise', 'electric', 'velvet']
+TITLE_ORDERS = ('random', 'sorted', 'reverse', 'same-prefix')
+
+
+def zipf_weights(n, s=1.1):
+    return list(accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def generate_catalog(size, seed=0, title_order='random'):
+    """Return `size` song dicts with ids 1..size.
+
+    title_order controls insertion order of titles: 'sorted' and
+    'reverse' are the worst case for a naive BST, 'same-prefix' makes
+    every title share a long prefix.
+    """
+    if title_order not in TITLE_ORDERS:
+        raise ValueError(f'title_order must be one of {TITLE_ORDERS}')
+    rng = random.Random(seed)
+    artists = [f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}'
+               for i in range(max(size // 10, 1))]
+    artist_weights = zipf_weights(len(artists))
+    genre_weights = zipf_weights(len(GENRES), s=1.3)
+
+    titles = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title() + f' {i}'
+              for i in range(size)]
+    if title_order == 'sorted':
+        titles.sort(key=str.lower)
+    elif title_order == 'reverse':
+        titles.sort(key=str.lower, reverse=True)
+    elif title_order == 'same-prefix':
+        titles = [f'The Very Long Shared Title Prefix {i:08d}' for i in range(size)]
+
+    songs = []
+    for i, title in enumerate(titles):
+        artist = rng.choices(artists, cum_weights=artist_weights)[0]
+        songs.append({
+            'id': i + 1,
+            'title': title,
+            'artist': artist,
+            'duration': rng.randint(90, 420),
+            'genre': rng.choices(GENRES, cum_weights=genre_weights)[0],
+            'album': f'{artist} Vol. {rng.randint(1, 5)}',
+            'audio_path': None,
+            'cover_path': None,
+        })
+    return songs
+
+
+def generate_user_state(music_app, usernames, song_ids, seed=0, playlists=5,
+                        playlist_size=200, favorites=100, queue=50, history=50):
+    """Fill the app's user state store for each username"""
+    rng = random.Random(seed)
+    for username in usernames:
+        music_app.users.setdefault(username, {'password': 'bench', 'role': 'user'})
+        with music_app.user_state.edit('playlists', username) as state:
+            for p in range(playlists):
+                playlist = state.setdefault(f'playlist {p}', music_app.Playlist())
+                playlist.add_songs(rng.sample(song_ids, min(playlist_size, len(song_ids))))
+        with music_app.user_state.edit('favorites', username) as state:
+            state.add_songs(rng.sample(song_ids, min(favorites, len(song_ids))))
+        with music_app.user_state.edit('queue', username) as state:
+            state.enqueue_many(rng.choices(song_ids, k=queue))
+        with music_app.user_state.edit('history', username) as state:
+            for song_id in rng.choices(song_ids, k=history):
+                state.push(music_app.song_catalog.get(song_id))
@@ -0,0 +1,57 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py membuat uploads/ dan data/ di cwd saat di-import
+os.chdir(tempfile.mkdtemp(prefix='musicapp-tests-'))
+import app as music_app  # noqa: E402
+
+_user_ids = itertools.count(1)
+
+
+def make_song(song_id, title, artist='Tester', genre='Pop', album=None, duration=180):
+    return {'id': song_id, 'title': title, 'artist': artist, 'duration': duration, 'genre': genre,
+            'album': album or f'{artist} Album', 'audio_path': None, 'cover_path': None}
+
+
+@pytest.fixture
+def music():
+    return music_app
+
+
+@pytest.fixture
+def library():
+    """Reset the catalog to the given songs; returns a loader"""
+    def load(songs):
+        with music_app.catalog_lock:
+            music_app.song_catalog.load([dict(song) for song in songs])
+            music_app.rebuild_data_structures()
+        return music_app.song_catalog
+    load([make_song(1, 'Sample Song 1', 'Sample Artist'),
+          make_song(2, 'Sample Song 2', 'Sample Artist', genre='Rock')])
+    return load
+
+
+@pytest.fixture
+def client(library):
+    music_app.app.config['TESTING'] = True
+    with music_app.app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def login(client):
+    """Log the test client in as a fresh user (or admin); returns the username"""
+    def login(role='user'):
+        username = f'test{role}{next(_user_ids)}'
+        music_app.users[username] = {'password': 'secret', 'role': role}
+        response = client.post('/login', json={'username': username, 'password': 'secret'})
+        assert response.status_code == 200
+        return username
+    return login
@@ -0,0 +1,121 @@
+import io
+import os
+import wave
+
+import pytest
+
+from conftest import make_song
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(24)
+
+
+def syncsafe(n):
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+
+def id3_frame(frame_id, data):
+    return frame_id + len(data).to_bytes(4, 'big') + b'\x00\x00' + data
+
+
+def make_mp3(frames=10, xing_frames=None):
+    body = (id3_frame(b'TIT2', b'\x03Title') + id3_frame(b'TPE1', b'\x03Artist')
+            + id3_frame(b'APIC', b'\x01image/png\x00\x03' + 'cover'.encode('utf-16') + b'\x00\x00' + PNG))
+    tag = b'ID3\x03\x00\x00' + syncsafe(len(body)) + body
+    header = bytes([0xFF, 0xFB, 0x90, 0x64])   # MPEG-1 layer III, 128 kbps, 44.1 kHz, joint stereo
+    first = header + bytes(32)
+    if xing_frames is not None:
+        first += b'Xing' + (1).to_bytes(4, 'big') + xing_frames.to_bytes(4, 'big')
+    frame = 144 * 128000 // 44100
+    audio = first + bytes(frame - len(first)) + (header + bytes(frame - 4)) * (frames - 1)
+    return tag + audio, len(audio)
+
+
+def flac_block(block_type, data, last=False):
+    return bytes([block_type | (0x80 if last else 0)]) + len(data).to_bytes(3, 'big') + data
+
+
+def make_flac(samples=441000):
+    info = (44100 << 44) | (1 << 41) | (15 << 36) | samples
+    streaminfo = bytes(10) + info.to_bytes(8, 'big') + bytes(16)
+    comments = [b'TITLE=Flac Title', b'GENRE=Jazz']
+    vorbis = (len(b'vendor').to_bytes(4, 'little') + b'vendor' + len(comments).to_bytes(4, 'little')
+              + b''.join(len(c).to_bytes(4, 'little') + c for c in comments))
+    picture = ((3).to_bytes(4, 'big') + (9).to_bytes(4, 'big') + b'image/png' + (0).to_bytes(4, 'big')
+               + bytes(16) + len(PNG).to_bytes(4, 'big') + PNG)
+    return (b'fLaC' + flac_block(0, streaminfo) + flac_block(4, vorbis)
+            + flac_block(6, picture, last=True) + bytes(4000))
+
+
+def make_wav(frames=8000, rate=8000):
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(bytes(range(256)) * (frames * 4 // 256))
+    return out.getvalue()
+
+
+@pytest.fixture
+def write(tmp_path):
+    def write(name, data):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
+
+
+def test_mp3_tags_picture_and_cbr_duration(music, write):
+    data, audio_bytes = make_mp3()
+    meta = music.read_mp3(write('a.mp3', data))
+    assert (meta['sample_rate'], meta['channels'], meta['bitrate']) == (44100, 2, 128)
+    assert meta['duration'] == pytest.approx(audio_bytes * 8 / 128000)
+    assert meta['tags'] == {'title': 'Title', 'artist': 'Artist'}
+    assert meta['picture'] == (PNG, 'image/png')
+
+
+def test_mp3_xing_frame_count_gives_vbr_duration(music, write):
+    data, _ = make_mp3(xing_frames=1000)
+    meta = music.read_mp3(write('vbr.mp3', data))
+    assert meta['duration'] == pytest.approx(1000 * 1152 / 44100)
+
+
+def test_flac_streaminfo_comments_and_picture(music, write):
+    meta = music.read_flac(write('a.flac', make_flac()))
+    assert (meta['sample_rate'], meta['channels'], meta['duration']) == (44100, 2, 10)
+    assert meta['tags'] == {'title': 'Flac Title', 'genre': 'Jazz'}
+    assert meta['picture'] == (PNG, 'image/png')
+
+
+def test_wav_format_and_waveform(music, write):
+    path = write('a.wav', make_wav())
+    meta = music.read_wav(path)
+    assert (meta['sample_rate'], meta['channels'], meta['duration'], meta['bitrate']) == (8000, 2, 1, 256)
+    magic, points, duration_ms = music.WAVEFORM_HEADER.unpack_from(music.build_waveform(path))
+    assert (magic, points, duration_ms) == (music.WAVEFORM_MAGIC, music.WAVEFORM_POINTS, 1000)
+
+
+@pytest.mark.parametrize('ext, data', [('mp3', make_mp3()[0]), ('flac', make_flac()), ('wav', make_wav())])
+def test_truncated_files_never_raise(music, write, monkeypatch, ext, data):
+    monkeypatch.setattr(music, 'mutagen', None)
+    monkeypatch.setattr(music, 'FFMPEG', None)
+    for size in sorted(set(range(0, 300)) | set(range(300, len(data), 37))):
+        path = write(f'cut.{ext}', data[:size])
+        meta = music.read_audio_metadata(path)
+        assert meta['format'] == ext and meta['duration'] >= 0, size
+        if ext == 'wav':
+            music.build_waveform(path)
+
+
+def test_corrupt_wav_still_gets_audio_info(client, music, library, monkeypatch):
+    monkeypatch.setattr(music, 'FFMPEG', None)
+    monkeypatch.setattr(music, 'mutagen', None)
+    library([make_song(1, 'Broken')])
+    for name, data in (('riff_cut.wav', make_wav()[:30]), ('not_riff.wav', b'OggS' + bytes(100))):
+        with open(os.path.join(music.AUDIO_FOLDER, name), 'wb') as f:
+            f.write(data)
+        music.song_catalog.update(1, {'audio_path': f'/uploads/audio/{name}'})
+        music.process_audio(1, f'/uploads/audio/{name}')
+        song = music.song_catalog.get(1)
+        assert song['audio_info']['format'] == 'wav' and song['audio_info']['duration'] == 0
+        assert song['duration'] == 180 and 'waveform' not in song
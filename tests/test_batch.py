@@ -0,0 +1,84 @@
+import pytest
+
+from conftest import make_song
+
+
+def batch(client, payload):
+    response = client.post('/api/songs/batch', json=payload)
+    return response.status_code, response.get_json()
+
+
+def test_batch_applies_updates_and_deletes(client, login, library, music):
+    library([make_song(1, 'One'), make_song(2, 'Two'), make_song(3, 'Three')])
+    login('admin')
+    status, data = batch(client, {'operations': [
+        {'op': 'update', 'id': 1, 'patch': {'genre': 'Jazz', 'title': 'Uno'}},
+        {'op': 'delete', 'id': 3},
+    ]})
+    assert status == 200 and (data['updated'], data['deleted']) == (1, 1)
+    assert music.song_catalog.get(1)['title'] == 'Uno'
+    assert music.song_catalog.get(3) is None
+    assert music.search_index.search('uno')[0] == [1]
+    assert music.search_index.search('three')[0] == []
+
+
+def test_batch_is_all_or_nothing(client, login, library, music):
+    library([make_song(1, 'One'), make_song(2, 'Two')])
+    login('admin')
+    version = music.song_catalog.version
+    status, data = batch(client, {'operations': [
+        {'op': 'update', 'id': 1, 'patch': {'genre': 'Jazz'}},
+        {'op': 'delete', 'id': 99},
+    ]})
+    assert status == 400 and data['success'] is False
+    assert [r['status'] for r in data['results']] == ['ok', 'error']
+    assert music.song_catalog.version == version
+    assert music.song_catalog.get(1)['genre'] == 'Pop'
+
+
+def test_batch_rejects_bool_and_duplicate_ids(client, login, library, music):
+    library([make_song(1, 'One'), make_song(2, 'Two')])
+    login('admin')
+    status, data = batch(client, {'operations': [{'op': 'delete', 'id': True}]})
+    assert status == 400 and data['results'][0]['error'] == 'Song not found'
+    status, data = batch(client, {'operations': [{'op': 'delete', 'id': 2}, {'op': 'delete', 'id': 2}]})
+    assert status == 400
+    assert len(music.song_catalog) == 2
+
+
+def test_batch_rejects_title_conflicts_but_allows_swaps(client, login, library, music):
+    library([make_song(1, 'One'), make_song(2, 'Two')])
+    login('admin')
+    status, _ = batch(client, {'operations': [{'op': 'update', 'id': 1, 'patch': {'title': 'Two'}}]})
+    assert status == 400
+    status, _ = batch(client, {'operations': [
+        {'op': 'update', 'id': 1, 'patch': {'title': 'Two'}},
+        {'op': 'update', 'id': 2, 'patch': {'title': 'One'}},
+    ]})
+    assert status == 200
+    assert music.song_catalog.find_duplicate('Two', 'Tester')['id'] == 1
+
+
+def test_batch_by_filter(client, login, library, music):
+    library([make_song(1, 'One', genre='pop '), make_song(2, 'Two', genre='POP'), make_song(3, 'Three', genre='Rock')])
+    login('admin')
+    status, data = batch(client, {'filter': {'genre': 'Pop'}, 'patch': {'genre': 'Pop'}})
+    assert status == 200 and data['updated'] == 2
+    assert {song['genre'] for song in music.song_catalog.songs} == {'Pop', 'Rock'}
+    status, data = batch(client, {'filter': {'genre': 'rock'}, 'delete': True})
+    assert status == 200 and data['deleted'] == 1
+
+
+def test_batch_requires_admin(client, login):
+    login('user')
+    status, _ = batch(client, {'operations': [{'op': 'delete', 'id': 1}]})
+    assert status == 403
+
+
+@pytest.mark.parametrize('body', [[1, 2], 'delete', 5, {'filter': {'genre': None}, 'delete': True},
+                                  {'filter': {'genre': 1}, 'patch': {}}])
+def test_batch_rejects_malformed_bodies(client, login, library, music, body):
+    library([make_song(1, 'None', genre=None), make_song(2, 'Two', genre='none')])
+    login('admin')
+    status, _ = batch(client, body)
+    assert status == 400 and len(music.song_catalog.songs) == 2
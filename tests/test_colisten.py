@@ -0,0 +1,73 @@
+import threading
+
+from conftest import make_song
+
+
+def test_neighbors_returns_a_copy(music):
+    graph = music.CoListenGraph(top_k=3)
+    graph.add_pair(1, 2, 2)
+    graph.add_pair(1, 3, 1)
+    neighbors = graph.neighbors(1)
+    neighbors.append(99)
+    assert graph.neighbors(1) == [2, 3]
+    version = graph.version
+    graph.remove_song(2)
+    assert graph.neighbors(1) == [3] and graph.version > version
+    graph.remove_song(42)   # tidak ada di graph: versi tetap
+    assert graph.version == version + 1
+
+
+def test_concurrent_plays_and_deletes_keep_the_graph_consistent(music):
+    graph = music.CoListenGraph(top_k=5)
+    errors = []
+
+    def plays(user):
+        try:
+            for i in range(3000):
+                graph.observe_play(i, i % 40, user)
+        except Exception as e:
+            errors.append(e)
+
+    def deletes():
+        try:
+            for i in range(3000):
+                graph.remove_song(i % 40)
+                graph.neighbors(i % 40)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=plays, args=(f'u{i}',)) for i in range(3)] + [threading.Thread(target=deletes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    for song_id, top in graph.top.items():
+        row = graph.weights[song_id]
+        assert top == sorted(top, key=lambda n: (-row[n], n)) and set(top) <= set(row)
+
+
+def test_delete_is_journaled_even_if_an_index_fails(client, login, library, music, monkeypatch):
+    library([make_song(1, 'One'), make_song(2, 'Two')])
+    login('admin')
+
+    def broken(song_id):
+        raise RuntimeError('index broken')
+
+    monkeypatch.setattr(music.search_index, 'remove_song', broken)
+    seq = music.catalog_journal.seq
+    assert client.delete('/api/songs/1').status_code == 200
+    assert music.catalog_journal.seq == seq + 1
+    assert music.song_catalog.get(1) is None
+    assert len(music.title_index) == 1 and 1 not in music.recommendation_graph.positions
+
+
+def test_home_feed_follows_the_colisten_graph(client, library, music):
+    library([make_song(i, f'Song {i}', genre=f'G{i}') for i in range(1, 21)])
+    first = client.get('/api/home_feed')
+    etag = first.headers['ETag']
+    assert client.get('/api/home_feed', headers={'If-None-Match': etag}).status_code == 304
+    music.colisten_graph.add_pair(1, 20, 50)
+    second = client.get('/api/home_feed', headers={'If-None-Match': etag})
+    assert second.status_code == 200 and second.headers['ETag'] != etag
+    assert 20 in [song['id'] for song in second.get_json()['songs']]
@@ -0,0 +1,34 @@
+import json
+
+from conftest import make_song
+
+
+def test_fragments_encode_like_json(music, library):
+    catalog = library([make_song(1, 'Ünïcode "quoted"'), make_song(2, 'Plain', genre=None)])
+    payload = {'songs': music.song_list([catalog.get(1), None, catalog.get(2)]), 'empty': music.song_list([]),
+               'nested': [{'n': 1}, [], {}], 'total': 2}
+    assert json.loads(music.encode_fragments(payload)) == {
+        'songs': [catalog.get(1), None, catalog.get(2)], 'empty': [], 'nested': [{'n': 1}, [], {}], 'total': 2}
+
+
+def test_copies_of_a_song_are_not_cached(music, library):
+    catalog = library([make_song(1, 'Original')])
+    stale = dict(catalog.get(1), title='Old copy')
+    assert json.loads(catalog.encode(stale))['title'] == 'Old copy' and 1 not in catalog.encoded
+    catalog.encode(catalog.get(1))
+    assert json.loads(catalog.encoded[1])['title'] == 'Original'
+
+
+def test_cached_fragment_is_replaced_after_update_song(client, login, music):
+    login('admin')
+    assert client.get('/api/songs/1').get_json()['title'] == 'Sample Song 1'
+    client.get('/api/songs')
+    cached = music.song_catalog.encoded[1]
+    other = music.song_catalog.encoded[2]
+
+    assert client.put('/api/songs/1', data={'title': 'Renamed'}).status_code == 200
+    assert 1 not in music.song_catalog.encoded or music.song_catalog.encoded[1] != cached
+    assert client.get('/api/songs/1').get_json()['title'] == 'Renamed'
+    assert [s['title'] for s in client.get('/api/songs').get_json()['songs']] == ['Renamed', 'Sample Song 2']
+    assert music.song_catalog.encoded[2] is other   # lagu lain tidak di-encode ulang
+    assert [s['id'] for s in client.get('/api/search?q=renamed').get_json()['results']] == [1]
@@ -0,0 +1,58 @@
+import pytest
+
+
+@pytest.fixture
+def stream(client):
+    """Open /api/events and return an iterator over its messages"""
+    opened = []
+
+    def open_stream(last_event_id=None):
+        headers = {'Last-Event-ID': last_event_id} if last_event_id is not None else {}
+        response = client.get('/api/events', headers=headers, buffered=False)
+        opened.append(response)
+        if response.status_code != 200:
+            return response, None
+        return response, (chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in response.response)
+    yield open_stream
+    for response in opened:
+        response.close()
+
+
+def test_event_ids_carry_the_process_epoch(music, stream):
+    response, messages = stream()
+    assert next(messages).startswith('retry: 3000\nevent: hello')
+    music.event_hub.publish('catalog_changed', {'version': 1})
+    assert next(messages) == (f'id: {music.event_hub.epoch}-{music.event_hub.seq}\n'
+                              'event: catalog_changed\ndata: {"version": 1}\n\n')
+
+
+def test_reconnect_to_the_same_process_replays_missed_events(music, stream):
+    music.event_hub.publish('catalog_changed', {'version': 1})
+    last_id = music.event_hub.event_id(music.event_hub.seq)
+    music.event_hub.publish('catalog_changed', {'version': 2})
+    response, messages = stream(last_id)
+    next(messages)
+    assert next(messages).endswith('data: {"version": 2}\n\n')
+
+
+@pytest.mark.parametrize('last_id', ['0123abcd-5', '5', 'garbage'])
+def test_reconnect_with_an_id_from_another_process_resyncs(music, stream, last_id):
+    response, messages = stream(last_id)
+    next(messages)
+    assert next(messages) == f'id: {music.event_hub.event_id(music.event_hub.seq)}\nevent: resync\ndata: {{}}\n\n'
+
+
+def test_streams_are_capped_and_released(music, client, stream):
+    open_before = music.event_hub.streams
+    response = client.get('/api/events', buffered=False)
+    assert music.event_hub.streams == open_before + 1
+    response.close()
+    assert music.event_hub.streams == open_before
+
+    music.event_hub.streams = music.SSE_MAX_STREAMS
+    try:
+        response, _ = stream()
+        assert response.status_code == 503 and response.headers['Retry-After'] == '10'
+    finally:
+        music.event_hub.streams = open_before
+    assert music.metrics.values[('musicapp_sse_streams', ())] == open_before
@@ -0,0 +1,41 @@
+import random
+
+from conftest import make_song
+
+
+def test_buckets_follow_adds_edits_and_deletes(music):
+    graph = music.RecommendationGraph()
+    for song_id, genre in enumerate(['Jazz', ' jazz ', 'Rock', 'JAZZ', None, 'Rock'], 1):
+        graph.add_song({'id': song_id, 'genre': genre})
+    assert graph.buckets == {'jazz': [1, 2, 4], 'rock': [3, 6]}
+    assert graph.get_recommendations(1) == [2, 4] and graph.get_recommendations(5) == []
+    assert graph.neighbor_count(3) == 1 and graph.neighbor_count(5) == 0
+
+    graph.remove_song(1)   # elemen terakhir pindah ke posisinya
+    assert graph.buckets['jazz'] == [4, 2] and graph.positions[4] == 0
+    graph.add_song({'id': 4, 'genre': 'Rock'})
+    graph.add_song({'id': 6, 'genre': 'rock'})   # genre sama: bucket tidak disentuh
+    assert graph.buckets == {'jazz': [2], 'rock': [3, 6, 4]}
+    graph.remove_song(2)
+    graph.remove_song(2)
+    assert 'jazz' not in graph.buckets and graph.get_recommendations(2) == []
+    assert all(graph.buckets[graph.song_genre[i]][p] == i for i, p in graph.positions.items())
+
+
+def test_recommendations_are_capped_stable_and_exclude_the_song(music):
+    graph = music.RecommendationGraph()
+    for song_id in range(1, 201):
+        graph.add_song({'id': song_id, 'genre': 'Pop'})
+    assert graph.get_recommendations(3, 10) == [1, 2, 4, 5, 6, 7, 8, 9, 10, 11]
+    assert graph.get_recommendations(3, 10) == graph.get_recommendations(3, 10)
+    assert len(graph.get_recommendations(1)) == music.MAX_RECOMMENDATIONS
+    sample = graph.get_recommendations(7, 20, random.Random(1))
+    assert len(sample) == 20 and len(set(sample)) == 20 and 7 not in sample
+
+
+def test_route_returns_genre_neighbors(client, music, library):
+    library([make_song(1, 'A', genre='Jazz'), make_song(2, 'B', genre='Rock'),
+             make_song(3, 'C', genre='jazz'), make_song(4, 'D', genre='Jazz')])
+    response = client.get('/api/recommendations/1')
+    assert [s['id'] for s in response.get_json()['recommendations']] == [3, 4]
+    assert client.get('/api/recommendations/2').get_json()['recommendations'] == []
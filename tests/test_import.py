@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import wave
+
+import pytest
+
+from conftest import make_song
+
+
+def write_wav(path, frames=8000, value=1):
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(bytes([value % 256, 0]) * frames)
+
+
+def progress(done, total, message=None):
+    pass
+
+
+def test_manifest_duration_is_validated(music):
+    meta = {'duration': 0}
+    assert music.import_duration({'duration': '12.7'}, meta) == 12
+    assert music.import_duration({}, meta) == 0
+    assert music.import_duration({'duration': 'abc'}, {'duration': 3.4}) == 3   # audio menang
+    for value in ('abc', 'nan', 'inf', '-5'):
+        with pytest.raises(ValueError):
+            music.import_duration({'duration': value}, meta)
+
+
+def test_bad_rows_are_reported_and_good_rows_imported(music, library, tmp_path):
+    write_wav(tmp_path / 'good.wav', value=1)
+    write_wav(tmp_path / 'silent.wav', frames=0)
+    (tmp_path / 'm.csv').write_text('file,title,artist,duration\n'
+                                    'good.wav,Good,Someone,\n'
+                                    'silent.wav,Silent,Someone,not-a-number\n')
+    result = music.run_import({'source': str(tmp_path / 'm.csv')}, progress)
+    assert (result['added'], result['error']) == (1, 1)
+    assert result['items'][0]['error'] == "Invalid duration 'not-a-number'"
+    assert music.song_catalog.find_duplicate('Good', 'Someone')
+
+
+@pytest.mark.parametrize('payload, manifest', [
+    ({}, None),
+    (None, '[1, 2]\n'),
+    (None, '{"file": "a.wav"}\nnot json\n'),
+])
+def test_fatal_input_fails_without_retry(music, tmp_path, payload, manifest):
+    if manifest is not None:
+        (tmp_path / 'm.jsonl').write_text(manifest)
+        payload = {'source': str(tmp_path / 'm.jsonl')}
+    with pytest.raises(music.JobError):
+        music.run_import(payload, progress)
+
+
+def test_duplicate_found_at_commit_releases_staged_files(music, library, tmp_path, monkeypatch):
+    write_wav(tmp_path / 'race.wav', value=7)
+    (tmp_path / 'm.jsonl').write_text(json.dumps({'file': 'race.wav', 'title': 'Race', 'artist': 'Other'}) + '\n')
+    import_cover = music.import_cover
+
+    def added_meanwhile(entry, meta):
+        # lagu yang sama masuk lewat upload biasa selama file disalin
+        music.song_catalog.add(make_song(900, 'Race', 'Other'))
+        return import_cover(entry, meta)
+
+    monkeypatch.setattr(music, 'import_cover', added_meanwhile)
+    result = music.run_import({'source': str(tmp_path / 'm.jsonl')}, progress)
+    assert (result['added'], result['duplicate']) == (0, 1)
+    with open(tmp_path / 'race.wav', 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    assert not os.path.exists(os.path.join(music.AUDIO_FOLDER, f'{digest}.wav'))
+    waveform = hashlib.sha256(music.build_waveform(str(tmp_path / 'race.wav'))).hexdigest()[:16]
+    assert not os.path.exists(os.path.join(music.WAVEFORM_FOLDER, f'{waveform}.wf'))
+
+
+def test_import_pool_sets_the_worker_flag_only_in_its_children(music):
+    environ = dict(os.environ)
+    with music.import_pool() as pool:
+        assert pool.submit(os.getenv, music.IMPORT_WORKER_ENV).result() == '1'
+    assert dict(os.environ) == environ and music.IMPORT_WORKER_ENV not in os.environ
+
+
+def test_import_route_rejects_non_object_bodies(client, login):
+    login('admin')
+    assert client.post('/api/admin/import', json=['songs.csv']).status_code == 400
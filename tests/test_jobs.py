@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def jobs(music, tmp_path):
+    """A job queue on its own state database; not started until the test does"""
+    def make(handlers, **kwargs):
+        return music.JobQueue(music.SQLiteStateBackend(str(tmp_path / 'state.db')), handlers, **kwargs)
+    return make
+
+
+def wait_for(job_queue, job_id, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = job_queue.get(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'{job_id} is {job_queue.get(job_id)["status"]}, not {status}')
+
+
+def test_full_queue_spills_into_overflow_without_threads(jobs):
+    ran = []
+    job_queue = jobs({'echo': lambda payload, progress: ran.append(payload['n'])}, workers=1, maxsize=2)
+    threads = threading.active_count()
+    submitted = [job_queue.submit('echo', {'n': n})['id'] for n in range(6)]
+    assert job_queue.queue.qsize() == 2 and len(job_queue.overflow) == 4 and job_queue.queued() == 6
+    assert threading.active_count() == threads
+
+    job_queue.start()
+    wait_for(job_queue, submitted[-1], 'done')
+    assert ran == list(range(6)) and job_queue.queued() == 0
+
+
+def test_status_progress_and_dedupe_key(jobs):
+    def handler(payload, progress):
+        progress(2, 2, 'finished')
+        return {'total': payload['total']}
+    job_queue = jobs({'count': handler})
+    job = job_queue.submit('count', {'total': 2}, key='count')
+    assert job['status'] == 'queued' and job_queue.submit('count', {'total': 9}, key='count')['id'] == job['id']
+
+    job_queue.start()
+    job = wait_for(job_queue, job['id'], 'done')
+    assert job['result'] == {'total': 2} and job['progress'] == {'done': 2, 'total': 2, 'message': 'finished'}
+    assert job['attempts'] == 1 and job['lease'] is None
+    assert job_queue.submit('count', {'total': 3}, key='count')['id'] != job['id']
+
+
+def test_failed_attempts_are_retried_until_the_limit(music, jobs, monkeypatch):
+    monkeypatch.setattr(music, 'JOB_RETRY_DELAY', 0.01)
+    calls = []
+
+    def flaky(payload, progress):
+        calls.append(payload['name'])
+        if payload['name'] == 'broken' or len(calls) == 1:
+            raise RuntimeError('try again')
+        if payload['name'] == 'invalid':
+            raise music.JobError('bad payload')
+        return 'ok'
+    job_queue = jobs({'flaky': flaky})
+    job_queue.start()
+
+    job = wait_for(job_queue, job_queue.submit('flaky', {'name': 'once'})['id'], 'done')
+    assert job['attempts'] == 2 and job['result'] == 'ok'
+    job = wait_for(job_queue, job_queue.submit('flaky', {'name': 'broken'})['id'], 'failed')
+    assert job['attempts'] == music.JOB_MAX_ATTEMPTS and job['error'] == 'try again'
+    job = wait_for(job_queue, job_queue.submit('flaky', {'name': 'invalid'})['id'], 'failed')
+    assert job['attempts'] == 1 and job['error'] == 'bad payload'
+
+
+def test_restart_resumes_jobs_whose_lease_expired(music, jobs):
+    ran = []
+    handlers = {'echo': lambda payload, progress: ran.append(payload['n'])}
+    crashed = jobs(handlers)   # tidak pernah di-start: process-nya "mati"
+    queued = crashed.submit('echo', {'n': 1})
+    running = crashed.submit('echo', {'n': 2})
+    crashed.update(running['id'], status='running', attempts=1)
+    alive = crashed.submit('echo', {'n': 3})
+    for job in (queued, running):
+        crashed.update(job['id'], lease=time.time() - 1)
+
+    restarted = jobs(handlers)
+    restarted.resume()
+    assert restarted.queued() == 2 and alive['id'] not in restarted.active
+    restarted.start()
+    assert wait_for(restarted, running['id'], 'done')['attempts'] == 2
+    wait_for(restarted, queued['id'], 'done')
+    assert sorted(ran) == [1, 2] and restarted.get(alive['id'])['status'] == 'queued'
+
+
+def test_job_routes(client, login, music):
+    login()
+    assert client.get('/api/jobs/nope').status_code == 403
+    login('admin')
+    assert client.get('/api/jobs/nope').status_code == 404
+    assert client.get('/api/admin/jobs?status=lost').status_code == 400
+    job = music.job_queue.submit('media_backfill', {})
+    assert client.get(f'/api/jobs/{job["id"]}').get_json()['job']['kind'] == 'media_backfill'
+    listed = client.get('/api/admin/jobs?limit=500').get_json()
+    assert job['id'] in [j['id'] for j in listed['jobs']] and 'queued' in listed
@@ -0,0 +1,137 @@
+import json
+import os
+
+import pytest
+
+from conftest import make_song
+
+
+@pytest.fixture
+def journal_paths(tmp_path):
+    return str(tmp_path / 'catalog.snapshot.json'), str(tmp_path / 'catalog.journal')
+
+
+def write_records(path, records):
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def recover(music, paths):
+    journal = music.CatalogJournal(*paths)
+    return journal, sorted(journal.recover(), key=lambda song: song['id'])
+
+
+def test_replay_applies_records_after_the_snapshot(music, journal_paths):
+    snapshot, journal_file = journal_paths
+    first = music.CatalogJournal(*journal_paths)
+    first.write_snapshot([make_song(1, 'One'), make_song(2, 'Two')], 2)
+    write_records(journal_file, [
+        {'seq': 2, 'op': 'delete', 'id': 1},                    # sudah ada di snapshot
+        {'seq': 3, 'op': 'update', 'song': make_song(2, 'Deux')},
+        {'seq': 4, 'op': 'batch', 'songs': [make_song(3, 'Trois')], 'deleted': []},
+        {'seq': 5, 'op': 'add', 'song': make_song(4, 'Four')},
+        {'seq': 6, 'op': 'delete', 'id': 4},
+    ])
+    journal, songs = recover(music, journal_paths)
+    assert [(s['id'], s['title']) for s in songs] == [(1, 'One'), (2, 'Deux'), (3, 'Trois')]
+    assert journal.seq == 6
+
+
+def test_torn_tail_is_truncated(music, journal_paths):
+    _, journal_file = journal_paths
+    write_records(journal_file, [{'seq': 1, 'op': 'add', 'song': make_song(1, 'One')}])
+    with open(journal_file, 'ab') as f:
+        f.write(b'{"seq": 2, "op": "add", "so')
+    journal, songs = recover(music, journal_paths)
+    assert [s['id'] for s in songs] == [1] and journal.seq == 1
+    with open(journal_file, 'rb') as f:
+        assert f.read().endswith(b'}\n')
+
+
+def test_appends_survive_restart(music, journal_paths):
+    journal = music.CatalogJournal(*journal_paths)
+    journal.open()
+    journal.append('add', song=make_song(1, 'One'))
+    seq = journal.append('batch', weight=2, songs=[make_song(2, 'Two'), make_song(3, 'Three')], deleted=[1])
+    journal.wait_durable(seq)
+    journal.close()
+    _, songs = recover(music, journal_paths)
+    assert [s['id'] for s in songs] == [2, 3]
+
+
+def test_leftover_rotated_journal_is_folded_on_startup(music, journal_paths):
+    snapshot, journal_file = journal_paths
+    journal = music.CatalogJournal(*journal_paths)
+    journal.write_snapshot([make_song(1, 'One')], 1)
+    # crash setelah rotasi, sebelum snapshot baru selesai
+    write_records(journal.rotated_file, [{'seq': 2, 'op': 'add', 'song': make_song(2, 'Two')}])
+    write_records(journal_file, [{'seq': 3, 'op': 'add', 'song': make_song(3, 'Three')}])
+    journal, songs = recover(music, journal_paths)
+    assert [s['id'] for s in songs] == [1, 2, 3]
+    assert not os.path.exists(journal.rotated_file)
+    with open(snapshot) as f:
+        assert json.load(f)['seq'] == 3
+    # restart berikutnya melihat katalog yang sama
+    _, again = recover(music, journal_paths)
+    assert again == songs
+
+
+def test_compaction_writes_snapshot(music, library, journal_paths):
+    library([make_song(1, 'One'), make_song(2, 'Two')])
+    journal = music.CatalogJournal(*journal_paths)
+    journal.open()
+    journal.wait_durable(journal.append('add', song=make_song(2, 'Two')))
+    journal.compact()
+    assert not os.path.exists(journal.rotated_file)
+    assert os.path.getsize(journal_paths[1]) == 0
+    journal.wait_durable(journal.append('delete', id=1))
+    journal.close()
+    _, songs = recover(music, journal_paths)
+    assert [s['id'] for s in songs] == [2]
+
+
+def test_failed_compaction_restores_journal_and_retries(music, library, journal_paths, monkeypatch):
+    library([make_song(1, 'One')])
+    journal = music.CatalogJournal(*journal_paths)
+    journal.open()
+    journal.wait_durable(journal.append('add', song=make_song(1, 'One')))
+
+    def disk_full(songs, seq):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(journal, 'write_snapshot', disk_full)
+    journal.compact()
+    assert not os.path.exists(journal.rotated_file)
+    assert journal.records == 1 and journal.retry_at > 0
+    journal.wait_durable(journal.append('add', song=make_song(2, 'Two')))
+    _, songs = recover(music, journal_paths)
+    assert [s['id'] for s in songs] == [1, 2]
+
+    monkeypatch.undo()
+    journal.compact()
+    assert not os.path.exists(journal.rotated_file)
+    assert journal.records == 0
+    journal.close()
+
+
+def test_wait_durable_times_out(music, journal_paths):
+    journal = music.CatalogJournal(*journal_paths)
+    journal.file = open(journal_paths[1], 'ab')   # tanpa thread flusher
+    seq = journal.append('add', song=make_song(1, 'One'))
+    with pytest.raises(music.JournalTimeout):
+        journal.wait_durable(seq, timeout=0.05)
+    journal.file.close()
+
+
+def test_journal_timeout_is_reported_to_the_client(client, login, music, monkeypatch):
+    login('admin')
+
+    def slow_disk(seq, timeout=None):
+        raise music.JournalTimeout('not on disk yet')
+
+    monkeypatch.setattr(music.catalog_journal, 'wait_durable', slow_disk)
+    response = client.delete('/api/songs/2')
+    assert response.status_code == 503
+    response = client.post('/api/songs', data={'title': 'New', 'artist': 'Someone'})
+    assert response.status_code == 503
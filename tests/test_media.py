@@ -0,0 +1,98 @@
+import os
+
+import pytest
+from werkzeug.wsgi import FileWrapper
+
+
+class SendfileWrapper(FileWrapper):
+    """Stands in for a server's wsgi.file_wrapper (gunicorn, uWSGI)"""
+
+
+@pytest.fixture
+def audio_file(music):
+    data = bytes(range(256)) * 40
+    filename = 'range_test.mp3'
+    with open(os.path.join(music.AUDIO_FOLDER, filename), 'wb') as f:
+        f.write(data)
+    music.audio_stat_cache.invalidate(filename)
+    yield filename, data
+    os.remove(os.path.join(music.AUDIO_FOLDER, filename))
+    music.audio_stat_cache.invalidate(filename)
+
+
+def serve(music, filename, headers):
+    environ = {'wsgi.file_wrapper': SendfileWrapper}
+    with music.app.test_request_context(f'/uploads/audio/{filename}', headers=headers, environ_overrides=environ):
+        return music.serve_audio(filename)
+
+
+def body(response):
+    try:
+        return b''.join(response.iter_encoded())
+    finally:
+        response.close()
+
+
+@pytest.mark.parametrize('header, start', [(None, 0), ('bytes=0-', 0), ('bytes=4000-', 4000)])
+def test_open_ended_ranges_use_file_wrapper(music, audio_file, header, start):
+    filename, data = audio_file
+    response = serve(music, filename, {'Range': header} if header else {})
+    assert isinstance(response.response, SendfileWrapper)
+    assert response.content_length == len(data) - start
+    if header:
+        assert response.status_code == 206
+        assert response.headers['Content-Range'] == f'bytes {start}-{len(data) - 1}/{len(data)}'
+    assert body(response) == data[start:]
+
+
+def test_bounded_range(music, audio_file):
+    filename, data = audio_file
+    response = serve(music, filename, {'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.content_length == 100
+    assert body(response) == data[100:200]
+
+
+def test_unsatisfiable_range(client, audio_file):
+    filename, data = audio_file
+    response = client.get(f'/uploads/audio/{filename}', headers={'Range': f'bytes={len(data) + 10}-'})
+    assert response.status_code == 416
+
+
+def test_etag_and_if_range(client, audio_file):
+    filename, data = audio_file
+    first = client.get(f'/uploads/audio/{filename}')
+    etag = first.headers['ETag']
+    assert first.headers['Accept-Ranges'] == 'bytes'
+    assert client.get(f'/uploads/audio/{filename}', headers={'If-None-Match': etag}).status_code == 304
+    response = client.get(f'/uploads/audio/{filename}', headers={'Range': 'bytes=10-', 'If-Range': etag})
+    assert response.status_code == 206 and response.data == data[10:]
+    # If-Range yang basi: kirim file utuh
+    response = client.get(f'/uploads/audio/{filename}', headers={'Range': 'bytes=10-', 'If-Range': '"stale"'})
+    assert response.status_code == 200 and response.data == data
+
+
+def test_content_addressed_cover_is_immutable(client, music):
+    filename = 'ab' * 32 + '.png'
+    path = os.path.join(music.COVER_FOLDER, filename)
+    with open(path, 'wb') as f:
+        f.write(b'not really a png')
+    try:
+        response = client.get(f'/uploads/covers/{filename}')
+        assert response.status_code == 200
+        assert response.cache_control.immutable
+        assert response.cache_control.max_age == music.UPLOAD_CACHE_MAX_AGE
+    finally:
+        os.remove(path)
+
+
+def test_legacy_cover_name_is_revalidated(client, music):
+    path = os.path.join(music.COVER_FOLDER, 'legacy.png')
+    with open(path, 'wb') as f:
+        f.write(b'old upload')
+    try:
+        response = client.get('/uploads/covers/legacy.png')
+        assert response.status_code == 200
+        assert not response.cache_control.immutable
+    finally:
+        os.remove(path)
@@ -0,0 +1,74 @@
+import re
+import threading
+from collections import defaultdict
+
+SAMPLE = re.compile(r'^(\w+?)(_bucket|_sum|_count)?(\{.*\})? (\S+)$')
+
+
+def scrape(client):
+    """{name: {labels without le: [(suffix, le, value)]}} and the # TYPE lines"""
+    samples = defaultdict(lambda: defaultdict(list))
+    types = []
+    for line in client.get('/metrics').get_data(as_text=True).splitlines():
+        if line.startswith('# TYPE'):
+            types.append(line.split()[2])
+            continue
+        if line.startswith('#'):
+            continue
+        name, suffix, labels, value = SAMPLE.match(line).groups()
+        le = re.search(r'le="([^"]+)"', labels or '')
+        rest = re.sub(r',?le="[^"]+"', '', labels or '')
+        samples[name][rest].append((suffix, le and le.group(1), float(value)))
+    return samples, types
+
+
+def test_histogram_buckets_are_cumulative_and_end_at_count(client, login):
+    login()
+    for path in ('/api/songs', '/api/songs/1', '/api/songs/999', '/api/search?q=sample'):
+        client.get(path)
+    samples, types = scrape(client)
+    assert len(types) == len(set(types))
+    series = samples['musicapp_request_duration_seconds']
+    assert series
+    for labels, values in series.items():
+        buckets = [v for suffix, le, v in values if suffix == '_bucket']
+        count = next(v for suffix, _, v in values if suffix == '_count')
+        assert buckets == sorted(buckets) and buckets[-1] == count, labels
+        assert [le for suffix, le, _ in values if suffix == '_bucket'][-1] == '+Inf'
+
+
+def test_in_flight_returns_to_zero_after_errors(client, music, monkeypatch):
+    def broken():
+        raise RuntimeError('boom')
+    monkeypatch.setitem(music.app.view_functions, 'get_metrics', broken)
+    client.application.testing = False
+    try:
+        assert client.get('/metrics').status_code == 500
+    finally:
+        client.application.testing = True
+    client.get('/api/songs/999')
+    assert music.metrics.values[('musicapp_requests_in_flight', ())] == 0
+    assert music.metrics.values[('musicapp_exceptions_total', (('endpoint', 'get_metrics'), ('type', 'RuntimeError')))] >= 1
+
+
+def test_set_and_render_from_several_threads(music):
+    metrics = music.Metrics()
+    errors = []
+
+    def gauges(n):
+        for i in range(500):
+            metrics.set('musicapp_test_gauge', i, worker=f'{n}-{i}')
+
+    def render():
+        try:
+            for _ in range(50):
+                metrics.render()
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=gauges, args=(n,)) for n in range(3)] + [threading.Thread(target=render)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == [] and metrics.render().count('musicapp_test_gauge{') == 1500
@@ -0,0 +1,200 @@
+import random
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def store(music, tmp_path):
+    """A user state store on its own database, with put_rows calls recorded"""
+    def make():
+        backend = music.SQLiteStateBackend(str(tmp_path / 'state.db'))
+        writes = []
+        put_rows = backend.put_rows
+
+        def recording_put_rows(key, rows, deleted=()):
+            writes.append((dict(rows), list(deleted)))
+            return put_rows(key, rows, deleted)
+
+        backend.put_rows = recording_put_rows
+        return music.UserStateStore(backend), writes
+    return make
+
+
+def test_linked_list_operations_track_changed_links(music):
+    playlist = music.Playlist()
+    playlist.add_songs([1, 2, 3, 4])
+    assert playlist.take_changes() == ({1: [None, 2], 2: [1, 3], 3: [2, 4], 4: [3, None]}, [])
+
+    assert playlist.move_song(4, 1)
+    assert playlist.song_ids() == [1, 4, 2, 3]
+    assert playlist.take_changes() == ({1: [None, 4], 4: [1, 2], 2: [4, 3], 3: [2, None]}, [])
+
+    assert playlist.remove_song(2)
+    assert playlist.take_changes() == ({4: [1, 3], 3: [4, None]}, [2])
+
+    assert playlist.move_to(1, 5) and playlist.song_ids() == [4, 3, 1]
+    assert playlist.preceding(1, 5) == [3, 4] and playlist.next_song_id(4) == 3
+    assert not playlist.move_song(9) and not playlist.move_song(4, 9)
+    assert not playlist.reorder([1, 3]) and playlist.reorder([1, 3, 4])
+    assert playlist.song_ids() == [1, 3, 4] and playlist.song_ids(1, 1) == [3]
+
+
+def test_from_links_rebuilds_order_and_repairs_broken_chains(music):
+    playlist = music.Playlist()
+    playlist.add_songs([5, 3, 9])
+    links, _ = playlist.take_changes()
+    rebuilt = music.Playlist.from_links(links)
+    assert rebuilt.song_ids() == [5, 3, 9] and not rebuilt.dirty
+
+    broken = music.Playlist.from_links({5: [None, 3], 3: [5, 5], 9: [3, None]})
+    assert broken.song_ids() == [5, 3, 9] and broken.dirty   # ditulis ulang pada edit berikutnya
+
+
+def test_edits_write_only_the_changed_rows(music, store):
+    users, writes = store()
+    with users.edit('playlists', 'alice') as playlists:
+        playlists['road'] = music.Playlist()
+        playlists['road'].add_songs(range(1, 101))
+    assert len(writes[-1][0]) == 101   # baris nama + 100 lagu
+
+    with users.edit('playlists', 'alice') as playlists:
+        playlists['road'].add_song(101)
+    assert writes[-1] == ({'["road",100]': [99, 101], '["road",101]': [100, None]}, [])
+
+    with users.edit('playlists', 'alice') as playlists:
+        playlists['road'].move_song(50, 10)
+    assert sorted(writes[-1][0]) == ['["road",10]', '["road",11]', '["road",49]', '["road",50]', '["road",51]']
+
+    with users.edit('playlists', 'alice') as playlists:
+        playlists['road'].remove_song(1)
+    assert writes[-1] == ({'["road",2]': [None, 3]}, ['["road",1]'])
+
+    with users.edit('favorites', 'alice') as favorites:
+        favorites.add_songs([7, 8])
+    with users.edit('favorites', 'alice') as favorites:
+        favorites.remove_song(8)
+    assert writes[-1] == ({'[7]': [None, None]}, ['[8]'])
+
+    count = len(writes)
+    with users.edit('playlists', 'alice') as playlists:
+        playlists['road'].add_song(2)   # sudah ada: tidak ada yang ditulis
+    assert len(writes) == count
+
+
+def test_other_worker_reads_rows_in_order(music, store):
+    users, _ = store()
+    with users.edit('playlists', 'bob') as playlists:
+        for name in ('zeta', 'alpha'):
+            playlists[name] = music.Playlist()
+        playlists['zeta'].add_songs([3, 1, 2])
+    with users.edit('playlists', 'bob') as playlists:
+        playlists['zeta'].move_song(2)
+        del playlists['alpha']
+        playlists['beta'] = music.Playlist()
+        playlists['beta'].add_song(4)
+
+    other, _ = store()
+    playlists = other.load('playlists', 'bob')
+    assert list(playlists) == ['zeta', 'beta']
+    assert playlists['zeta'].song_ids() == [2, 3, 1] and playlists['beta'].song_ids() == [4]
+    rows = other.backend.get_rows('playlists:bob')[1]
+    assert not any(field.startswith('["alpha"') for field in rows)
+
+    with users.edit('playlists', 'bob') as playlists:
+        playlists['zeta'].remove_song(3)
+    assert other.load('playlists', 'bob')['zeta'].song_ids() == [2, 1]
+
+
+def test_readers_keep_a_stable_dict_while_playlists_change(music, store):
+    users, _ = store()
+    with users.edit('playlists', 'carol') as playlists:
+        playlists['a'] = music.Playlist()
+    before = users.load('playlists', 'carol')
+    with users.edit('playlists', 'carol') as playlists:
+        playlists['b'] = music.Playlist()
+    assert list(before) == ['a'] and list(users.load('playlists', 'carol')) == ['a', 'b']
+
+
+def test_legacy_blob_is_migrated_to_rows(music, store):
+    users, writes = store()
+    with users.backend.lock('playlists:dave'):
+        users.backend.put('playlists:dave', {'mix': [{'id': 1}, 2]})
+    with users.backend.lock('favorites:dave'):
+        users.backend.put('favorites:dave', [5, 6])
+    assert users.load('playlists', 'dave')['mix'].song_ids() == [1, 2]
+
+    with users.edit('favorites', 'dave') as favorites:
+        favorites.remove_song(5)
+        favorites.remove_song(6)
+    with users.edit('playlists', 'dave') as playlists:
+        playlists['mix'].add_song(3)
+    assert users.backend.get('playlists:dave')[1] is None
+
+    other, _ = store()
+    assert other.load('playlists', 'dave')['mix'].song_ids() == [1, 2, 3]
+    assert other.load('favorites', 'dave').song_ids() == []
+
+
+def test_failed_edit_is_not_cached(music, store):
+    users, _ = store()
+    with users.edit('favorites', 'erin') as favorites:
+        favorites.add_song(1)
+    with pytest.raises(RuntimeError):
+        with users.edit('favorites', 'erin') as favorites:
+            favorites.add_song(2)
+            raise RuntimeError('boom')
+    assert users.load('favorites', 'erin').song_ids() == [1]
+
+
+def test_playlist_routes_reject_bool_ids(client, login):
+    login()
+    client.post('/api/playlists', json={'name': 'mix'})
+    client.post('/api/playlists/mix/songs', json={'song_ids': [1, True, 2]})
+    assert [s['id'] for s in client.get('/api/playlists/mix/songs').get_json()['songs']] == [1, 2]
+    assert client.post('/api/playlists/mix/songs/2/move', json={'after': True}).status_code == 400
+    assert client.post('/api/playlists/mix/songs/2/move', json={'position': False}).status_code == 400
+    assert client.put('/api/playlists/mix/songs', json={'song_ids': [True, 2]}).status_code == 400
+    assert client.post('/api/playlists/mix/songs/2/move', json={'after': None}).status_code == 200
+    assert [s['id'] for s in client.get('/api/playlists/mix/songs').get_json()['songs']] == [2, 1]
+
+
+def test_loaded_state_is_a_snapshot_edits_do_not_touch(music, store):
+    users, _ = store()
+    with users.edit('playlists', 'frank') as playlists:
+        playlists['mix'] = music.Playlist()
+        playlists['mix'].add_songs([1, 2, 3])
+    with users.edit('favorites', 'frank') as favorites:
+        favorites.add_songs([4, 5])
+    playlists, favorites = users.load('playlists', 'frank'), users.load('favorites', 'frank')
+    assert users.load('playlists', 'frank') is playlists   # disalin sekali per versi
+
+    with users.edit('playlists', 'frank') as edited:
+        edited['mix'].move_song(3)
+        edited['mix'].remove_song(1)
+    with users.edit('favorites', 'frank') as edited:
+        edited.remove_song(4)
+    assert playlists['mix'].song_ids() == [1, 2, 3] and favorites.song_ids() == [4, 5]
+    assert users.load('playlists', 'frank')['mix'].song_ids() == [3, 2]
+    assert users.load('favorites', 'frank').song_ids() == [5]
+
+
+def test_readers_never_see_a_half_relinked_playlist(music, store):
+    users, _ = store()
+    with users.edit('playlists', 'gina') as playlists:
+        playlists['mix'] = music.Playlist()
+        playlists['mix'].add_songs(range(200))
+    done = threading.Event()
+
+    def shuffle():
+        rng = random.Random(5)
+        for _ in range(200):
+            with users.edit('playlists', 'gina') as playlists:
+                playlists['mix'].move_song(rng.randrange(200), rng.choice([None, rng.randrange(200)]))
+        done.set()
+
+    thread = threading.Thread(target=shuffle)
+    thread.start()
+    while not done.is_set():
+        assert sorted(users.load('playlists', 'gina')['mix'].song_ids()) == list(range(200))
+    thread.join()
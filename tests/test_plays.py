@@ -0,0 +1,45 @@
+import threading
+
+
+def test_playlist_count_reads_name_rows_only(music, tmp_path, monkeypatch):
+    store = music.UserStateStore(music.SQLiteStateBackend(str(tmp_path / 'state.db')))
+    for username, names in (('ana', ['a', 'b']), ('bob', ['c'])):
+        with store.edit('playlists', username) as playlists:
+            for name in names:
+                playlists[name] = music.Playlist()
+                playlists[name].add_songs([1, 2, 3])
+    with store.backend.lock('playlists:old'):
+        store.backend.put('playlists:old', {'x': [1], 'y': []})   # blob format lama
+
+    monkeypatch.setattr(music.PlaylistsRows, 'decode', None)
+    assert store.count_playlists() == 5
+
+
+def test_stats_route_counts_playlists(client, login, music):
+    login('admin')
+    before = client.get('/api/stats').get_json()['total_playlists']
+    login()
+    client.post('/api/playlists', json={'name': 'one'})
+    client.post('/api/playlists', json={'name': 'two'})
+    client.post('/api/playlists/one/songs', json={'song_ids': [1, 2]})
+    login('admin')
+    assert client.get('/api/stats').get_json()['total_playlists'] == before + 2
+
+
+def test_plays_are_applied_in_the_background(client, login, music, monkeypatch):
+    login()
+    before = music.play_log.refresh().total
+    refresh = music.play_log.refresh
+    in_request = []
+
+    def tracked():
+        if threading.current_thread() is threading.main_thread():
+            in_request.append(True)
+        return refresh()
+
+    monkeypatch.setattr(music.play_log, 'refresh', tracked)
+    assert client.post('/api/history/1').status_code == 200
+    assert in_request == []
+    monkeypatch.undo()
+    assert music.play_log.refresh().total == before + 1
+    music.play_log.checkpoint()   # bukan saat atexit, ketika cwd sudah dikembalikan pytest
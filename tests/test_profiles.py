@@ -0,0 +1,55 @@
+import pytest
+
+
+@pytest.fixture
+def worker(music, tmp_path):
+    """A profiler with its own event hub on a shared state database, like one gunicorn worker"""
+    def make():
+        backend = music.SQLiteStateBackend(str(tmp_path / 'state.db'))
+        hub = music.EventHub()
+        hub.relay = backend
+        hub.poll_relay()
+        return music.RequestProfiler(str(tmp_path / 'profiles'), backend, hub), hub
+    return make
+
+
+def test_config_is_cached_until_another_worker_changes_it(music, worker, monkeypatch):
+    profiler, hub = worker()
+    other, _ = worker()
+    assert profiler.get_config()['slow_ms'] == 0   # request lambat tidak diprofil kecuali diaktifkan
+
+    reads = []
+    get = profiler.backend.get
+    monkeypatch.setattr(profiler.backend, 'get', lambda key: reads.append(key) or get(key))
+    for _ in range(3):
+        profiler.get_config()
+    assert reads == []
+
+    other.set_config({'slow_ms': 250})
+    assert profiler.get_config()['slow_ms'] == 0
+    hub.poll_relay()
+    assert profiler.get_config()['slow_ms'] == 250 and reads == ['profiler:config']
+    assert not hub.events   # event internal tidak dikirim ke stream SSE
+
+
+def test_concurrent_cprofile_falls_back_to_the_sampler(music, worker, monkeypatch):
+    monkeypatch.setattr(music, 'PROFILE_CPROFILE_EXCLUSIVE', True)
+    profiler, _ = worker()
+    profiler.set_config({'endpoints': ['get_metrics']})
+    with music.app.test_request_context('/metrics'):
+        first = profiler.begin('get_metrics')
+        second = profiler.begin('get_metrics')
+        assert first['profile'] is not None and second['profile'] is None
+        profiler.end(second, 200)
+        profiler.end(first, 200)
+        third = profiler.begin('get_metrics')
+        assert third['profile'] is not None
+        profiler.end(third, 200)
+    assert sorted(p['kind'] for p in profiler.list()) == ['cprofile', 'cprofile', 'sampler']
+
+
+def test_config_route_validates_the_body(client, login):
+    login('admin')
+    assert client.put('/api/admin/profiles/config', json=['slow_ms']).status_code == 400
+    assert client.put('/api/admin/profiles/config', json={'mode': 'gprof'}).status_code == 400
+    assert client.get('/api/admin/profiles').get_json()['config']['slow_ms'] == 0
@@ -0,0 +1,176 @@
+import random
+
+import pytest
+
+from conftest import make_song
+
+
+@pytest.fixture
+def store(music, tmp_path):
+    """A user state store on its own database, with put_rows calls recorded"""
+    def make():
+        backend = music.SQLiteStateBackend(str(tmp_path / 'state.db'))
+        writes = []
+        put_rows = backend.put_rows
+
+        def recording_put_rows(key, rows, deleted=()):
+            writes.append((dict(rows), list(deleted)))
+            return put_rows(key, rows, deleted)
+
+        backend.put_rows = recording_put_rows
+        return music.UserStateStore(backend), writes
+    return make
+
+
+def songs(queue):
+    return [queue.entries[entry_id] for entry_id in queue.entry_ids()]
+
+
+def test_queue_operations_match_a_plain_list(music):
+    rng = random.Random(3)
+    queue = music.SongQueue()
+    model = []   # (entry_id, song_id)
+    for step in range(2000):
+        op = rng.random()
+        if op < 0.35 or not model:
+            song_id = rng.randint(1, 50)
+            play_next = rng.random() < 0.2
+            entry_id = queue.enqueue(song_id, play_next=play_next)
+            model.insert(0 if play_next else len(model), (entry_id, song_id))
+        elif op < 0.7:
+            entry_id, song_id = rng.choice(model)
+            position = rng.randint(-1, len(model) + 1)
+            assert queue.move(entry_id, position)
+            model.remove((entry_id, song_id))
+            model.insert(max(0, min(position, len(model))), (entry_id, song_id))
+        elif op < 0.85:
+            entry_id, song_id = rng.choice(model)
+            assert queue.remove_entry(entry_id)
+            model.remove((entry_id, song_id))
+        else:
+            entry_id = queue.entry_ids()[0]
+            assert queue.remove_entry(entry_id) and model.pop(0)[0] == entry_id
+        assert queue.entry_ids() == [entry_id for entry_id, _ in model], step
+    assert not queue.move(10 ** 6, 0) and not queue.remove_entry(10 ** 6)
+
+
+def test_dequeue_skips_deleted_songs_and_sets_current(music, library):
+    queue = music.SongQueue()
+    queue.enqueue_many([1, 2, 3])
+    queue.enqueue(9, play_next=True)
+    library([make_song(2, 'Two'), make_song(3, 'Three')])
+    assert queue.dequeue()['id'] == 2 and queue.current[1] == 2
+    assert songs(queue) == [3]
+    assert queue.peek()['id'] == 3
+
+
+def test_play_next_keeps_bulk_order_and_shuffle_keeps_entries(music):
+    queue = music.SongQueue()
+    queue.enqueue_many([1, 2])
+    entry_ids = queue.enqueue_many([7, 8, 9], play_next=True)
+    assert songs(queue) == [7, 8, 9, 1, 2] and entry_ids == [3, 4, 5]
+    queue.shuffle(random.Random(1))
+    assert sorted(songs(queue)) == [1, 2, 7, 8, 9]
+    assert queue.remove_song(7) == 1 and 7 not in songs(queue)
+
+
+def test_move_renumbers_when_the_gap_is_used_up(music):
+    queue = music.SongQueue()
+    queue.enqueue_many([1, 2, 3])
+    first, last = queue.entry_ids()[0], queue.entry_ids()[-1]
+    for _ in range(40):   # selalu ke antara dua entry pertama
+        queue.move(last, 1)
+        last = queue.entry_ids()[-1]
+    assert len(set(queue.positions.values())) == 3 and queue.entry_ids()[0] == first
+    assert sorted(queue.order) == queue.order
+
+
+def test_queue_edits_write_only_the_changed_rows(store):
+    users, writes = store()
+    with users.edit('queue', 'alice') as queue:
+        queue.enqueue_many(range(1, 101))
+    assert len(writes[-1][0]) == 101   # 100 entry + meta
+
+    with users.edit('queue', 'alice') as queue:
+        queue.enqueue(101)
+    assert sorted(writes[-1][0]) == ['["meta"]', '[101]'] and writes[-1][1] == []
+
+    with users.edit('queue', 'alice') as queue:
+        queue.move(100, 50)
+    assert list(writes[-1][0]) == ['[100]'] and writes[-1][1] == []
+
+    with users.edit('queue', 'alice') as queue:
+        queue.remove_entry(7)
+    assert writes[-1] == ({}, ['[7]'])
+
+    with users.edit('queue', 'alice') as queue:
+        queue.move(3, 0)
+        queue.move(5, 10 ** 6)
+    assert sorted(writes[-1][0]) == ['[3]', '[5]']
+
+
+def test_other_worker_reads_queue_rows_in_order(music, store, library):
+    users, _ = store()
+    with users.edit('queue', 'bob') as queue:
+        queue.enqueue_many([1, 2, 1])
+        queue.enqueue(2, play_next=True)
+    with users.edit('queue', 'bob') as queue:
+        queue.move(1, 2)
+        queue.dequeue()
+
+    other, _ = store()
+    queue = other.load('queue', 'bob')
+    assert songs(queue) == [2, 1, 1] and queue.entry_ids() == [2, 1, 3]
+    assert queue.current == (4, 2) and queue.next_entry_id == 5
+    with other.edit('queue', 'bob') as queue:
+        assert queue.enqueue(1) == 5
+    assert users.load('queue', 'bob').entry_ids() == [2, 1, 3, 5]
+
+
+def test_legacy_queue_blob_is_migrated_to_rows(music, store):
+    users, _ = store()
+    with users.backend.lock('queue:carol'):
+        users.backend.put('queue:carol', {'next_entry_id': 8, 'entries': [[5, 2], [3, 1]], 'current': [2, 1]})
+    assert users.load('queue', 'carol').entry_ids() == [5, 3]
+    with users.edit('queue', 'carol') as queue:
+        queue.remove_entry(5)
+        queue.remove_entry(3)
+    other, _ = store()
+    queue = other.load('queue', 'carol')
+    assert len(queue) == 0 and queue.next_entry_id == 8 and queue.current == (2, 1)
+
+
+def test_queue_routes_reject_bool_positions(client, login, music):
+    username = login()
+    client.post('/api/queue/1')
+    entry_id = client.post('/api/queue/2', json={'position': True}).get_json()['entry_id']
+    assert [s['id'] for s in client.get('/api/queue').get_json()['queue']] == [1, 2]
+    response = client.post(f'/api/queue/entries/{entry_id}/move', json={'position': False})
+    assert response.status_code == 400
+    assert client.post(f'/api/queue/entries/{entry_id}/move', json={'position': 0}).status_code == 200
+    client.post('/api/queue/bulk', json={'song_ids': [True, 1]})
+    assert [s['id'] for s in client.get('/api/queue').get_json()['queue']] == [2, 1, 1]
+    assert client.post('/api/queue/next').get_json()['song']['id'] == 2
+    assert music.user_state.load('queue', username).current == (entry_id, 2)
+
+
+def test_queue_routes_reject_non_object_bodies(client, login):
+    login()
+    entry_id = client.post('/api/queue/1').get_json()['entry_id']
+    assert client.post('/api/queue/2', json=[1]).status_code == 400
+    assert client.post('/api/queue/bulk', json=['song_ids']).status_code == 400
+    assert client.post(f'/api/queue/entries/{entry_id}/move', json=[0]).status_code == 400
+    assert [s['id'] for s in client.get('/api/queue').get_json()['queue']] == [1]
+
+
+def test_loaded_queue_is_a_snapshot_edits_do_not_touch(music, store, library):
+    library([make_song(i, f'Song {i}') for i in (1, 2, 3)])
+    users, _ = store()
+    with users.edit('queue', 'hana') as queue:
+        queue.enqueue_many([1, 2, 3])
+    before = users.load('queue', 'hana')
+    with users.edit('queue', 'hana') as queue:
+        queue.move(3, 0)
+        queue.dequeue()
+    assert songs(before) == [1, 2, 3] and before.current is None
+    assert songs(users.load('queue', 'hana')) == [1, 2]
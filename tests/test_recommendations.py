@@ -0,0 +1,63 @@
+import pytest
+
+from conftest import make_song
+
+pytest.importorskip('scipy')
+
+
+@pytest.fixture
+def engine(music, library, monkeypatch):
+    """A fresh content engine; build jobs are recorded instead of run"""
+    library([make_song(1, 'Blue Night', 'Ann', genre='Jazz'),
+             make_song(2, 'Red Morning', 'Bob', genre='Rock'),
+             make_song(3, 'Blue Night Live', 'Ann', genre='Jazz'),
+             make_song(4, 'Green Day', 'Cid', genre='Jazz', duration=600)])
+    engine = music.ContentSimilarity()
+    monkeypatch.setattr(music, 'content_engine', engine)
+    submitted = []
+    monkeypatch.setattr(music.job_queue, 'submit', lambda kind, payload, key=None: submitted.append((kind, key)))
+    engine.submitted = submitted
+    return engine
+
+
+def progress(done, total, message=None):
+    pass
+
+
+def test_genre_fallback_until_the_build_job_ran(client, music, engine):
+    response = client.get('/api/recommendations/4?engine=content')
+    assert [s['id'] for s in response.get_json()['recommendations']] == [1, 3]
+    client.get('/api/recommendations/1?engine=content')
+    assert engine.submitted == [('content_build', 'content_build')] and engine.matrix is None
+
+    assert music.run_content_build({}, progress)['rebuilt']
+    response = client.get('/api/recommendations/4?engine=content')
+    assert [s['id'] for s in response.get_json()['recommendations']] == engine.similar(4, 13)[:3]
+    assert not music.run_content_build({}, progress)['rebuilt']
+
+    music.song_catalog.add(make_song(5, 'Blue Night Again', 'Ann', genre='Jazz'))
+    client.get('/api/recommendations/1?engine=content')   # matriks lama tetap menjawab
+    assert len(engine.submitted) == 2 and 5 not in engine.rows
+
+
+def test_cache_remembers_the_k_it_was_computed_for(music, engine):
+    music.run_content_build({}, progress)
+    assert engine.similar(1, 20)[0] == 3 and engine.cache[1][0] == 20
+    columns, engine.columns = engine.columns, None   # cache hit tidak menyentuh matriks
+    assert engine.similar(1, 10) == engine.cache[1][1] and len(engine.similar(1, 1)) == 1
+    engine.columns = columns
+    engine.similar(1, 30)
+    assert engine.cache[1][0] == 30
+
+
+def test_build_catches_up_with_changes_made_while_building(music, engine, monkeypatch):
+    build = engine.build
+
+    def build_then_add(songs, version):
+        build(songs, version)
+        if music.song_catalog.get(5) is None:
+            music.song_catalog.add(make_song(5, 'Blue Night Again', 'Ann', genre='Jazz'))
+
+    monkeypatch.setattr(engine, 'build', build_then_add)
+    assert music.run_content_build({}, progress)['rebuilt']
+    assert engine.version == music.song_catalog.version and 5 in engine.rows
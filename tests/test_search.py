@@ -0,0 +1,124 @@
+import random
+
+import pytest
+
+from benchmarks.synthetic import WORDS, generate_catalog
+from conftest import make_song
+
+
+def reference_score(song, terms, music):
+    """Skor menurut definisi aslinya, tanpa index"""
+    total = 0
+    for term in terms:
+        best = 0
+        for field, weight in music.SEARCH_FIELDS:
+            text = ' '.join((song.get(field) or '').lower().split())
+            if term not in text:
+                continue
+            words = text.split()
+            if text == term:
+                tier = 4
+            elif term in words:
+                tier = 3
+            elif any(word.startswith(term) for word in words):
+                tier = 2
+            else:
+                tier = 1
+            best = max(best, tier * weight)
+        if not best:
+            return 0
+        total += best
+    return total
+
+
+def brute_force(songs, query, music):
+    terms = list(dict.fromkeys(query.lower().split()))
+    scored = sorted((-reference_score(song, terms, music), song['id']) for song in songs)
+    return [song_id for score, song_id in scored if score]
+
+
+@pytest.fixture
+def index(music):
+    return music.SearchIndex()
+
+
+def test_ranking_tiers_and_field_weights(index):
+    songs = [
+        make_song(1, 'Glove Box', artist='Nobody', genre='Rock'),         # substring di title
+        make_song(2, 'Lovely Day', artist='Nobody', genre='Rock'),        # awal kata di title
+        make_song(3, 'Love Me Do', artist='Nobody', genre='Rock'),        # token di title
+        make_song(4, 'Love', artist='Nobody', genre='Rock'),              # title sama persis
+        make_song(5, 'Other', artist='Love', genre='Rock'),               # artist sama persis
+        make_song(6, 'Other', artist='Nobody', genre='Love'),             # genre sama persis
+        make_song(7, 'Unrelated', artist='Nobody', genre='Rock'),
+    ]
+    for song in songs:
+        index.add_song(song)
+    ids, total, exact = index.search('love')
+    assert ids == [4, 3, 5, 2, 1, 6]
+    assert (total, exact) == (6, True)
+
+
+def test_every_term_must_match_and_ties_follow_id(index):
+    for song_id in (9, 3, 5):
+        index.add_song(make_song(song_id, f'Night Drive {song_id}'))
+    index.add_song(make_song(4, 'Night Walk'))
+    assert index.search('night drive')[0] == [3, 5, 9]
+    assert index.search('drive walk') == ([], 0, True)
+
+
+def test_update_and_remove_keep_postings_in_sync(index):
+    index.add_song(make_song(1, 'Blue Moon'))
+    index.add_song(make_song(2, 'Red Sun'))
+    index.add_song(make_song(1, 'Green Moon'))
+    assert index.search('blue')[0] == []
+    assert index.search('green')[0] == [1]
+    index.remove_song(1)
+    assert index.search('moon')[0] == []
+    assert index.search('n')[0] == [2]
+    assert not any(index.postings[tier][0].get('moo') for tier in ('grams', 'prefixes'))
+
+
+def test_matches_brute_force_on_synthetic_catalog(index, music):
+    songs = {song['id']: song for song in generate_catalog(3000, seed=4)}
+    for song in songs.values():
+        index.add_song(song)
+    rng = random.Random(7)
+    for song_id in rng.sample(sorted(songs), 100):
+        song = dict(songs[song_id], title=rng.choice(['Love', 'love song', 'A', 'Night 12']))
+        songs[song_id] = song
+        index.add_song(song)
+    for song_id in rng.sample(sorted(songs), 100):
+        index.remove_song(song_id)
+        del songs[song_id]
+
+    vocabulary = sorted({word for song in songs.values() for word in song['title'].lower().split()} | set(WORDS))
+    for _ in range(150):
+        word = rng.choice(vocabulary)
+        query = rng.choice([word[:rng.randint(1, 3)], word[1:4], f'{word} {rng.choice(vocabulary)[:2]}',
+                            f'{word} {rng.randint(1, 9)}', f'{rng.choice(WORDS)} {word} v'])
+        limit, offset = rng.choice([(50, 0), (10, 20), (5, 200)])
+        expected = brute_force(songs.values(), query, music)
+        ids, total, exact = index.search(query, limit=limit, offset=offset)
+        assert ids == expected[offset:offset + limit], query
+        if exact:
+            assert total == len(expected), query
+
+
+def test_short_query_stops_early_with_estimated_total(index, music):
+    for song in generate_catalog(5000, seed=1):
+        index.add_song(song)
+    ids, total, exact = index.search('e', limit=20)
+    assert len(ids) == 20
+    assert not exact
+    assert total >= 20
+    assert ids == brute_force(generate_catalog(5000, seed=1), 'e', music)[:20]
+
+
+def test_search_endpoint(client, library):
+    library([make_song(1, 'Love Story'), make_song(2, 'Lovers'), make_song(3, 'Other')])
+    data = client.get('/api/search?q=love').get_json()
+    assert [song['id'] for song in data['results']] == [1, 2]
+    assert data['total'] == 2 and data['total_exact'] is True
+    data = client.get('/api/search?q=love&limit=1&offset=1').get_json()
+    assert [song['id'] for song in data['results']] == [2]
@@ -0,0 +1,64 @@
+import random
+
+
+def test_add_song_rejects_duplicate(client, login, library, music):
+    login('admin')
+    response = client.post('/api/songs', data={'title': 'Sample Song 1', 'artist': 'Sample Artist'})
+    assert response.status_code == 400
+    assert len(music.song_catalog) == 2
+
+
+def test_add_song_rechecks_duplicate_inside_lock(client, login, music, monkeypatch):
+    """A duplicate added between the early check and catalog_lock is still rejected"""
+    login('admin')
+    calls = []
+    original = music.song_catalog.find_duplicate
+
+    def racy_find_duplicate(*args, **kwargs):
+        calls.append(args)
+        # check pertama (di luar lock) belum melihat lagu dari request lain
+        return None if len(calls) == 1 else original(*args, **kwargs)
+
+    monkeypatch.setattr(music.song_catalog, 'find_duplicate', racy_find_duplicate)
+    response = client.post('/api/songs', data={'title': 'Sample Song 1', 'artist': 'Sample Artist'})
+    assert response.status_code == 400
+    assert len(calls) == 2
+    assert len(music.song_catalog) == 2
+
+
+def test_update_song_rechecks_duplicate_inside_lock(client, login, music, monkeypatch):
+    login('admin')
+    calls = []
+    original = music.song_catalog.find_duplicate
+
+    def racy_find_duplicate(*args, **kwargs):
+        calls.append(args)
+        return None if len(calls) == 1 else original(*args, **kwargs)
+
+    monkeypatch.setattr(music.song_catalog, 'find_duplicate', racy_find_duplicate)
+    response = client.put('/api/songs/2', data={'title': 'Sample Song 1'})
+    assert response.status_code == 400
+    assert music.song_catalog.get(2)['title'] == 'Sample Song 2'
+
+
+def test_add_and_update_song(client, login, music):
+    login('admin')
+    response = client.post('/api/songs', data={'title': 'Fresh', 'artist': 'Someone', 'duration': '90'})
+    assert response.status_code == 200
+    song_id = response.get_json()['song']['id']
+    response = client.put(f'/api/songs/{song_id}', data={'genre': 'Jazz'})
+    assert response.status_code == 200
+    assert music.song_catalog.get(song_id)['genre'] == 'Jazz'
+
+
+def test_positions_follow_removals_without_reindexing(music):
+    catalog = music.SongCatalog()
+    catalog.load([{'id': i, 'title': f'Song {i}', 'artist': 'A'} for i in range(1, 201)])
+    rng = random.Random(7)
+    for _ in range(40):
+        catalog.remove(rng.choice(catalog.songs)['id'])
+    catalog.remove_many([s['id'] for s in rng.sample(catalog.songs, 30)])
+    catalog.add({'id': 500, 'title': 'Late', 'artist': 'A'})
+    assert len(catalog.seqs) == len(catalog.songs) == len(catalog.by_id)
+    assert [catalog.position(s['id']) for s in catalog.songs] == list(range(len(catalog.songs)))
+    assert catalog.position(999) == -1
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from conftest import make_song
+
+LETTERS = 'abcz'
+
+
+@pytest.fixture
+def titles():
+    rng = random.Random(4)
+    return {song_id: ''.join(rng.choice(LETTERS) for _ in range(rng.randint(1, 6))).title()
+            for song_id in range(1, 3001)}
+
+
+def expected(titles, start='', end=None):
+    keys = sorted((title.lower(), song_id) for song_id, title in titles.items())
+    return [song_id for title, song_id in keys if title >= start and (end is None or title < end)]
+
+
+def test_sorted_insertion_splits_chunks(music, titles):
+    index = music.TitleIndex()
+    ids = list(titles)
+    random.Random(5).shuffle(ids)
+    for song_id in ids:
+        index.add_song({'id': song_id, 'title': titles[song_id]})
+    assert len(index) == 3000 and len(index.chunks) > 2
+    assert all(len(chunk) <= music.TITLE_CHUNK_SIZE * 2 for chunk in index.chunks)
+    assert index.maxes == [chunk[-1] for chunk in index.chunks]
+    assert index.page(0, 3000)[0] == expected(titles)
+
+    for song_id in ids[:1000]:
+        index.remove_song(song_id)
+        del titles[song_id]
+    index.add_song({'id': ids[1000], 'title': 'Zz renamed'})
+    titles[ids[1000]] = 'Zz renamed'
+    assert index.page(0, 3000) == (expected(titles), 2000)
+
+
+@pytest.mark.parametrize('prefix', ['a', 'Ab', 'zc', 'q'])
+def test_prefix_pages_match_sorted(music, titles, prefix):
+    index = music.TitleIndex()
+    for song_id, title in titles.items():
+        index.add_song({'id': song_id, 'title': title})
+    want = expected(titles, prefix.lower(), prefix.lower() + music.TITLE_MAX)
+    pages = [index.prefix(prefix, offset, 37) for offset in range(0, len(want) + 37, 37)]
+    assert [song_id for ids, _ in pages for song_id in ids] == want
+    assert all(total == len(want) for _, total in pages)
+
+
+def test_range_pages_match_sorted(music, titles):
+    index = music.TitleIndex()
+    for song_id, title in titles.items():
+        index.add_song({'id': song_id, 'title': title})
+    for start, end in (('b', 'c'), (None, 'ab'), ('z', None), ('c', 'b')):
+        want = expected(titles, start or '', end)
+        got, total = index.range(start, end, 10, 50)
+        assert got == want[10:60] and total == len(want)
+
+
+def test_browse_route_pages_by_title(client, music, library):
+    library([make_song(i, title) for i, title in enumerate(['beta', 'Alpha', 'alpine', 'Gamma', 'al'], 1)])
+    response = client.get('/api/songs/browse?prefix=AL&limit=2&offset=1').get_json()
+    assert [s['title'] for s in response['songs']] == ['Alpha', 'alpine'] and response['total'] == 3
+    response = client.get('/api/songs/browse?start=b&limit=10').get_json()
+    assert [s['title'] for s in response['songs']] == ['beta', 'Gamma']
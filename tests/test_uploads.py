@@ -0,0 +1,58 @@
+import hashlib
+import io
+import os
+import time
+
+AUDIO = b'ID3' + bytes(range(256)) * 64
+
+
+def upload(client, title, data=AUDIO, method='post', url='/api/songs'):
+    form = {'title': title, 'artist': 'Uploader', 'audio_file': (io.BytesIO(data), 'track.mp3')}
+    return getattr(client, method)(url, data=form, content_type='multipart/form-data')
+
+
+def audio_file(music, path):
+    return os.path.join(music.AUDIO_FOLDER, path.rsplit('/', 1)[-1])
+
+
+def wait_removed(path, timeout=5):
+    deadline = time.monotonic() + timeout
+    while os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not os.path.exists(path)
+
+
+def test_identical_uploads_share_one_file_until_the_last_delete(client, login, music):
+    login('admin')
+    first = upload(client, 'Copy A').get_json()['song']
+    second = upload(client, 'Copy B').get_json()['song']
+    path = first['audio_path']
+    assert path == second['audio_path'] == f'/uploads/audio/{hashlib.sha256(AUDIO).hexdigest()}.mp3'
+    assert music.upload_refs.counts[path] == 2
+    with open(audio_file(music, path), 'rb') as f:
+        assert f.read() == AUDIO
+
+    assert client.delete(f'/api/songs/{first["id"]}').status_code == 200
+    assert music.upload_refs.counts[path] == 1 and os.path.exists(audio_file(music, path))
+    assert client.delete(f'/api/songs/{second["id"]}').status_code == 200
+    assert path not in music.upload_refs.counts and wait_removed(audio_file(music, path))
+
+
+def test_replacing_the_audio_releases_the_old_file(client, login, music):
+    login('admin')
+    song = upload(client, 'Replaced', data=AUDIO + b'old').get_json()['song']
+    old = audio_file(music, song['audio_path'])
+    song = upload(client, 'Replaced', data=AUDIO + b'new', method='put', url=f'/api/songs/{song["id"]}').get_json()['song']
+    assert song['audio_path'].endswith(hashlib.sha256(AUDIO + b'new').hexdigest() + '.mp3')
+    assert wait_removed(old) and os.path.exists(audio_file(music, song['audio_path']))
+
+
+def test_oversized_upload_is_rejected_without_leftovers(client, login, music, monkeypatch):
+    login('admin')
+    monkeypatch.setattr(music, 'MAX_AUDIO_SIZE', 4096)
+    songs = len(music.song_catalog)
+    response = upload(client, 'Too Big', data=AUDIO * 2)
+    assert response.status_code == 413 and 'limit' in response.get_json()['error']
+    assert len(music.song_catalog) == songs
+    assert os.listdir(music.UPLOAD_TMP_FOLDER) == []
+    assert not os.path.exists(os.path.join(music.AUDIO_FOLDER, hashlib.sha256(AUDIO * 2).hexdigest() + '.mp3'))
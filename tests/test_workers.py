@@ -0,0 +1,160 @@
+import json
+import os
+
+import pytest
+
+from conftest import make_song
+
+fcntl = pytest.importorskip('fcntl')
+
+
+@pytest.fixture
+def journal_paths(tmp_path):
+    return str(tmp_path / 'catalog.snapshot.json'), str(tmp_path / 'catalog.journal')
+
+
+@pytest.fixture
+def workers(music, journal_paths):
+    """Two journals on the same files, as two worker processes would have"""
+    applied = {}
+    journals = []
+    for name in ('a', 'b'):
+        applied[name] = []
+        journal = music.CatalogJournal(*journal_paths, apply=applied[name].extend)
+        with journal.locked():
+            journal.recover()
+        journal.file = open(journal_paths[1], 'ab')   # tanpa thread flusher
+        journals.append(journal)
+    yield journals, applied
+    for journal in journals:
+        journal.file.close()
+        journal._close_reader()
+
+
+def write(journal, op, **payload):
+    with journal.locked():
+        journal.catch_up(exclusive=True)
+        return journal.append(op, **payload)
+
+
+def recovered_ids(music, paths):
+    journal = music.CatalogJournal(*paths)
+    return sorted(song['id'] for song in journal.recover())
+
+
+def test_workers_share_one_seq_sequence(music, workers, journal_paths):
+    (a, b), applied = workers
+    assert write(a, 'add', song=make_song(1, 'One')) == 1
+    assert write(b, 'add', song=make_song(2, 'Two')) == 2
+    assert [r['seq'] for r in applied['b']] == [1]
+    a.catch_up()
+    assert [r['seq'] for r in applied['a']] == [2]
+    assert recovered_ids(music, journal_paths) == [1, 2]
+
+
+def test_worker_follows_the_journal_across_compaction(music, library, workers, journal_paths):
+    (a, b), applied = workers
+    write(a, 'add', song=make_song(1, 'One'))
+    b.catch_up()
+    write(a, 'add', song=make_song(2, 'Two'))        # belum dibaca b saat compaction
+    library([make_song(1, 'One'), make_song(2, 'Two')])
+    a.compact()
+    assert os.path.getsize(journal_paths[1]) == 0
+    assert write(b, 'delete', id=1) == 3             # ditulis ke journal baru
+    assert [r['seq'] for r in applied['b']] == [1, 2]
+    a.catch_up()
+    assert [r['seq'] for r in applied['a']] == [3]
+    assert recovered_ids(music, journal_paths) == [2]
+
+
+def test_worker_behind_two_compactions_reloads_from_snapshot(music, library, workers, journal_paths):
+    (a, b), applied = workers
+    write(a, 'add', song=make_song(1, 'One'))
+    b.catch_up()
+    songs = [make_song(1, 'One')]
+    for song_id in (2, 3):
+        write(a, 'add', song=make_song(song_id, str(song_id)))
+        songs.append(make_song(song_id, str(song_id)))
+        library(songs)
+        a.compact()
+    write(a, 'add', song=make_song(4, 'Four'))
+    b.catch_up()
+    reload = applied['b'][-1]
+    assert reload['op'] == 'load' and reload['seq'] == 4 == b.seq
+    assert sorted(song['id'] for song in reload['songs']) == [1, 2, 3, 4]
+
+
+def test_torn_write_of_a_crashed_worker_is_cut_before_the_next_append(music, workers, journal_paths):
+    (a, b), applied = workers
+    write(a, 'add', song=make_song(1, 'One'))
+    with open(journal_paths[1], 'ab') as f:
+        f.write(b'{"seq":2,"op":"add","so')          # worker mati di tengah write
+    a.catch_up()                                     # tanpa lock: dibiarkan
+    assert os.path.getsize(journal_paths[1]) > a.read_offset
+    assert write(b, 'add', song=make_song(2, 'Two')) == 2
+    assert recovered_ids(music, journal_paths) == [1, 2]
+
+
+def test_journal_lock_excludes_other_processes(music, journal_paths):
+    journal = music.CatalogJournal(*journal_paths)
+    fd = os.open(journal.lock_file, os.O_RDWR | os.O_CREAT)
+    try:
+        with journal.locked():
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    finally:
+        os.close(fd)
+        if journal.lock_fd is not None:
+            os.close(journal.lock_fd)
+
+
+def test_request_applies_songs_added_by_another_worker(client, login, music):
+    other = music.CatalogJournal(music.SNAPSHOT_FILE, music.JOURNAL_FILE)
+    with music.catalog_lock, other.locked():
+        other.recover()
+        other.file = open(music.JOURNAL_FILE, 'ab')
+        seq = other.append('add', song=make_song(500, 'Remote Song'))
+    other.file.close()
+
+    response = client.get('/api/songs/500')
+    assert response.status_code == 200 and response.get_json()['title'] == 'Remote Song'
+    assert music.catalog_journal.seq == seq
+    assert music.search_index.search('remote')[0] == [500]
+    assert music.event_hub.events[-1][2:] == ('catalog_changed', {'version': seq})
+
+    login('admin')
+    response = client.post('/api/songs', data={'title': 'Local Song', 'artist': 'Someone'})
+    assert response.get_json()['song']['id'] == 501
+    assert music.catalog_journal.seq == seq + 1
+    with open(music.JOURNAL_FILE, 'rb') as f:
+        assert json.loads(f.readlines()[-1])['seq'] == seq + 1
+
+
+def test_catalog_etag_depends_only_on_content(client, library):
+    songs = [make_song(1, 'One'), make_song(2, 'Two')]
+    library(songs)
+    etag = client.get('/api/songs').headers['ETag']
+    library(songs)   # versi di process ini naik, isi sama
+    assert client.get('/api/songs').headers['ETag'] == etag
+    assert client.get('/api/songs', headers={'If-None-Match': etag}).status_code == 304
+    library([make_song(1, 'One'), make_song(2, 'Deux')])
+    assert client.get('/api/songs').headers['ETag'] != etag
+
+
+def test_user_events_are_relayed_to_other_workers(music):
+    hub = music.EventHub()
+    hub.relay = music.user_state.backend
+    hub.poll_relay()
+    other = music.EventHub()
+    other.relay = music.user_state.backend
+    other.publish_user('alice', 'queue_changed', {'n': 1})
+    hub.publish_user('bob', 'favorites_changed')     # event sendiri tidak diterima dua kali
+    hub.poll_relay()
+    assert [event[1:] for event in hub.events] == [
+        ('bob', 'favorites_changed', {}), ('alice', 'queue_changed', {'n': 1})]
+
+
+def test_state_backend_is_abstract(music):
+    with pytest.raises(TypeError):
+        music.StateBackend()